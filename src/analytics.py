@@ -0,0 +1,130 @@
+"""
+Vectorized Tree-Shape Analytics
+Depth histograms, search path lengths, balance factors and black heights
+
+Every function takes a tree (anything with to_arrays()) or the arrays it
+exported; keys are never looked at. The work is done a whole level at a
+time with NumPy gathers, so a profile of a 10^6-node tree costs a few
+dozen array operations instead of a Python call per node. Depths count
+nodes, so the root is at depth 1 and a search for a stored key makes
+depth(key) comparisons.
+
+Example:
+    profile = shape_profile(AVLTree.from_sorted(range(10**6)))
+    profile['avg_path_length'], profile['balance_factors']
+"""
+
+try:
+    import numpy as np
+except ImportError:  # the module needs NumPy; importing it without is allowed
+    np = None
+
+
+def _arrays(tree):
+    if np is None:
+        raise ImportError("shape analytics need NumPy")
+    return tree if isinstance(tree, dict) else tree.to_arrays(keys=False)
+
+
+def levels(tree):
+    """Index arrays of the nodes at depth 1, 2, ... (root level first)"""
+    arrays = _arrays(tree)
+    left, right = arrays['left'], arrays['right']
+    result = []
+    level = np.arange(min(1, len(left)), dtype=np.int64)
+    while len(level):
+        result.append(level)
+        children = np.concatenate((left[level], right[level]))
+        level = children[children >= 0]
+    return result
+
+
+def depths(tree):
+    """Depth of every node (root = 1)"""
+    arrays = _arrays(tree)
+    depth = np.zeros(len(arrays['left']), dtype=np.int64)
+    for d, level in enumerate(levels(arrays), 1):
+        depth[level] = d
+    return depth
+
+
+def depth_histogram(tree):
+    """counts[d] = number of nodes at depth d (counts[0] is always 0)"""
+    return np.bincount(depths(tree))
+
+
+def subtree_heights(tree):
+    """Height of every node's subtree (a leaf is 1), from the cache if the nodes keep one"""
+    arrays = _arrays(tree)
+    if 'height' in arrays:
+        return arrays['height']
+    left, right = arrays['left'], arrays['right']
+    # One spare slot at the end holds the height 0 that index -1 reads
+    height = np.zeros(len(left) + 1, dtype=np.int64)
+    for level in reversed(levels(arrays)):
+        height[level] = 1 + np.maximum(height[left[level]], height[right[level]])
+    return height[:-1]
+
+
+def balance_factors(tree):
+    """Left minus right subtree height at every node"""
+    arrays = _arrays(tree)
+    height = np.append(subtree_heights(arrays), 0)
+    return height[arrays['left']] - height[arrays['right']]
+
+
+def black_heights(tree):
+    """Black nodes on every path from each node down to a NIL leaf, NIL included
+
+    Needs the 'color' array of a Red-Black tree. Black height is the same
+    along every path of a valid tree, so the left spine is enough.
+    """
+    arrays = _arrays(tree)
+    if 'color' not in arrays:
+        raise ValueError("black heights need node colors (a Red-Black tree)")
+    left = arrays['left']
+    black = 1 - arrays['color'].astype(np.int64)
+    bh = np.ones(len(left) + 1, dtype=np.int64)
+    for level in reversed(levels(arrays)):
+        bh[level] = bh[left[level]] + black[level]
+    return bh[:-1]
+
+
+def _counts(values):
+    """{value: count} of an integer array, in value order"""
+    found, counts = np.unique(values, return_counts=True)
+    return dict(zip(found.tolist(), counts.tolist()))
+
+
+def shape_profile(tree):
+    """Shape metrics of a tree as a dict of plain Python numbers and lists
+
+    avg_path_length is the mean comparisons of a successful search (mean
+    depth), avg_miss_path_length that of a search ending at one of the n + 1
+    empty slots, and min_avg_path_length the mean depth of a complete tree
+    of the same size. Red-Black trees add black-height figures.
+    """
+    arrays = _arrays(tree)
+    left, right = arrays['left'], arrays['right']
+    n = len(left)
+    depth = depths(arrays)
+    factors = balance_factors(arrays)
+    empty_slots = (left < 0).astype(np.int64) + (right < 0)
+    complete = np.floor(np.log2(np.arange(1, n + 1))) + 1
+    profile = {
+        'nodes': n,
+        'height': int(depth.max()) if n else 0,
+        'depth_histogram': np.bincount(depth).tolist() if n else [],
+        'avg_path_length': float(depth.mean()) if n else 0.0,
+        'avg_miss_path_length': float(depth @ empty_slots / (n + 1)),
+        'min_avg_path_length': float(complete.mean()) if n else 0.0,
+        'balance_factors': _counts(factors),
+        'max_imbalance': int(np.abs(factors).max()) if n else 0,
+        'leaves': int((empty_slots == 2).sum()),
+    }
+    if 'color' in arrays:
+        bh = black_heights(arrays)
+        profile['black_height'] = int(bh[0])
+        profile['black_heights'] = _counts(bh)
+        profile['red_nodes'] = int(arrays['color'].sum())
+    return profile
@@ -0,0 +1,266 @@
+"""
+Recursive Reference Trees
+The recursive BST, AVL and Red-Black code that trees.py started from
+
+Kept only as the baseline for benchmarks.benchmark_throughput(), so the
+speedup of the iterative rewrite can be measured again on any machine.
+Insert and search are copied unchanged from the original module (its
+Red-Black insert was already a loop; search recursed). Recursion depth
+follows tree height, so these only suit random keys.
+"""
+
+
+class Node:
+    """Node class for all tree types"""
+    def __init__(self, key):
+        self.key = key
+        self.left = None
+        self.right = None
+        self.height = 1  # For AVL trees
+        self.color = 1   # 1=red, 0=black (for Red-Black trees)
+        self.parent = None  # For Red-Black trees
+
+
+
+class RecursiveBST:
+    """Binary Search Tree Implementation (recursive)"""
+    def __init__(self):
+        self.root = None
+    
+    def insert(self, key):
+        """Insert a key into BST"""
+        self.root = self._insert(self.root, key)
+    
+    def _insert(self, node, key):
+        if node is None:
+            return Node(key)
+        if key < node.key:
+            node.left = self._insert(node.left, key)
+        elif key > node.key:
+            node.right = self._insert(node.right, key)
+        return node
+    
+    def search(self, key):
+        """Search for a key in BST"""
+        return self._search(self.root, key)
+    
+    def _search(self, node, key):
+        if node is None or node.key == key:
+            return node
+        if key < node.key:
+            return self._search(node.left, key)
+        return self._search(node.right, key)
+    
+    def get_height(self):
+        """Get height of the tree"""
+        return self._get_height(self.root)
+    
+    def _get_height(self, node):
+        if node is None:
+            return 0
+        return 1 + max(self._get_height(node.left), self._get_height(node.right))
+
+
+
+class RecursiveAVLTree(RecursiveBST):
+    """AVL Tree Implementation (recursive)"""
+    def _get_height(self, node):
+        if node is None:
+            return 0
+        return node.height
+    
+    def _get_balance(self, node):
+        if node is None:
+            return 0
+        return self._get_height(node.left) - self._get_height(node.right)
+    
+    def _update_height(self, node):
+        if node:
+            node.height = 1 + max(self._get_height(node.left), 
+                                self._get_height(node.right))
+    
+    def _rotate_right(self, y):
+        x = y.left
+        T2 = x.right
+        
+        x.right = y
+        y.left = T2
+        
+        self._update_height(y)
+        self._update_height(x)
+        
+        return x
+    
+    def _rotate_left(self, x):
+        y = x.right
+        T2 = y.left
+        
+        y.left = x
+        x.right = T2
+        
+        self._update_height(x)
+        self._update_height(y)
+        
+        return y
+    
+    def insert(self, key):
+        self.root = self._insert(self.root, key)
+    
+    def _insert(self, node, key):
+        if node is None:
+            return Node(key)
+        
+        if key < node.key:
+            node.left = self._insert(node.left, key)
+        elif key > node.key:
+            node.right = self._insert(node.right, key)
+        else:
+            return node  # Duplicates not allowed
+        
+        self._update_height(node)
+        
+        balance = self._get_balance(node)
+        
+        # LL Case
+        if balance > 1 and key < node.left.key:
+            return self._rotate_right(node)
+        
+        # RR Case
+        if balance < -1 and key > node.right.key:
+            return self._rotate_left(node)
+        
+        # LR Case
+        if balance > 1 and key > node.left.key:
+            node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        
+        # RL Case
+        if balance < -1 and key < node.right.key:
+            node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        
+        return node
+
+
+
+class RecursiveRedBlackTree:
+    """Red-Black Tree Implementation (recursive search)"""
+    def __init__(self):
+        self.NIL = Node(0)
+        self.NIL.color = 0  # black
+        self.NIL.left = None
+        self.NIL.right = None
+        self.root = self.NIL
+    
+    def insert(self, key):
+        node = Node(key)
+        node.parent = None
+        node.key = key
+        node.left = self.NIL
+        node.right = self.NIL
+        node.color = 1  # new node is red
+        
+        y = None
+        x = self.root
+        
+        while x != self.NIL:
+            y = x
+            if node.key < x.key:
+                x = x.left
+            else:
+                x = x.right
+        
+        node.parent = y
+        if y is None:
+            self.root = node
+        elif node.key < y.key:
+            y.left = node
+        else:
+            y.right = node
+        
+        if node.parent is None:
+            node.color = 0
+            return
+        
+        if node.parent.parent is None:
+            return
+        
+        self._fix_insert(node)
+    
+    def _fix_insert(self, k):
+        while k.parent and k.parent.color == 1:
+            if k.parent == k.parent.parent.right:
+                u = k.parent.parent.left  # uncle
+                if u.color == 1:
+                    u.color = 0
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    k = k.parent.parent
+                else:
+                    if k == k.parent.left:
+                        k = k.parent
+                        self._rotate_right(k)
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    self._rotate_left(k.parent.parent)
+            else:
+                u = k.parent.parent.right  # uncle
+                if u.color == 1:
+                    u.color = 0
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    k = k.parent.parent
+                else:
+                    if k == k.parent.right:
+                        k = k.parent
+                        self._rotate_left(k)
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    self._rotate_right(k.parent.parent)
+            if k == self.root:
+                break
+        self.root.color = 0
+    
+    def _rotate_left(self, x):
+        y = x.right
+        x.right = y.left
+        if y.left != self.NIL:
+            y.left.parent = x
+        
+        y.parent = x.parent
+        if x.parent is None:
+            self.root = y
+        elif x == x.parent.left:
+            x.parent.left = y
+        else:
+            x.parent.right = y
+        
+        y.left = x
+        x.parent = y
+    
+    def _rotate_right(self, x):
+        y = x.left
+        x.left = y.right
+        if y.right != self.NIL:
+            y.right.parent = x
+        
+        y.parent = x.parent
+        if x.parent is None:
+            self.root = y
+        elif x == x.parent.right:
+            x.parent.right = y
+        else:
+            x.parent.left = y
+        
+        y.right = x
+        x.parent = y
+    
+    def search(self, key):
+        return self._search(self.root, key)
+    
+    def _search(self, node, key):
+        if node == self.NIL or node.key == key:
+            return node
+        if key < node.key:
+            return self._search(node.left, key)
+        return self._search(node.right, key)
@@ -0,0 +1,873 @@
+"""
+Performance Benchmarks for Tree Structures
+Throughput measurements to complement the height experiments
+"""
+
+import asyncio
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from array import array
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from .trees import (BST, AVLTree, RedBlackTree, SplayTree, Treap, SkipList, ArrayBST, FrozenTree,
+                    BTree, BPlusTree, PersistentTree, VersionedTree)
+from .snapshot import MappedTree
+from .baseline import RecursiveBST, RecursiveAVLTree, RecursiveRedBlackTree
+from .concurrency import ConcurrentTree, ShardedTree, run_stress
+from .ingest import KeySource, ingest, build_sorted, write_keys
+from .analytics import shape_profile
+from .instrument import Counters, counting_key_type
+from .server import start_server_process, run_load
+
+
+TREE_TYPES = [('BST', BST), ('AVL', AVLTree), ('Red-Black', RedBlackTree)]
+SELF_ADJUSTING_TYPES = [('Splay', SplayTree), ('Treap', Treap), ('Skip list', SkipList)]
+BTREE_TYPES = [(f'{name}-{order}', lambda cls=cls, order=order: cls(order))
+               for name, cls in (('B-tree', BTree), ('B+tree', BPlusTree))
+               for order in (16, 64, 256)]
+# The recursive code each of TREE_TYPES replaced, for before/after throughput
+RECURSIVE_TYPES = {'BST': RecursiveBST, 'AVL': RecursiveAVLTree, 'Red-Black': RecursiveRedBlackTree}
+
+
+def measure_throughput(tree_class, keys, lookups):
+    """Return (insert ops/sec, search ops/sec) for one tree (class or factory)"""
+    tree = tree_class()
+    start = time.perf_counter()
+    for key in keys:
+        tree.insert(key)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in lookups:
+        tree.search(key)
+    search_time = time.perf_counter() - start
+
+    return len(keys) / insert_time, len(lookups) / search_time
+
+
+def benchmark_throughput(sizes=(10_000, 100_000, 1_000_000), seed=42, baseline=True):
+    """Insert/search throughput with random keys at growing sizes
+
+    With baseline, BST/AVL/Red-Black are also run on the recursive code
+    they replaced (src/baseline.py), and the speedup is shown beside them.
+    """
+    print("Insert/search throughput (random keys)")
+    print(f"{'tree':<12} {'n':>10} {'insert ops/s':>14} {'search ops/s':>14}"
+          + (f" {'recursive insert':>17} {'recursive search':>17}" if baseline else ''))
+    rng = random.Random(seed)
+    results = []
+
+    for size in sizes:
+        keys = rng.sample(range(size * 3), size)
+        lookups = [rng.randrange(size * 3) for _ in range(size)]
+        for name, tree_class in TREE_TYPES + SELF_ADJUSTING_TYPES + BTREE_TYPES:
+            insert_rate, search_rate = measure_throughput(tree_class, keys, lookups)
+            results.append((name, size, insert_rate, search_rate))
+            line = f"{name:<12} {size:>10,} {insert_rate:>14,.0f} {search_rate:>14,.0f}"
+            if baseline and name in RECURSIVE_TYPES:
+                old_insert, old_search = measure_throughput(RECURSIVE_TYPES[name], keys, lookups)
+                results.append((f'{name} (recursive)', size, old_insert, old_search))
+                line += (f" {old_insert:>9,.0f} x{insert_rate / old_insert:<5.2f}"
+                         f" {old_search:>9,.0f} x{search_rate / old_search:<5.2f}")
+            print(line)
+
+    return results
+
+
+def measure_memory(factory, keys):
+    """Bytes allocated per key while building a tree from keys"""
+    tracemalloc.start()
+    try:
+        tree = factory()
+        for key in keys:
+            tree.insert(key)
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return allocated / len(keys)
+
+
+def benchmark_memory(size=1_000_000, seed=42):
+    """Bytes per key for each node layout"""
+    print(f"Memory per key (tracemalloc, n = {size:,} random keys)")
+    keys = random.Random(seed).sample(range(size * 3), size)
+    variants = TREE_TYPES + [
+        ('ArrayBST (list keys)', ArrayBST),
+        ("ArrayBST ('q' keys)", lambda: ArrayBST('q')),
+    ]
+    results = []
+
+    for name, factory in variants:
+        per_key = measure_memory(factory, keys)
+        results.append((name, per_key))
+        print(f"  {name:<22} {per_key:8.1f} bytes/key")
+
+    return results
+
+
+def benchmark_bulk_load(size=1_000_000):
+    """Sorted-key build time: insert loop vs linear-time from_sorted"""
+    print(f"Bulk load of {size:,} sorted keys")
+    keys = list(range(size))
+    results = []
+
+    # A plain BST degenerates into a list on sorted inserts, so it is only
+    # timed through from_sorted
+    for name, tree_class in TREE_TYPES:
+        if tree_class is BST:
+            loop_time = None
+        else:
+            start = time.perf_counter()
+            tree = tree_class()
+            for key in keys:
+                tree.insert(key)
+            loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tree_class.from_sorted(keys)
+        bulk_time = time.perf_counter() - start
+
+        results.append((name, loop_time, bulk_time))
+        loop_text = f"{loop_time:8.2f}s" if loop_time is not None else "       -"
+        print(f"  {name:<10} insert loop {loop_text}   from_sorted {bulk_time:6.2f}s")
+
+    return results
+
+
+def benchmark_batches(size=100_000, batch_size=10_000, seed=42):
+    """Per-key loops (as in experiments.py) vs the batched tree APIs"""
+    print(f"Batched operations: n = {size:,}, batch = {batch_size:,}")
+    rng = random.Random(seed)
+    keys = rng.sample(range(size * 3), size)
+    batch = rng.sample(range(size * 3), batch_size)
+    results = []
+
+    def timed(setup, action, repeat=3):
+        best = None
+        for _ in range(repeat):
+            tree = setup()
+            gc.collect()
+            start = time.perf_counter()
+            action(tree)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    for name, tree_class in TREE_TYPES:
+        built = tree_class.from_iterable(keys)
+        fresh = lambda: tree_class.from_iterable(keys)
+        search_loop = timed(lambda: built, lambda t: [t.search(key) for key in batch])
+        search_batch = timed(lambda: built, lambda t: t.search_many(batch))
+        search_sorted = timed(lambda: built, lambda t: t.search_many(sorted(batch)))
+        insert_loop = timed(fresh, lambda t: [t.insert(key) for key in batch])
+        insert_batch = timed(fresh, lambda t: t.insert_many(batch))
+
+        results.append((name, search_loop, search_batch, search_sorted,
+                        insert_loop, insert_batch))
+        print(f"  {name:<10} search loop {search_loop * 1000:7.1f}ms"
+              f"  search_many {search_batch * 1000:7.1f}ms"
+              f" (pre-sorted {search_sorted * 1000:7.1f}ms)"
+              f"  insert loop {insert_loop * 1000:7.1f}ms"
+              f"  insert_many {insert_batch * 1000:7.1f}ms")
+
+    return results
+
+
+def benchmark_batch_crossover(size=200_000, fractions=(1 / 256, 1 / 64, 1 / 16, 1 / 8, 1 / 4,
+                                                       1 / 2, 1), repeat=3, seed=42):
+    """Where inserting a sorted batch key by key stops paying against merging it in
+
+    insert_many loops over batches below a fixed fraction of the tree
+    (trees._REBUILD_FACTOR) and rebuilds it around larger ones. union() of the batch as a tree is the
+    join-based shared descent (a linear merge once the sizes are within 8x).
+    Times are the best of repeat runs on a fresh tree.
+    """
+    print(f"Batch insert crossover: n = {size:,} random keys, sorted batches")
+    rng = random.Random(seed)
+    keys = rng.sample(range(size * 10), size)
+    results = []
+
+    for name, tree_class in (('AVL', AVLTree), ('Red-Black', RedBlackTree)):
+        for fraction in fractions:
+            batch = sorted(set(rng.sample(range(size * 10), int(size * fraction))))
+            times = {}
+            for label, action in (
+                    ('loop', lambda tree: [tree.insert(key) for key in batch]),
+                    ('union', lambda tree: tree.union(tree_class.from_sorted(batch))),
+                    ('insert_many', lambda tree: tree.insert_many(batch))):
+                best = None
+                for _ in range(repeat):
+                    tree = tree_class.from_iterable(keys)
+                    gc.collect()
+                    start = time.perf_counter()
+                    action(tree)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                    del tree
+                times[label] = best
+            results.append((name, fraction, len(batch), times['loop'], times['union'],
+                            times['insert_many']))
+            print(f"  {name:<10} batch {len(batch):>8,} (n/{size / len(batch):<5.0f})"
+                  f"   loop {times['loop'] * 1000:7.1f} ms   union {times['union'] * 1000:7.1f} ms"
+                  f"   insert_many {times['insert_many'] * 1000:7.1f} ms")
+
+    return results
+
+
+def benchmark_churn(live=100_000, rounds=10, ops_per_round=50_000, seed=42):
+    """Steady-state insert+delete churn: height and ops/sec over time"""
+    print(f"Churn at {live:,} live keys ({ops_per_round:,} insert+delete pairs per round)")
+    results = []
+
+    for name, tree_class in TREE_TYPES:
+        rng = random.Random(seed)
+        universe = live * 4
+        live_keys = rng.sample(range(universe), live)
+        present = set(live_keys)
+        tree = tree_class()
+        for key in live_keys:
+            tree.insert(key)
+        print(f"  {name}: start height {tree.get_height()}")
+
+        for round_number in range(1, rounds + 1):
+            start = time.perf_counter()
+            for _ in range(ops_per_round):
+                # Delete a random live key, then insert a fresh one
+                index = rng.randrange(live)
+                old_key = live_keys[index]
+                tree.delete(old_key)
+                present.discard(old_key)
+
+                new_key = rng.randrange(universe)
+                while new_key in present:
+                    new_key = rng.randrange(universe)
+                tree.insert(new_key)
+                present.add(new_key)
+                live_keys[index] = new_key
+            elapsed = time.perf_counter() - start
+
+            ops_rate = 2 * ops_per_round / elapsed
+            height = tree.get_height()
+            results.append((name, round_number, height, ops_rate))
+            print(f"    round {round_number:>3}: height {height:>4}   {ops_rate:>10,.0f} ops/s")
+
+    return results
+
+
+def access_traces(keys, count, rng, cluster_size=64, cluster_width=256):
+    """Sequential, clustered and uniform-random lookup traces over sorted keys"""
+    n = len(keys)
+    start = rng.randrange(n)
+    sequential = [keys[(start + i) % n] for i in range(count)]
+
+    clustered = []
+    while len(clustered) < count:
+        center = rng.randrange(n)
+        for _ in range(cluster_size):
+            offset = rng.randrange(-cluster_width, cluster_width + 1)
+            clustered.append(keys[min(n - 1, max(0, center + offset))])
+    del clustered[count:]
+
+    uniform = [keys[rng.randrange(n)] for _ in range(count)]
+    return [('sequential', sequential), ('clustered', clustered), ('uniform', uniform)]
+
+
+def benchmark_locality(size=100_000, lookups=100_000, seed=42):
+    """Root-first search vs finger search_near on traces with varying locality"""
+    print(f"Finger search: n = {size:,}, {lookups:,} lookups per trace")
+    rng = random.Random(seed)
+    keys = sorted(rng.sample(range(size * 3), size))
+    traces = access_traces(keys, lookups, rng)
+    results = []
+
+    for name, tree_class in TREE_TYPES:
+        tree = tree_class.from_sorted(keys)
+        for trace_name, trace in traces:
+            start = time.perf_counter()
+            for key in trace:
+                tree.search(key)
+            root_time = time.perf_counter() - start
+
+            cursor = tree.cursor()
+            start = time.perf_counter()
+            for key in trace:
+                cursor.search_near(key)
+            finger_time = time.perf_counter() - start
+
+            results.append((name, trace_name, lookups / root_time, lookups / finger_time))
+            print(f"  {name:<10} {trace_name:<11} search {lookups / root_time:>10,.0f} ops/s"
+                  f"   search_near {lookups / finger_time:>10,.0f} ops/s")
+
+        # A pure in-order walk does not need to search at all
+        cursor = tree.cursor()
+        cursor.seek(traces[0][1][0])
+        start = time.perf_counter()
+        for _ in range(lookups):
+            if cursor.next() is None:
+                cursor.seek(keys[0])
+        step_time = time.perf_counter() - start
+        results.append((name, 'next()', None, lookups / step_time))
+        print(f"  {name:<10} {'next()':<11} {'':>24}   cursor.next {lookups / step_time:>10,.0f} ops/s")
+
+    return results
+
+
+def benchmark_snapshot(size=1_000_000, lookups=100_000, seed=42):
+    """Startup cost: rebuilding from raw keys vs loading or mapping a snapshot"""
+    print(f"Snapshot startup: n = {size:,} random keys")
+    rng = random.Random(seed)
+    keys = rng.sample(range(size * 3), size)
+    probes = [rng.randrange(size * 3) for _ in range(lookups)]
+    path = os.path.join(tempfile.mkdtemp(), 'tree.snapshot')
+    results = []
+
+    for name, tree_class in TREE_TYPES:
+        start = time.perf_counter()
+        tree = tree_class()
+        for key in keys:
+            tree.insert(key)
+        rebuild_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tree.save(path)
+        save_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tree_class.load(path)
+        load_time = time.perf_counter() - start
+
+        results.append((name, rebuild_time, save_time, load_time))
+        print(f"  {name:<10} insert loop {rebuild_time:6.2f}s   save {save_time:6.2f}s"
+              f"   load {load_time:6.2f}s ({os.path.getsize(path) / size:.0f} bytes/key)")
+
+    start = time.perf_counter()
+    mapped = MappedTree(path)
+    open_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for key in probes:
+        key in mapped
+    mapped_rate = lookups / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for key in probes:
+        tree.search(key)
+    tree_rate = lookups / (time.perf_counter() - start)
+    mapped.close()
+    os.remove(path)
+
+    results.append(('mapped', open_time, mapped_rate, tree_rate))
+    print(f"  MappedTree open {open_time * 1000:.2f}ms   lookups {mapped_rate:,.0f} ops/s"
+          f" (in-memory {TREE_TYPES[-1][0]} {tree_rate:,.0f} ops/s)")
+    return results
+
+
+def benchmark_frozen(sizes=(100_000, 1_000_000, 10_000_000), lookups=100_000,
+                     batch_size=1_000_000, seed=42):
+    """Frozen Eytzinger array vs the pointer trees: scalar and NumPy batch lookups"""
+    print("Frozen Eytzinger tree vs pointer trees (keys 0, 3, 6, ...; uniform probes)")
+    rng = random.Random(seed)
+    results = []
+
+    for size in sizes:
+        keys = range(0, size * 3, 3)
+        probes = [rng.randrange(size * 3) for _ in range(lookups)]
+        batch = np.array([rng.randrange(size * 3) for _ in range(batch_size)]) if np else None
+        print(f"  n = {size:,}")
+
+        def measure(name, tree, build_time):
+            start = time.perf_counter()
+            for key in probes:
+                tree.search(key)
+            scalar_rate = lookups / (time.perf_counter() - start)
+            batch_rate = None
+            if np is not None:
+                start = time.perf_counter()
+                tree.contains_many(batch)
+                batch_rate = batch_size / (time.perf_counter() - start)
+            results.append((name, size, build_time, scalar_rate, batch_rate))
+            batch_text = f"{batch_rate:>12,.0f}" if batch_rate else f"{'-':>12}"
+            print(f"    {name:<10} build {build_time:6.2f}s   search {scalar_rate:>10,.0f} ops/s"
+                  f"   contains_many {batch_text} keys/s")
+
+        # One tree at a time, so 10^7 pointer trees fit in memory
+        for name, tree_class in [('Frozen', FrozenTree)] + TREE_TYPES:
+            start = time.perf_counter()
+            tree = tree_class.from_sorted(keys)
+            measure(name, tree, time.perf_counter() - start)
+            del tree
+
+        if np is not None:
+            stored = np.arange(0, size * 3, 3)
+            start = time.perf_counter()
+            positions = np.minimum(np.searchsorted(stored, batch), size - 1)
+            stored[positions] == batch
+            rate = batch_size / (time.perf_counter() - start)
+            results.append(('np.searchsorted', size, None, None, rate))
+            print(f"    {'sorted ndarray + np.searchsorted':<56} {rate:>12,.0f} keys/s")
+
+    return results
+
+
+def benchmark_set_operations(size=1_000_000, others=(1_000, 100_000, 1_000_000), seed=42):
+    """split/join and join-based union vs dumping inorder() and rebuilding"""
+    print(f"Split, join and union: n = {size:,} random keys")
+    rng = random.Random(seed)
+    universe = size * 4
+    keys = sorted(rng.sample(range(universe), size))
+    results = []
+
+    for name, tree_class in TREE_TYPES[1:]:
+        # Subtree sizes give the halves' lengths without counting either one
+        tree = tree_class.from_sorted(keys, order_stats=True)
+        start = time.perf_counter()
+        left, right = tree.split(keys[size // 3])
+        split_time = time.perf_counter() - start
+        start = time.perf_counter()
+        tree = tree_class.join(left, right)
+        join_time = time.perf_counter() - start
+        results.append((name, 'split', size, split_time))
+        results.append((name, 'join', size, join_time))
+        print(f"  {name:<10} split {split_time * 1e6:8.0f} us   join {join_time * 1e6:8.0f} us"
+              f"   (order_stats=True)")
+
+        for count in others:
+            extra = sorted(rng.sample(range(universe), count))
+            a, b = tree_class.from_sorted(keys), tree_class.from_sorted(extra)
+            start = time.perf_counter()
+            a.union(b)
+            union_time = time.perf_counter() - start
+
+            # What callers did before: dump both trees and rebuild the merge
+            a, b = tree_class.from_sorted(keys), tree_class.from_sorted(extra)
+            start = time.perf_counter()
+            tree_class.from_sorted(sorted(set(a.inorder()) | set(b.inorder())))
+            rebuild_time = time.perf_counter() - start
+            results.append((name, 'union', count, union_time, rebuild_time))
+            print(f"  {name:<10} union with m = {count:>9,}: union() {union_time:7.3f}s"
+                  f"   inorder + rebuild {rebuild_time:7.3f}s")
+        del tree, a, b
+
+    return results
+
+
+def benchmark_concurrency(size=100_000, threads=4, ops_per_thread=20_000,
+                          read_percents=(100, 95, 90, 75, 50), batches=(1, 32), seed=42):
+    """Locked trees under mixed reader/writer threads; every run is validated afterwards"""
+    print(f"Concurrent access: n = {size:,}, {threads} threads x {ops_per_thread:,} ops")
+    print("  (CPython runs one thread at a time, so this measures locking overhead,")
+    print("   not parallel speedup)")
+    keys = range(0, size * 2, 2)
+    variants = [
+        ('RB + RW lock', lambda: ConcurrentTree(RedBlackTree.from_sorted(keys))),
+        ('AVL + RW lock', lambda: ConcurrentTree(AVLTree.from_sorted(keys))),
+        ('RB, 8 shards', lambda: ShardedTree.from_tree(RedBlackTree.from_sorted(keys), 8)),
+    ]
+    results = []
+
+    for read_percent in read_percents:
+        for batch in batches:
+            if read_percent == 100 and batch != batches[0]:
+                continue
+            for name, factory in variants:
+                rate, _ = run_stress(factory(), threads, ops_per_thread, read_percent,
+                                     key_space=size * 2, batch=batch, seed=seed)
+                results.append((name, read_percent, batch, rate))
+                print(f"  {name:<14} reads:writes {read_percent:>3}:{100 - read_percent:<3}"
+                      f" batch {batch:>3}   {rate:>10,.0f} ops/s   valid")
+
+    return results
+
+
+def benchmark_persistent(size=1_000_000, updates=10_000, seed=42):
+    """Path-copying versions: memory per retained version, snapshot and update cost"""
+    print(f"Persistent tree: n = {size:,}, {updates:,} updates, every version kept")
+    rng = random.Random(seed)
+    keys = list(range(0, size * 2, 2))
+    new_keys = [rng.randrange(size * 2) | 1 for _ in range(updates)]
+
+    # Memory is traced in its own pass; tracing slows allocation down a lot
+    tracemalloc.start()
+    try:
+        base = PersistentTree.from_sorted(keys)
+        base_bytes, _ = tracemalloc.get_traced_memory()
+        index = VersionedTree(base)
+        for key in new_keys:
+            index.insert(key)
+            index.snapshot()
+        all_bytes, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del index
+    per_version = (all_bytes - base_bytes) / updates
+
+    index = VersionedTree(base)
+    start = time.perf_counter()
+    for key in new_keys:
+        index.insert(key)
+        index.snapshot()
+    update_time = time.perf_counter() - start
+    del index
+    print(f"  base version           {base_bytes / 1e6:8.1f} MB   height {base.get_height()}")
+    print(f"  per retained version   {per_version:8.0f} bytes   "
+          f"(a full copy would be {base_bytes:,.0f})")
+    print(f"  insert + snapshot      {updates / update_time:8,.0f} versions/s")
+
+    del base
+    tree = AVLTree.from_sorted(keys)
+    start = time.perf_counter()
+    for key in new_keys:
+        tree.insert(key)
+    mutable_rate = updates / (time.perf_counter() - start)
+    start = time.perf_counter()
+    AVLTree.from_sorted(tree.inorder())
+    copy_time = time.perf_counter() - start
+    print(f"  mutable AVL insert     {mutable_rate:8,.0f} ops/s   full-copy snapshot {copy_time:.2f}s")
+    return per_version, updates / update_time, mutable_rate, copy_time
+
+
+def benchmark_intervals(size=1_000_000, queries=1_000, scans=10, updates=20_000, seed=42):
+    """Overlap/stabbing queries in interval mode against a linear scan of inorder()"""
+    print(f"Interval queries: n = {size:,} intervals")
+    rng = random.Random(seed)
+    universe = size * 100
+    intervals = sorted({(start, start + rng.randrange(1000))
+                        for start in (rng.randrange(universe) for _ in range(size))})
+    windows = [(lo, lo + rng.randrange(5000))
+               for lo in (rng.randrange(universe) for _ in range(queries))]
+    results = []
+
+    for name, tree_class in (('AVL', AVLTree), ('Red-Black', RedBlackTree)):
+        start = time.perf_counter()
+        tree = tree_class.from_sorted(intervals, intervals=True)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = sum(len(tree.overlaps(lo, hi)) for lo, hi in windows)
+        overlap_time = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        for lo, _ in windows:
+            tree.stab(lo)
+        stab_time = (time.perf_counter() - start) / queries
+
+        # What callers did before: filter the whole inorder() output
+        start = time.perf_counter()
+        for lo, hi in windows[:scans]:
+            [iv for iv in tree.inorder() if iv[0] <= hi and iv[1] >= lo]
+        scan_time = (time.perf_counter() - start) / scans
+        results.append((name, overlap_time, stab_time, scan_time))
+        print(f"  {name:<10} build {build_time:5.2f}s   overlaps {overlap_time * 1e6:7.1f} us"
+              f" ({found / queries:.1f} hits)   stab {stab_time * 1e6:6.1f} us"
+              f"   linear scan {scan_time * 1e3:7.1f} ms")
+
+        # Cost of keeping max_hi up to date through rotations and fix-ups
+        extra = [(start, start + rng.randrange(1000))
+                 for start in (rng.randrange(universe) for _ in range(updates))]
+        rates = []
+        for options in ({}, {'intervals': True}):
+            del tree
+            tree = tree_class.from_sorted(intervals, **options)
+            gc.collect()
+            start = time.perf_counter()
+            for iv in extra:
+                tree.insert(iv)
+            for iv in extra:
+                tree.delete(iv)
+            rates.append(2 * updates / (time.perf_counter() - start))
+        print(f"  {'':<10} insert+delete {rates[0]:9,.0f} ops/s plain, "
+              f"{rates[1]:9,.0f} ops/s with max_hi")
+        del tree
+
+    return results
+
+
+def _traced(load):
+    """Run load() under tracemalloc; return (result, peak MB, retained MB)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = load()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 1e6, current / 1e6
+
+
+def benchmark_ingest(size=1_000_000, chunk_size=100_000, seed=42):
+    """Building trees from files: whole-file lists vs chunked streaming ingest"""
+    print(f"File ingest: n = {size:,} random keys, chunks of {chunk_size:,}")
+    rng = random.Random(seed)
+    directory = tempfile.mkdtemp()
+    keys = [rng.randrange(size * 10) for _ in range(size)]
+    paths = {'text': os.path.join(directory, 'keys.txt'),
+             'binary': os.path.join(directory, 'keys.bin')}
+    with open(paths['text'], 'w') as f:
+        f.writelines(f"{key}\n" for key in keys)
+    write_keys(paths['binary'], keys)
+    if np is not None:
+        paths['npy'] = os.path.join(directory, 'keys.npy')
+        write_keys(paths['npy'], keys)
+    del keys
+    results = []
+
+    for fmt, path in paths.items():
+        def whole_file():
+            # What callers did before: the whole file as one list, then a build
+            if fmt == 'npy':
+                keys = np.load(path).tolist()
+            elif fmt == 'text':
+                with open(path, 'rb') as f:
+                    keys = [int(line) for line in f]
+            else:
+                keys = array('q')
+                with open(path, 'rb') as f:
+                    keys.frombytes(f.read())
+            return AVLTree.from_iterable(keys)
+
+        methods = [
+            ('whole file', whole_file),
+            ('insert_many', lambda: ingest(AVLTree(), KeySource(path, chunk_size))),
+            ('external sort', lambda: build_sorted(AVLTree, KeySource(path, chunk_size))),
+        ]
+        for name, load in methods:
+            start = time.perf_counter()
+            tree = load()
+            elapsed = time.perf_counter() - start
+            del tree
+            _, peak, retained = _traced(load)
+            results.append((fmt, name, elapsed, peak, retained))
+            print(f"  {fmt:<7} {name:<14} {elapsed:6.2f}s   peak {peak:7.1f} MB"
+                  f"   tree {retained:7.1f} MB   overhead {peak - retained:6.1f} MB")
+        os.remove(path)
+
+    os.rmdir(directory)
+    return results
+
+
+def _walk_shape(tree):
+    """The same shape profile by one recursive Python walk over the nodes"""
+    nil = tree._nil
+    colored = hasattr(tree, 'NIL')
+    depths, factors, black_heights = {}, {}, {}
+    miss_depth = 0
+
+    def visit(node, depth):
+        nonlocal miss_depth
+        if node is nil:
+            miss_depth += depth - 1
+            return 0, 1
+        depths[depth] = depths.get(depth, 0) + 1
+        left, black = visit(node.left, depth + 1)
+        right, _ = visit(node.right, depth + 1)
+        factors[left - right] = factors.get(left - right, 0) + 1
+        if colored:
+            black += node.color == 0
+            black_heights[black] = black_heights.get(black, 0) + 1
+        return 1 + (left if left > right else right), black
+
+    visit(tree.root, 1)
+    return depths, factors, black_heights, miss_depth / (len(tree) + 1)
+
+
+class _ComparedBy:
+    """Element compared through key(element) on both sides of every comparison
+
+    The usual way to order by a derived key before trees took key=.
+    """
+    __slots__ = ('item', 'key')
+
+    def __init__(self, item, key):
+        self.item = item
+        self.key = key
+
+    def __lt__(self, other):
+        return self.key(self.item) < other.key(other.item)
+
+    def __gt__(self, other):
+        return self.key(self.item) > other.key(other.item)
+
+    def __eq__(self, other):
+        return self.key(self.item) == other.key(other.item)
+
+
+def _key_variants(tree_class, key, counters=None):
+    """(label, make tree, insert(tree, element), search(tree, element)) per way of keying
+
+    All three store the elements. With counters, every comparison is added
+    to counters.comparisons.
+    """
+    if counters is not None:
+        counted = counting_key_type(counters)
+        plain_key = key
+
+        def compared_key(item):
+            counters.comparisons += 0.5  # key runs on both sides
+            return plain_key(item)
+
+        key = lambda item: counted(plain_key(item))
+    else:
+        compared_key = key
+    return [
+        ('compare-time key', tree_class,
+         lambda tree, item: tree.insert(_ComparedBy(item, compared_key)),
+         lambda tree, item: tree.search(_ComparedBy(item, compared_key))),
+        ('key -> element map', lambda: tree_class(mapping=True),
+         lambda tree, item: tree.setdefault(key(item), item),
+         lambda tree, item: tree.search(key(item))),
+        ('key=', lambda: tree_class(key=key),
+         lambda tree, item: tree.insert(item),
+         lambda tree, item: tree.search(item)),
+    ]
+
+
+def benchmark_key_functions(size=100_000, lookups=100_000, seed=42):
+    """key= (cached keys, one comparison per level) against the ways callers keyed before"""
+    print(f"Key functions: n = {size:,} elements, {lookups:,} lookups")
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    surnames = [''.join(rng.choice(letters) for _ in range(8)) for _ in range(300)]
+    given = [''.join(rng.choice(letters) for _ in range(6)) for _ in range(300)]
+    datasets = [
+        ('names', str.casefold,
+         [''.join(rng.choice(letters) for _ in range(16)) for _ in range(size)]),
+        ('records', lambda rec: (rec[1].casefold(), rec[2].casefold(), rec[3]),
+         [(rng.choice('NESW'), rng.choice(surnames), rng.choice(given), i) for i in range(size)]),
+    ]
+    counters = Counters()
+    results = []
+
+    for data_name, key, elements in datasets:
+        probes = [rng.choice(elements) for _ in range(lookups)]
+        for tree_name, tree_class in (('AVL', AVLTree), ('Red-Black', RedBlackTree)):
+            timed = _key_variants(tree_class, key)
+            counting = _key_variants(tree_class, key, counters)
+            for (label, make, insert, search), (_, *replay) in zip(timed, counting):
+                tree = make()
+                start = time.perf_counter()
+                for item in elements:
+                    insert(tree, item)
+                insert_time = (time.perf_counter() - start) / size
+                start = time.perf_counter()
+                for item in probes:
+                    search(tree, item)
+                search_time = (time.perf_counter() - start) / lookups
+
+                # Untimed replay with every comparison counted
+                make, insert, search = replay
+                tree = make()
+                comparisons = []
+                for operation, batch in ((insert, elements), (search, probes)):
+                    counters.reset()
+                    for item in batch:
+                        operation(tree, item)
+                    comparisons.append(counters.comparisons / len(batch))
+                results.append((data_name, tree_name, label, insert_time, search_time,
+                                *comparisons))
+                print(f"  {data_name:<8} {tree_name:<10} {label:<19} insert "
+                      f"{insert_time * 1e6:6.2f} us ({comparisons[0]:4.1f} cmp)   search "
+                      f"{search_time * 1e6:6.2f} us ({comparisons[1]:4.1f} cmp)")
+                del tree
+                gc.collect()
+
+    return results
+
+
+def benchmark_shape(size=1_000_000, seed=42):
+    """Shape profile via to_arrays() and NumPy against a per-node Python walk"""
+    if np is None:
+        print("Shape analytics: skipped (needs NumPy)")
+        return []
+    print(f"Shape analytics: n = {size:,} random inserts")
+    rng = random.Random(seed)
+    keys = rng.sample(range(size * 10), size)
+    results = []
+
+    for name, tree_class in (('BST', BST), ('AVL', AVLTree), ('Red-Black', RedBlackTree)):
+        tree = tree_class()
+        for key in keys:
+            tree.insert(key)
+
+        start = time.perf_counter()
+        _walk_shape(tree)
+        walk_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        arrays = tree.to_arrays(keys=False)
+        export_time = time.perf_counter() - start
+        start = time.perf_counter()
+        profile = shape_profile(arrays)
+        profile_time = time.perf_counter() - start
+        results.append((name, walk_time, export_time, profile_time))
+        print(f"  {name:<10} python walk {walk_time:5.2f}s   to_arrays {export_time:5.2f}s"
+              f"   profile {profile_time * 1e3:6.1f} ms   avg path "
+              f"{profile['avg_path_length']:5.2f} (min {profile['min_avg_path_length']:.2f})")
+        del tree, arrays
+        gc.collect()
+
+    return results
+
+
+def benchmark_server(size=100_000, clients=(1, 4, 16, 64), requests=20_000, seed=42):
+    """Index server in a child process under a growing number of client connections"""
+    print(f"Index server: Red-Black tree of {size:,} keys, {requests:,} requests per round")
+    print("  (clients and server share this machine's CPUs, so rates include the load generator)")
+    results = []
+
+    for read_percent, depth, max_batch in ((90, 1, 4096), (90, 8, 4096), (50, 4, 1), (50, 4, 4096)):
+        process, port = start_server_process('rb', size, max_batch=max_batch)
+        try:
+            rows = asyncio.run(run_load(port=port, clients=clients, requests=requests,
+                                        depth=depth, read_percent=read_percent,
+                                        key_space=size * 2, seed=seed))
+        finally:
+            process.terminate()
+            process.join()
+        writes = 'one at a time' if max_batch == 1 else 'coalesced'
+        for row in rows:
+            results.append((read_percent, depth, max_batch, row))
+            print(f"  reads {read_percent:>3}%  depth {depth}  writes {writes:<13}"
+                  f" clients {row['clients']:>3}   {row['throughput']:>8,.0f} req/s   p50 "
+                  f"{row['p50_ms']:6.3f} ms   p99 {row['p99_ms']:6.3f} ms"
+                  f"   p99.9 {row['p999_ms']:6.3f} ms")
+
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_throughput()
+    print()
+    benchmark_memory()
+    print()
+    benchmark_bulk_load()
+    print()
+    benchmark_batches()
+    print()
+    benchmark_batch_crossover()
+    print()
+    benchmark_churn()
+    print()
+    benchmark_locality()
+    print()
+    benchmark_snapshot()
+    print()
+    benchmark_frozen()
+    print()
+    benchmark_set_operations()
+    print()
+    benchmark_concurrency()
+    print()
+    benchmark_persistent()
+    print()
+    benchmark_intervals()
+    print()
+    benchmark_ingest()
+    print()
+    benchmark_shape()
+    print()
+    benchmark_key_functions()
+    print()
+    benchmark_server()
@@ -0,0 +1,345 @@
+"""
+Thread-Safe Access to Shared Trees
+Reader-writer locking around any tree from trees.py
+
+ConcurrentTree lets many threads search one tree while writers take turns;
+a batch of updates is applied under a single write-lock acquisition.
+ShardedTree splits a tree into key ranges with a lock each, so writers on
+different ranges do not wait for one another.
+
+Example:
+    index = ConcurrentTree(RedBlackTree.from_sorted(keys))
+    index.search(key)                               # shared lock
+    index.apply([('insert', 5), ('delete', 7)])     # one exclusive lock
+"""
+
+import random
+import sys
+import threading
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from .trees import SplayTree
+
+
+class ReadWriteLock:
+    """Many readers or one writer; a waiting writer holds back new readers"""
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+# Tree methods that only read, and those that change the tree
+READ_METHODS = ('search', 'get', 'floor', 'ceiling', 'predecessor', 'successor', 'rank',
+                'select', 'count_range', 'percentile', 'find_min', 'find_max', 'inorder',
+                'get_height', 'validate', 'search_many', 'contains_many')
+WRITE_METHODS = ('insert', 'delete', 'insert_many', 'delete_many', 'pop', 'setdefault')
+
+_APPLY = {
+    'insert': lambda tree, key, value: tree.insert(key),
+    'delete': lambda tree, key, value: tree.delete(key),
+    'set': lambda tree, key, value: tree.__setitem__(key, value),
+}
+
+
+def _locked(name, exclusive):
+    def method(self, *args, **kwargs):
+        with (self._exclusive() if exclusive else self._shared()):
+            return getattr(self.tree, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = f"{name} under the {'write' if exclusive else 'read'} lock"
+    return method
+
+
+class ConcurrentTree:
+    """Reader-writer locked view of one tree
+
+    Reads run in parallel with each other and never see a half-done
+    rotation. Range reads return lists, since a lazy iterator would have
+    to hold the lock until the caller finished with it. Splay trees
+    restructure on every search, so their reads take the write lock.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.lock = ReadWriteLock()
+        self._reads_write = isinstance(tree, SplayTree)
+
+    def _shared(self):
+        return self.lock.write_locked() if self._reads_write else self.lock.read_locked()
+
+    def _exclusive(self):
+        return self.lock.write_locked()
+
+    def __len__(self):
+        return len(self.tree)
+
+    def __contains__(self, key):
+        with self._shared():
+            return key in self.tree
+
+    def __getitem__(self, key):
+        with self._shared():
+            return self.tree[key]
+
+    def __setitem__(self, key, value):
+        with self._exclusive():
+            self.tree[key] = value
+
+    def __delitem__(self, key):
+        with self._exclusive():
+            del self.tree[key]
+
+    def range(self, lo=None, hi=None):
+        """Keys with lo <= key <= hi, as a consistent list"""
+        with self._shared():
+            return list(self.tree.iter_range(lo, hi))
+
+    def items(self, lo=None, hi=None):
+        """(key, value) pairs with lo <= key <= hi, as a consistent list"""
+        with self._shared():
+            return list(self.tree.items(lo, hi))
+
+    def apply(self, updates):
+        """Apply ('insert', key), ('delete', key) or ('set', key, value) updates atomically"""
+        updates = [(update[0], update[1], update[2] if len(update) > 2 else None)
+                   for update in updates]
+        for op, _, _ in updates:
+            if op not in _APPLY:
+                raise ValueError(f"unknown update {op!r}; choose from {', '.join(_APPLY)}")
+        tree = self.tree
+        with self._exclusive():
+            for op, key, value in updates:
+                _APPLY[op](tree, key, value)
+
+    @contextmanager
+    def writing(self):
+        """Hold the write lock and yield the bare tree for a batch of direct calls"""
+        with self._exclusive():
+            yield self.tree
+
+    @contextmanager
+    def reading(self):
+        """Hold the read lock and yield the bare tree (do not modify it)"""
+        with self._shared():
+            yield self.tree
+
+
+for _name in READ_METHODS:
+    setattr(ConcurrentTree, _name, _locked(_name, exclusive=False))
+for _name in WRITE_METHODS:
+    setattr(ConcurrentTree, _name, _locked(_name, exclusive=True))
+del _name
+
+
+class ShardedTree:
+    """Key-range shards with a reader-writer lock each
+
+    Shard boundaries are fixed when the tree is built. An operation locks
+    only the shard that owns its key, so writers on different ranges do not
+    wait for each other. Reads that span shards (range, inorder, len) lock
+    one shard at a time and are not a snapshot across shards. With trees
+    built with key=, elements are routed by key(element) and boundaries,
+    ranges and get() use comparison keys, as the trees themselves do.
+    """
+    def __init__(self, trees, boundaries):
+        if len(trees) != len(boundaries) + 1:
+            raise ValueError("need exactly one more shard than boundaries")
+        self.boundaries = list(boundaries)
+        self.shards = [ConcurrentTree(tree) for tree in trees]
+        # Trees built with key= take elements but are ordered by key(element)
+        self._key_func = getattr(trees[0], '_key_func', None)
+
+    @classmethod
+    def from_tree(cls, tree, shards=8):
+        """Split an AVLTree or RedBlackTree at evenly spaced keys into shards
+
+        Splitting needs split(), so other trees raise TypeError. The tree is
+        left empty.
+        """
+        if not callable(getattr(tree, 'split', None)):
+            raise TypeError(f"sharding splits the tree, which {type(tree).__name__} "
+                            "cannot do; use an AVLTree or RedBlackTree")
+        keys = tree.inorder()
+        boundaries = sorted({keys[len(keys) * i // shards] for i in range(1, shards)}
+                            if keys else ())
+        parts = []
+        rest = tree
+        for boundary in boundaries:
+            part, rest = rest.split(boundary)
+            parts.append(part)
+        parts.append(rest)
+        for part in parts:
+            # Split halves of a Red-Black tree share one NIL sentinel, which
+            # deletes write to; give every shard its own so shards can be
+            # written concurrently
+            if hasattr(part, 'own_sentinel'):
+                part.own_sentinel()
+        return cls(parts, boundaries)
+
+    def _shard_index(self, item):
+        """Shard of an element (boundaries are comparison keys with key=)"""
+        key = item if self._key_func is None else self._key_func(item)
+        return bisect_right(self.boundaries, key)
+
+    def shard_for(self, item):
+        return self.shards[self._shard_index(item)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def __contains__(self, item):
+        return item in self.shard_for(item)
+
+    def search(self, item):
+        return self.shard_for(item).search(item)
+
+    def get(self, key, default=None):
+        """Value stored under key (a comparison key with key=, as in the trees)"""
+        return self.shards[bisect_right(self.boundaries, key)].get(key, default)
+
+    def insert(self, item):
+        self.shard_for(item).insert(item)
+
+    def delete(self, item):
+        self.shard_for(item).delete(item)
+
+    def apply(self, updates):
+        """Apply updates with one write-lock acquisition per shard touched"""
+        batches = {}
+        for update in updates:
+            # 'set' addresses a value by comparison key; insert and delete take elements
+            index = (bisect_right(self.boundaries, update[1]) if update[0] == 'set'
+                     else self._shard_index(update[1]))
+            batches.setdefault(index, []).append(update)
+        for index in sorted(batches):
+            self.shards[index].apply(batches[index])
+
+    def range(self, lo=None, hi=None):
+        """Keys with lo <= key <= hi; each shard's part is consistent on its own"""
+        first = 0 if lo is None else bisect_right(self.boundaries, lo)
+        last = len(self.shards) - 1 if hi is None else bisect_right(self.boundaries, hi)
+        result = []
+        for shard in self.shards[first:last + 1]:
+            result.extend(shard.range(lo, hi))
+        return result
+
+    def inorder(self):
+        return self.range()
+
+    def validate(self):
+        """Validate every shard and check that keys stay inside their shard's range"""
+        for index, shard in enumerate(self.shards):
+            with shard.reading() as tree:
+                tree.validate()
+                keys = tree.inorder()
+            if keys and index and keys[0] < self.boundaries[index - 1]:
+                raise AssertionError(f"shard {index} holds a key below its range")
+            if keys and index < len(self.boundaries) and keys[-1] >= self.boundaries[index]:
+                raise AssertionError(f"shard {index} holds a key above its range")
+
+
+def run_stress(index, threads=4, ops_per_thread=20_000, read_percent=90, key_space=None,
+               batch=1, seed=42):
+    """Hammer a ConcurrentTree/ShardedTree from several threads and verify it
+
+    Every thread reads random keys and writes only keys congruent to its own
+    number, so the expected final contents are known exactly. A very short
+    thread switch interval forces interleavings inside rotations. Returns
+    (operations per second, final key count); raises AssertionError if the
+    tree is corrupt or its contents are wrong.
+    """
+    key_space = key_space or len(index) * 2 or 1000
+    initial = set(index.inorder())
+    owned = [{key for key in initial if key % threads == t} for t in range(threads)]
+    errors = []
+    start_line = threading.Barrier(threads + 1)
+
+    def worker(t):
+        rng = random.Random(f"{seed}:{t}")
+        mine = owned[t]
+        pending = []
+        try:
+            start_line.wait()
+            for _ in range(ops_per_thread):
+                if rng.randrange(100) < read_percent:
+                    index.search(rng.randrange(key_space))
+                    continue
+                key = rng.randrange(t, key_space, threads)
+                if key in mine:
+                    mine.discard(key)
+                    pending.append(('delete', key))
+                else:
+                    mine.add(key)
+                    pending.append(('insert', key))
+                if len(pending) >= batch:
+                    index.apply(pending)
+                    pending = []
+            if pending:
+                index.apply(pending)
+        except Exception as error:  # surfaced after the join below
+            errors.append(error)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        for thread in workers:
+            thread.start()
+        start_line.wait()
+        began = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - began
+    finally:
+        sys.setswitchinterval(interval)
+
+    if errors:
+        raise errors[0]
+    index.validate()
+    expected = sorted(set().union(*owned))
+    if index.inorder() != expected:
+        raise AssertionError("final contents differ from the applied updates")
+    return threads * ops_per_thread / elapsed, len(expected)
@@ -1,178 +1,224 @@
 """
 Experimental Analysis of Tree Structures
-Generates the 3 required graphs for the laboratory work
+Generates the 3 required graphs for the laboratory work, plus a B-tree /
+B+-tree order comparison (experiment 7) and self-adjusting structures under
+skewed access (experiment 8); experiments 7 and 8 also count comparisons and
+search path lengths per lookup (src/instrument.py), and experiment 9 profiles
+the shape of trees up to 10^6 keys (src/analytics.py)
+
+The heights come from the benchmark harness (src/harness.py) and are saved to
+graphs/experiments.json, so the graphs can be redrawn without rebuilding any
+tree:  python -m src.experiments --from-results
 """
 
-import random
-import matplotlib.pyplot as plt
+import argparse
+import json
 import math
 import os
-from .trees import BST, AVLTree, RedBlackTree
+from .harness import run_sweep, parse_mix, summarize
+
+
+GRAPHS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graphs')
+RESULTS_FILE = os.path.join(GRAPHS_DIR, 'experiments.json')
+
+BUILD_ONLY = parse_mix('search')
+BTREE_ORDERS = [4, 16, 64, 256]
+SKEW_TREES = ['avl', 'rb', 'splay', 'treap', 'skiplist']
+SKEW_DISTS = ['random', 'zipf', 'temporal']
+SHAPE_TREES = ['bst', 'avl', 'rb', 'splay', 'treap']
 
 
 def ensure_graphs_directory():
     """Create graphs directory if it doesn't exist"""
-    if not os.path.exists('../graphs'):
-        os.makedirs('../graphs')
+    os.makedirs(GRAPHS_DIR, exist_ok=True)
 
 
-def experiment_bst_height():
+def _heights(rows, tree, sizes):
+    """Average height per size for one tree over all repetitions"""
+    heights = []
+    for size in sizes:
+        values = [row['height'] for row in rows if row['tree'] == tree and row['size'] == size]
+        heights.append(sum(values) / len(values))
+    return heights
+
+
+def _comparisons(row):
+    # Results saved before the counters were added have no such field
+    comparisons = row.get('search_comparisons')
+    return f", {comparisons:.1f} comparisons/search" if comparisons is not None else ""
+
+
+def _progress(row):
+    print(f"  Testing {row['tree']} with n = {row['size']:,} keys ({row['dist']})...")
+
+
+def experiment_bst_height(seed=42, workers=1):
     """Experiment 4: BST height with thousands of keys"""
     print("Running Experiment 4: BST height analysis...")
     sizes = [1000, 5000, 10000, 20000, 50000]
-    heights = []
-    log_heights = []
-    
-    for size in sizes:
-        print(f"  Testing n = {size:,} keys...")
-        temp_heights = []
-        
-        # 2 trials for each size
-        for _ in range(2):
-            keys = random.sample(range(size * 3), size)
-            bst = BST()
-            for key in keys:
-                bst.insert(key)
-            temp_heights.append(bst.get_height())
-        
-        avg_height = sum(temp_heights) / len(temp_heights)
-        heights.append(avg_height)
-        log_heights.append(math.log2(size))
-    
+
+    # 2 trials for each size
+    rows = run_sweep(['bst'], ['random'], sizes, BUILD_ONLY, ops=0, reps=2, seed=seed,
+                     measure_memory=False, progress=_progress, workers=workers)
+    heights = _heights(rows, 'bst', sizes)
+    log_heights = [math.log2(size) for size in sizes]
+
     return sizes, heights, log_heights
 
 
-def experiment_avl_rb_random():
-    """Experiment 5: AVL and Red-Black with random keys"""
-    print("\nRunning Experiment 5: AVL and Red-Black (random keys)...")
+def _experiment_avl_rb(dist, seed, workers):
     sizes = [1000, 5000, 10000, 20000]
-    avl_heights = []
-    rb_heights = []
-    avl_bounds = []
-    rb_bounds = []
-    
-    for size in sizes:
-        print(f"  Testing balanced trees with n = {size:,} keys...")
-        
-        keys = random.sample(range(size * 3), size)
-        
-        avl = AVLTree()
-        rb = RedBlackTree()
-        
-        for key in keys:
-            avl.insert(key)
-            rb.insert(key)
-        
-        avl_heights.append(avl.get_height())
-        rb_heights.append(rb.get_height())
-        avl_bounds.append(1.44 * math.log2(size))
-        rb_bounds.append(2 * math.log2(size))
-    
+    rows = run_sweep(['avl', 'rb'], [dist], sizes, BUILD_ONLY, ops=0, reps=1, seed=seed,
+                     measure_memory=False, progress=_progress, workers=workers)
+    avl_heights = _heights(rows, 'avl', sizes)
+    rb_heights = _heights(rows, 'rb', sizes)
+    avl_bounds = [1.44 * math.log2(size) for size in sizes]
+    rb_bounds = [2 * math.log2(size) for size in sizes]
+
     return sizes, avl_heights, rb_heights, avl_bounds, rb_bounds
 
 
-def experiment_avl_rb_sorted():
+def experiment_avl_rb_random(seed=42, workers=1):
+    """Experiment 5: AVL and Red-Black with random keys"""
+    print("\nRunning Experiment 5: AVL and Red-Black (random keys)...")
+    return _experiment_avl_rb('random', seed, workers)
+
+
+def experiment_avl_rb_sorted(seed=42, workers=1):
     """Experiment 6: AVL and Red-Black with sorted keys"""
     print("\nRunning Experiment 6: AVL and Red-Black (sorted keys)...")
-    sizes = [1000, 5000, 10000, 20000]
-    avl_heights = []
-    rb_heights = []
-    avl_bounds = []
-    rb_bounds = []
-    
-    for size in sizes:
-        print(f"  Testing with sorted keys, n = {size:,}...")
-        
-        keys = list(range(size))  # Sorted keys
-        
-        avl = AVLTree()
-        rb = RedBlackTree()
-        
-        for key in keys:
-            avl.insert(key)
-            rb.insert(key)
-        
-        avl_heights.append(avl.get_height())
-        rb_heights.append(rb.get_height())
-        avl_bounds.append(1.44 * math.log2(size))
-        rb_bounds.append(2 * math.log2(size))
-    
-    return sizes, avl_heights, rb_heights, avl_bounds, rb_bounds
+    return _experiment_avl_rb('sorted', seed, workers)
+
+
+def experiment_btree_orders(seed=42, workers=1):
+    """Experiment 7: B-tree and B+-tree height and search rate by order"""
+    print("\nRunning Experiment 7: B-tree / B+-tree orders (random keys)...")
+    sizes = [1000, 10000, 100000]
+    trees = [f"{kind}-{order}" for kind in ('btree', 'bplus') for order in BTREE_ORDERS]
+    rows = run_sweep(trees, ['random'], sizes, BUILD_ONLY, ops=20000, reps=1, seed=seed,
+                     measure_memory=False, progress=_progress, workers=workers, counters=True)
+    return summarize(rows)
+
+
+def experiment_skewed_access(seed=42, workers=1):
+    """Experiment 8: search rate of balanced vs self-adjusting structures by access pattern"""
+    print("\nRunning Experiment 8: skewed and temporally local lookups...")
+    sizes = [10000, 100000]
+    rows = run_sweep(SKEW_TREES, SKEW_DISTS, sizes, BUILD_ONLY, ops=100000, reps=1, seed=seed,
+                     measure_memory=False, progress=_progress, workers=workers, counters=True)
+    return summarize(rows)
+
+
+def experiment_shape_profiles(seed=42, workers=1):
+    """Experiment 9: search path lengths and balance of trees built from random keys"""
+    print("\nRunning Experiment 9: tree shape profiles (random keys)...")
+    sizes = [10000, 100000, 1000000]
+    rows = run_sweep(SHAPE_TREES, ['random'], sizes, BUILD_ONLY, ops=0, reps=1, seed=seed,
+                     measure_memory=False, progress=_progress, workers=workers, shape=True)
+    return summarize(rows)
+
+
+def run_experiments(seed=42, workers=1):
+    """Run experiments 4-9 and return their data keyed by experiment
+
+    workers > 1 spreads each experiment's cells over a process pool (None
+    means one per CPU); the heights are the same as in a serial run.
+    """
+    return {
+        'experiment4': experiment_bst_height(seed, workers),
+        'experiment5': experiment_avl_rb_random(seed, workers),
+        'experiment6': experiment_avl_rb_sorted(seed, workers),
+        'experiment7': experiment_btree_orders(seed, workers),
+        'experiment8': experiment_skewed_access(seed, workers),
+        'experiment9': experiment_shape_profiles(seed, workers),
+    }
+
+
+def save_results(results, path=RESULTS_FILE):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
 
+def load_results(path=RESULTS_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def generate_all_graphs(results=None, workers=1):
+    """Generate the experiment graphs, running the experiments if no results are given"""
+    from .plots import plot_bst_height, plot_avl_rb_heights, plot_metric
 
-def generate_all_graphs():
-    """Generate all 3 required graphs"""
     ensure_graphs_directory()
-    
+
     print("\n" + "="*60)
-    print("GENERATING 3 EXPERIMENTAL GRAPHS")
+    print("GENERATING EXPERIMENTAL GRAPHS")
     print("="*60)
-    
+
+    if results is None:
+        results = run_experiments(workers=workers)
+        save_results(results)
+        print(f"\n✓ Results saved: {RESULTS_FILE}")
+
     # Graph 1: Experiment 4 - BST height
     print("\nCreating Graph 1: BST Height Analysis...")
-    sizes_bst, heights_bst, log_h = experiment_bst_height()
-    
-    plt.figure(figsize=(10, 6))
-    plt.plot(sizes_bst, heights_bst, 'bo-', label='BST Height (Experimental)', linewidth=2, markersize=8)
-    plt.plot(sizes_bst, log_h, 'r--', label='log₂(n) (Theoretical O(log n))', linewidth=2)
-    plt.plot(sizes_bst, sizes_bst, 'g:', label='n (Theoretical O(n))', linewidth=1, alpha=0.3)
-    plt.xlabel('Number of Keys (n)', fontsize=12)
-    plt.ylabel('Tree Height', fontsize=12)
-    plt.title('Experiment 4: BST Height vs Number of Keys\n(Random Keys, Thousands of Elements)', fontsize=14)
-    plt.legend(fontsize=11)
-    plt.grid(True, alpha=0.3)
-    plt.xscale('log')
-    plt.tight_layout()
-    plt.savefig('../graphs/experiment4_bst_height.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    sizes_bst, heights_bst, log_h = results['experiment4']
+    plot_bst_height(sizes_bst, heights_bst, log_h,
+                    os.path.join(GRAPHS_DIR, 'experiment4_bst_height.png'))
     print("✓ Graph 1 saved: experiment4_bst_height.png")
-    
+
     # Graph 2: Experiment 5 - AVL and Red-Black with random keys
     print("\nCreating Graph 2: AVL and Red-Black (Random Keys)...")
-    sizes, avl_h, rb_h, avl_u, rb_u = experiment_avl_rb_random()
-    
-    plt.figure(figsize=(10, 6))
-    plt.plot(sizes, avl_h, 'go-', label='AVL Height (Experimental)', linewidth=2, markersize=8)
-    plt.plot(sizes, rb_h, 'bo-', label='Red-Black Height (Experimental)', linewidth=2, markersize=8)
-    plt.plot(sizes, avl_u, 'g--', label='Upper Bound: 1.44·log₂(n)', linewidth=1.5, alpha=0.7)
-    plt.plot(sizes, rb_u, 'b--', label='Upper Bound: 2·log₂(n)', linewidth=1.5, alpha=0.7)
-    plt.plot(sizes, [math.log2(s) for s in sizes], 'k:', label='Lower Bound: log₂(n)', linewidth=1.5, alpha=0.5)
-    plt.xlabel('Number of Keys (n)', fontsize=12)
-    plt.ylabel('Tree Height', fontsize=12)
-    plt.title('Experiment 5: AVL and Red-Black Trees\n(Random Keys, Thousands of Elements)', fontsize=14)
-    plt.legend(fontsize=10)
-    plt.grid(True, alpha=0.3)
-    plt.xscale('log')
-    plt.tight_layout()
-    plt.savefig('../graphs/experiment5_avl_rb_random.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    sizes, avl_h, rb_h, avl_u, rb_u = results['experiment5']
+    plot_avl_rb_heights(sizes, avl_h, rb_h, avl_u, rb_u,
+                        'Experiment 5: AVL and Red-Black Trees\n(Random Keys, Thousands of Elements)',
+                        os.path.join(GRAPHS_DIR, 'experiment5_avl_rb_random.png'))
     print("✓ Graph 2 saved: experiment5_avl_rb_random.png")
-    
+
     # Graph 3: Experiment 6 - AVL and Red-Black with sorted keys
     print("\nCreating Graph 3: AVL and Red-Black (Sorted Keys)...")
-    sizes_sorted, avl_h_s, rb_h_s, avl_u_s, rb_u_s = experiment_avl_rb_sorted()
-    
-    plt.figure(figsize=(10, 6))
-    plt.plot(sizes_sorted, avl_h_s, 'go-', label='AVL Height (Sorted Keys)', linewidth=2, markersize=8)
-    plt.plot(sizes_sorted, rb_h_s, 'bo-', label='Red-Black Height (Sorted Keys)', linewidth=2, markersize=8)
-    plt.plot(sizes_sorted, avl_u_s, 'g--', label='Upper Bound: 1.44·log₂(n)', linewidth=1.5, alpha=0.7)
-    plt.plot(sizes_sorted, rb_u_s, 'b--', label='Upper Bound: 2·log₂(n)', linewidth=1.5, alpha=0.7)
-    plt.plot(sizes_sorted, [math.log2(s) for s in sizes_sorted], 'k:', label='Lower Bound: log₂(n)', linewidth=1.5, alpha=0.5)
-    plt.xlabel('Number of Keys (n)', fontsize=12)
-    plt.ylabel('Tree Height', fontsize=12)
-    plt.title('Experiment 6: AVL and Red-Black Trees\n(Worst Case: Sorted Keys, Thousands of Elements)', fontsize=14)
-    plt.legend(fontsize=10)
-    plt.grid(True, alpha=0.3)
-    plt.xscale('log')
-    plt.tight_layout()
-    plt.savefig('../graphs/experiment6_avl_rb_sorted.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    sizes_sorted, avl_h_s, rb_h_s, avl_u_s, rb_u_s = results['experiment6']
+    plot_avl_rb_heights(sizes_sorted, avl_h_s, rb_h_s, avl_u_s, rb_u_s,
+                        'Experiment 6: AVL and Red-Black Trees\n(Worst Case: Sorted Keys, Thousands of Elements)',
+                        os.path.join(GRAPHS_DIR, 'experiment6_avl_rb_sorted.png'),
+                        label_suffix='Sorted Keys')
     print("✓ Graph 3 saved: experiment6_avl_rb_sorted.png")
-    
+
+    # Graphs 4 and 5: Experiment 7 - B-tree / B+-tree orders (older result
+    # files saved before this experiment existed have no entry for it)
+    btree_rows = results.get('experiment7')
+    if btree_rows:
+        print("\nCreating Graphs 4-5: B-tree / B+-tree Orders...")
+        for metric in ('height', 'ops_per_sec'):
+            name = f'experiment7_btree_{metric}.png'
+            plot_metric(btree_rows, metric, os.path.join(GRAPHS_DIR, name))
+            print(f"✓ Graph saved: {name}")
+
+    # Experiment 8 - one graph per access pattern
+    skew_rows = results.get('experiment8')
+    if skew_rows:
+        print("\nCreating Experiment 8 Graphs: Skewed Access...")
+        for dist in SKEW_DISTS:
+            dist_rows = [row for row in skew_rows if row['dist'] == dist]
+            name = f'experiment8_{dist}.png'
+            plot_metric(dist_rows, 'ops_per_sec', os.path.join(GRAPHS_DIR, name))
+            print(f"✓ Graph saved: {name}")
+            if any(row.get('search_comparisons') is not None for row in dist_rows):
+                name = f'experiment8_{dist}_comparisons.png'
+                plot_metric(dist_rows, 'search_comparisons', os.path.join(GRAPHS_DIR, name))
+                print(f"✓ Graph saved: {name}")
+
+    # Experiment 9 - search path lengths of the final trees
+    shape_rows = results.get('experiment9')
+    if shape_rows:
+        print("\nCreating Experiment 9 Graph: Shape Profiles...")
+        name = 'experiment9_avg_path_length.png'
+        plot_metric(shape_rows, 'avg_path_length', os.path.join(GRAPHS_DIR, name))
+        print(f"✓ Graph saved: {name}")
+
     print("\n" + "="*60)
-    print("ALL 3 GRAPHS GENERATED SUCCESSFULLY!")
+    print("ALL GRAPHS GENERATED SUCCESSFULLY!")
     print("="*60)
-    
+
     # Print summary
     print("\nSUMMARY:")
     print("-" * 40)
@@ -181,7 +227,36 @@ def generate_all_graphs():
     print(f"Red-Black (random, n=20,000): height = {rb_h[-1]:.1f}")
     print(f"AVL (sorted, n=20,000): height = {avl_h_s[-1]:.1f}")
     print(f"Red-Black (sorted, n=20,000): height = {rb_h_s[-1]:.1f}")
+    for row in btree_rows or ():
+        if row['size'] == 100000:
+            print(f"{row['tree']} (random, n=100,000): height = {row['height']}, "
+                  f"{row['ops_per_sec']:,.0f} searches/s{_comparisons(row)}")
+    for row in skew_rows or ():
+        if row['size'] == 100000:
+            print(f"{row['tree']} ({row['dist']}, n=100,000): {row['ops_per_sec']:,.0f} searches/s"
+                  f"{_comparisons(row)}")
+    for row in shape_rows or ():
+        if row['size'] == 1000000:
+            black = f", black height {row['black_height']}" if row['black_height'] else ""
+            print(f"{row['tree']} (random, n=1,000,000): avg path {row['avg_path_length']:.2f} "
+                  f"(miss {row['avg_miss_path_length']:.2f}, complete tree "
+                  f"{row['min_avg_path_length']:.2f}), max |balance| {row['max_imbalance']}{black}")
 
 
 if __name__ == "__main__":
-    generate_all_graphs()
+    parser = argparse.ArgumentParser(description="Run experiments 4-9 and draw their graphs")
+    parser.add_argument('--from-results', action='store_true',
+                        help=f"redraw from {RESULTS_FILE} instead of rebuilding the trees")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="only run the experiments and save their results")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the experiment cells (0: one per CPU)")
+    args = parser.parse_args()
+    workers = args.workers or None
+
+    if args.no_plots:
+        ensure_graphs_directory()
+        save_results(run_experiments(workers=workers))
+        print(f"\n✓ Results saved: {RESULTS_FILE}")
+    else:
+        generate_all_graphs(load_results() if args.from_results else None, workers)
@@ -0,0 +1,566 @@
+"""
+Benchmark Harness for Tree Structures
+Configurable workloads measuring time, latency, memory and height
+
+Example:
+    python -m src.harness --trees bst avl rb --dists random sorted \
+        --sizes 1000 10000 --mix search=3,insert=1,delete=1 --reps 3 \
+        --json results.json --baseline baseline.json
+
+Add --counters to replay each cell's operations on an instrumented copy of
+the tree and report comparisons, path lengths, rotations and fix-up work
+per operation next to the timings (see src/instrument.py), and --shape to
+profile each final tree's search path lengths, balance and black height
+(see src/analytics.py).
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from .trees import (BST, AVLTree, RedBlackTree, SplayTree, Treap, SkipList, ArrayBST,
+                    FrozenTree, BTree, BPlusTree)
+from .instrument import METRICS, InstrumentedTree, can_instrument
+from .analytics import shape_profile
+
+
+TREES = {
+    'bst': BST,
+    'avl': AVLTree,
+    'rb': RedBlackTree,
+    'splay': SplayTree,
+    'treap': Treap,
+    'skiplist': SkipList,
+    'array-bst': ArrayBST,
+    'frozen': FrozenTree,
+    'btree': BTree,
+    'bplus': BPlusTree,
+}
+
+# Trees with a fanout parameter also accept '<name>-<order>', e.g. btree-16
+ORDERED_TREES = {'btree': BTree, 'bplus': BPlusTree}
+
+# Randomized structures get a fixed seed so their heights repeat across runs
+TREE_OPTIONS = {'treap': {'seed': 0}, 'skiplist': {'seed': 0}}
+
+# Scalar shape_profile() results added to rows by --shape
+SHAPE_FIELDS = ('avg_path_length', 'avg_miss_path_length', 'min_avg_path_length',
+                'max_imbalance', 'black_height')
+
+RANGE_SCAN_LENGTH = 100
+ZIPF_EXPONENT = 1.1
+TEMPORAL_WINDOW = 64
+TEMPORAL_REUSE = 0.9
+
+
+# Key distributions -----------------------------------------------------------
+#
+# Every distribution decides two things: the order in which the initial keys
+# are inserted, and which keys the measured operations touch afterwards.
+
+def _build_random(keys, rng):
+    keys = keys[:]
+    rng.shuffle(keys)
+    return keys
+
+
+def _build_sorted(keys, rng):
+    return keys
+
+
+def _build_reverse(keys, rng):
+    return keys[::-1]
+
+
+def _build_clustered(keys, rng, run=64):
+    runs = [keys[i:i + run] for i in range(0, len(keys), run)]
+    rng.shuffle(runs)
+    return [key for chunk in runs for key in chunk]
+
+
+def _access_random(keys, universe, count, rng):
+    return [rng.randrange(universe) for _ in range(count)]
+
+
+def _access_sorted(keys, universe, count, rng):
+    start = rng.randrange(universe)
+    return [(start + i) % universe for i in range(count)]
+
+
+def _access_reverse(keys, universe, count, rng):
+    start = rng.randrange(universe)
+    return [(start - i) % universe for i in range(count)]
+
+
+def _access_zipf(keys, universe, count, rng):
+    # Popularity rank r is chosen with weight 1 / r**s; ranks map to a random
+    # permutation of the stored keys so hot keys are spread over the tree
+    if not keys:
+        return _access_random(keys, universe, count, rng)
+    hot = keys[:]
+    rng.shuffle(hot)
+    weights = [1 / (rank ** ZIPF_EXPONENT) for rank in range(1, len(hot) + 1)]
+    return rng.choices(hot, weights=weights, k=count)
+
+
+def _access_temporal(keys, universe, count, rng):
+    # Most accesses revisit one of the last TEMPORAL_WINDOW distinct keys;
+    # the rest bring in a new stored key, so the working set drifts slowly
+    if not keys:
+        return _access_random(keys, universe, count, rng)
+    recent = []
+    result = []
+    for _ in range(count):
+        if recent and rng.random() < TEMPORAL_REUSE:
+            key = rng.choice(recent)
+        else:
+            key = rng.choice(keys)
+            recent.append(key)
+            if len(recent) > TEMPORAL_WINDOW:
+                del recent[0]
+        result.append(key)
+    return result
+
+
+def _access_clustered(keys, universe, count, rng, cluster=64, width=256):
+    result = []
+    while len(result) < count:
+        center = rng.randrange(universe)
+        for _ in range(cluster):
+            result.append(min(universe - 1, max(0, center + rng.randint(-width, width))))
+    return result[:count]
+
+
+DISTRIBUTIONS = {
+    'random': (_build_random, _access_random),
+    'sorted': (_build_sorted, _access_sorted),
+    'reverse': (_build_reverse, _access_reverse),
+    'zipf': (_build_random, _access_zipf),
+    'temporal': (_build_random, _access_temporal),
+    'clustered': (_build_clustered, _access_clustered),
+}
+
+
+def make_workload(dist, size, ops, seed, rep=0):
+    """Return (build keys, access keys) for one cell; identical for every tree"""
+    rng = random.Random(f"{seed}:{dist}:{size}:{rep}")
+    build_order, access = DISTRIBUTIONS[dist]
+    universe = size * 3
+    keys = sorted(rng.sample(range(universe), size))
+    return build_order(keys, rng), access(keys, universe, ops, rng)
+
+
+# Operation mixes -------------------------------------------------------------
+
+def parse_mix(text):
+    """Parse 'search=3,insert=1' into {'search': 3.0, 'insert': 1.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def format_mix(mix):
+    return ','.join(f"{name}={weight:g}" for name, weight in mix.items())
+
+
+def _range_scan(tree):
+    def scan(key):
+        return sum(1 for _ in islice(tree.iter_range(key), RANGE_SCAN_LENGTH))
+    return scan
+
+
+OPERATIONS = {
+    'search': lambda tree: tree.search,
+    'insert': lambda tree: tree.insert,
+    'delete': lambda tree: tree.delete,
+    'range': _range_scan,
+}
+
+
+# Measurement -----------------------------------------------------------------
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def resolve_tree(name):
+    """Return (tree class, constructor options) for a tree name"""
+    if name in TREES:
+        return TREES[name], dict(TREE_OPTIONS.get(name, {}))
+    base, _, order = name.rpartition('-')
+    if base in ORDERED_TREES and order.isdigit():
+        return ORDERED_TREES[base], {'order': int(order)}
+    raise ValueError(f"unknown tree {name!r}; choose from {', '.join(TREES)} "
+                     f"or {'/'.join(ORDERED_TREES)}-<order>")
+
+
+def _build(tree_class, keys, options=None):
+    if not hasattr(tree_class, 'insert'):
+        # Static trees are built in one pass
+        return tree_class.from_iterable(keys)
+    tree = tree_class(**(options or {}))
+    for key in keys:
+        tree.insert(key)
+    return tree
+
+
+def counter_fields(mix):
+    """Row fields holding mean counters per operation, e.g. 'insert_rotations'"""
+    return [f"{name}_{metric}" for name in mix for metric in METRICS]
+
+
+def _count_cell(tree_class, options, build_keys, schedule, access_keys):
+    """Replay the measured operations on an instrumented tree; {field: mean}"""
+    tree = InstrumentedTree(tree_class, **options)
+    tree.load(build_keys)
+    runners = {name: OPERATIONS[name](tree) for name in set(schedule)}
+    for name, key in zip(schedule, access_keys):
+        runners[name](key)
+    return {f"{name}_{metric}": tree.stats.mean(name, metric) for name in set(schedule)
+            for metric in tree.stats.metrics}
+
+
+def run_cell(tree_name, dist, size, mix, ops, seed=42, rep=0, measure_memory=True,
+             counters=False, shape=False):
+    """Run one (tree, distribution, size, repetition) cell and return its metrics
+
+    With counters, the operations are replayed untimed on an instrumented
+    tree and their mean counters are added to the row (None where the tree
+    has no such counter). With shape, the SHAPE_FIELDS of the tree as the
+    operations left it are added (None for trees without to_arrays()).
+    """
+    tree_class, options = resolve_tree(tree_name)
+    build_keys, access_keys = make_workload(dist, size, ops, seed, rep)
+
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            _build(tree_class, build_keys, options)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    start = time.perf_counter()
+    tree = _build(tree_class, build_keys, options)
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(f"{seed}:{dist}:{size}:{rep}:mix")
+    names = list(mix)
+    runners = {name: OPERATIONS[name](tree) for name in names}
+    schedule = rng.choices(names, weights=[mix[name] for name in names], k=ops)
+
+    latencies = []
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    for name, key in zip(schedule, access_keys):
+        runner = runners[name]
+        began = clock()
+        runner(key)
+        latencies.append(clock() - began)
+    ops_time = time.perf_counter() - start
+    latencies.sort()
+
+    p50 = _percentile(latencies, 0.50)
+    p99 = _percentile(latencies, 0.99)
+    row = {
+        'tree': tree_name,
+        'dist': dist,
+        'size': size,
+        'mix': format_mix(mix),
+        'ops': ops,
+        'rep': rep,
+        'seed': seed,
+        'build_s': build_time,
+        'build_keys_per_sec': size / build_time if build_time else None,
+        'ops_s': ops_time,
+        'ops_per_sec': ops / ops_time if ops and ops_time else None,
+        'p50_us': p50 / 1000 if p50 is not None else None,
+        'p99_us': p99 / 1000 if p99 is not None else None,
+        'peak_memory_bytes': peak_memory,
+        'height': tree.get_height(),
+    }
+    if counters:
+        row.update(dict.fromkeys(counter_fields(mix)))
+        if can_instrument(tree_class):
+            row.update(_count_cell(tree_class, options, build_keys, schedule, access_keys))
+    if shape:
+        row.update(dict.fromkeys(SHAPE_FIELDS))
+        if hasattr(tree, 'to_arrays'):
+            profile = shape_profile(tree)
+            row.update((field, profile.get(field)) for field in SHAPE_FIELDS)
+    return row
+
+
+def check_supported(trees, mix):
+    """Raise ValueError if a tree lacks a method the operation mix needs"""
+    needs = {'search': 'search', 'insert': 'insert', 'delete': 'delete', 'range': 'iter_range'}
+    for tree in trees:
+        tree_class, _ = resolve_tree(tree)
+        for name in mix:
+            if not hasattr(tree_class, needs[name]):
+                raise ValueError(f"{tree} does not support the {name!r} operation")
+
+
+def sweep_cells(trees, dists, sizes, reps):
+    """All cells of a sweep, in the order results are reported"""
+    return [(tree, dist, size, rep)
+            for dist in dists for size in sizes for tree in trees for rep in range(reps)]
+
+
+def _run_cell(args):
+    return run_cell(*args)
+
+
+def run_sweep(trees, dists, sizes, mix, ops=None, reps=1, seed=42,
+              measure_memory=True, progress=None, workers=1, counters=False, shape=False):
+    """Run every cell of a sweep and return the result rows
+
+    With workers > 1 (None means one per CPU) cells run in a process pool.
+    Each cell seeds its own workload from (seed, dist, size, rep), so the
+    keys and heights match a serial run and rows come back in sweep order.
+    """
+    check_supported(trees, mix)
+    cells = [(tree, dist, size, mix, size if ops is None else ops, seed, rep, measure_memory,
+              counters, shape)
+             for tree, dist, size, rep in sweep_cells(trees, dists, sizes, reps)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    rows = []
+    if workers <= 1 or len(cells) <= 1:
+        for cell in cells:
+            rows.append(_run_cell(cell))
+            if progress:
+                progress(rows[-1])
+        return rows
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(cells))) as pool:
+        for row in pool.map(_run_cell, cells):
+            rows.append(row)
+            if progress:
+                progress(row)
+    return rows
+
+
+def summarize(rows):
+    """Collapse repetitions into one row per cell using medians"""
+    groups = {}
+    for row in rows:
+        cell = (row['tree'], row['dist'], row['size'], row['mix'], row['ops'])
+        groups.setdefault(cell, []).append(row)
+
+    summary = []
+    for cell_rows in groups.values():
+        merged = dict(cell_rows[0])
+        merged.pop('rep')
+        merged['reps'] = len(cell_rows)
+        counted = [field for field in merged if field.endswith(METRICS) or field in SHAPE_FIELDS]
+        for field in ['build_s', 'build_keys_per_sec', 'ops_s', 'ops_per_sec',
+                      'p50_us', 'p99_us', 'peak_memory_bytes', 'height'] + counted:
+            values = sorted(row[field] for row in cell_rows if row[field] is not None)
+            merged[field] = values[len(values) // 2] if values else None
+        summary.append(merged)
+    return summary
+
+
+# Baselines -------------------------------------------------------------------
+
+def _cell_key(row):
+    return (row['tree'], row['dist'], row['size'], row['mix'], row['ops'])
+
+
+def compare(summary, baseline, tolerance=0.10):
+    """Return human-readable regressions of summary against a baseline summary"""
+    reference = {_cell_key(row): row for row in baseline}
+    regressions = []
+    for row in summary:
+        old = reference.get(_cell_key(row))
+        if old is None:
+            continue
+        label = f"{row['tree']}/{row['dist']}/n={row['size']}"
+        for field, higher_is_better in (('ops_per_sec', True), ('build_keys_per_sec', True),
+                                        ('p99_us', False), ('peak_memory_bytes', False)):
+            new_value, old_value = row.get(field), old.get(field)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{label}: {field} {old_value:,.4g} -> {new_value:,.4g} "
+                                   f"({change:+.0%})")
+        if row['height'] != old['height']:
+            regressions.append(f"{label}: height {old['height']} -> {row['height']}")
+    return regressions
+
+
+# Output ----------------------------------------------------------------------
+
+def save_json(path, rows, summary, config):
+    with open(path, 'w') as f:
+        json.dump({'config': config, 'rows': rows, 'summary': summary}, f, indent=2)
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_csv(path, rows):
+    if not rows:
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_summary(summary):
+    print(f"{'tree':<10} {'dist':<10} {'n':>10} {'ops/s':>12} {'p50 us':>9} "
+          f"{'p99 us':>9} {'MB peak':>9} {'height':>7}")
+    for row in summary:
+        memory = (f"{row['peak_memory_bytes'] / 1e6:9.1f}"
+                  if row['peak_memory_bytes'] is not None else f"{'-':>9}")
+        ops_rate = f"{row['ops_per_sec']:12,.0f}" if row['ops_per_sec'] else f"{'-':>12}"
+        p50 = f"{row['p50_us']:9.2f}" if row['p50_us'] is not None else f"{'-':>9}"
+        p99 = f"{row['p99_us']:9.2f}" if row['p99_us'] is not None else f"{'-':>9}"
+        print(f"{row['tree']:<10} {row['dist']:<10} {row['size']:>10,} {ops_rate} "
+              f"{p50} {p99} {memory} {row['height']:>7}")
+    print_counters(summary)
+    print_shapes(summary)
+
+
+COUNTER_LABELS = {'comparisons': 'cmp', 'path_length': 'path', 'rotations': 'rot',
+                  'recolors': 'recolor', 'fixup_loops': 'fixup'}
+
+
+def print_counters(summary):
+    """Mean counters per operation, for rows run with counters"""
+    lines = []
+    for row in summary:
+        for name in OPERATIONS:
+            if f"{name}_comparisons" not in row:
+                continue
+            values = [row[f"{name}_{metric}"] for metric in METRICS]
+            cells = ''.join(f"{value:>10.2f}" if value is not None else f"{'-':>10}"
+                            for value in values)
+            lines.append(f"{row['tree']:<10} {row['dist']:<10} {row['size']:>10,} "
+                         f"{name:<7}{cells}")
+    if lines:
+        print(f"\n{'tree':<10} {'dist':<10} {'n':>10} {'op':<7}"
+              + ''.join(f"{COUNTER_LABELS[metric]:>10}" for metric in METRICS))
+        print('\n'.join(lines))
+
+
+SHAPE_LABELS = {'avg_path_length': 'avg path', 'avg_miss_path_length': 'avg miss',
+                'min_avg_path_length': 'min path', 'max_imbalance': 'max |bf|',
+                'black_height': 'black h'}
+
+
+def print_shapes(summary):
+    """Shape profile of the final trees, for rows run with shape"""
+    lines = []
+    for row in summary:
+        if 'avg_path_length' not in row:
+            continue
+        values = [row[field] for field in SHAPE_FIELDS]
+        cells = ''.join(f"{value:>10.2f}" if isinstance(value, float) else
+                        f"{value:>10}" if value is not None else f"{'-':>10}"
+                        for value in values)
+        lines.append(f"{row['tree']:<10} {row['dist']:<10} {row['size']:>10,} {cells}")
+    if lines:
+        print(f"\n{'tree':<10} {'dist':<10} {'n':>10} "
+              + ''.join(f"{SHAPE_LABELS[field]:>10}" for field in SHAPE_FIELDS))
+        print('\n'.join(lines))
+
+
+def _tree_name(name):
+    try:
+        resolve_tree(name)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return name
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark tree structures")
+    parser.add_argument('--trees', nargs='+', default=['bst', 'avl', 'rb'], type=_tree_name,
+                        help=f"{', '.join(TREES)}, or btree-<order> / bplus-<order>")
+    parser.add_argument('--dists', nargs='+', default=['random'], choices=list(DISTRIBUTIONS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('search'),
+                        help="operation weights, e.g. search=3,insert=1,delete=1,range=1")
+    parser.add_argument('--ops', type=int, default=None,
+                        help="measured operations per cell (default: the cell size)")
+    parser.add_argument('--reps', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes (0: one per CPU); parallel cells share "
+                             "the machine, so compare timings only at equal worker counts")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced build")
+    parser.add_argument('--counters', action='store_true',
+                        help="also count comparisons, rotations and fix-ups per operation")
+    parser.add_argument('--shape', action='store_true',
+                        help="also profile path lengths, balance and black height (needs NumPy)")
+    parser.add_argument('--json', help="write rows and summary to this JSON file")
+    parser.add_argument('--csv', help="write per-repetition rows to this CSV file")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="relative change that counts as a regression")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        check_supported(args.trees, args.mix)
+    except ValueError as error:
+        parser.error(str(error))
+    config = {
+        'trees': args.trees, 'dists': args.dists, 'sizes': args.sizes,
+        'mix': format_mix(args.mix), 'ops': args.ops, 'reps': args.reps, 'seed': args.seed,
+        'workers': args.workers, 'counters': args.counters, 'shape': args.shape,
+    }
+
+    def progress(row):
+        print(f"  {row['tree']:<10} {row['dist']:<10} n={row['size']:<10,} rep {row['rep']}",
+              file=sys.stderr)
+
+    rows = run_sweep(args.trees, args.dists, args.sizes, args.mix, args.ops, args.reps,
+                     args.seed, not args.no_memory, progress, args.workers or None,
+                     args.counters, args.shape)
+    summary = summarize(rows)
+    print_summary(summary)
+
+    if args.json:
+        save_json(args.json, rows, summary, config)
+    if args.csv:
+        save_csv(args.csv, rows)
+
+    if args.baseline:
+        regressions = compare(summary, load_json(args.baseline)['summary'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
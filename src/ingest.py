@@ -0,0 +1,239 @@
+"""
+Streaming Ingest of Keys from Large Files
+Builds trees from text/CSV, packed binary or .npy files in bounded memory
+
+Files are mapped with mmap (numpy.memmap for .npy) and read one chunk of
+keys at a time, so no list of the whole file is ever built. A chunk goes
+either straight into the tree with insert_many, or into a sorted run on
+disk; the runs are then merged lazily into the linear-time balanced build.
+
+Example:
+    source = KeySource('keys.csv', column=2, header=True)
+    tree = ingest(AVLTree(), source, progress=print_progress)
+    tree = build_sorted(RedBlackTree, KeySource('keys.npy'), progress=print_progress)
+"""
+
+import heapq
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+from array import array
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only used for .npy files
+    np = None
+
+
+CHUNK_SIZE = 1_000_000
+TEXT_SUFFIXES = ('.txt', '.csv', '.tsv')
+RUN_BLOCK = 4096  # keys per pickled block in runs of non-numeric keys
+
+
+class KeySource:
+    """Chunks of keys streamed from one file
+
+    The format comes from the suffix: .npy, text (.txt/.csv/.tsv) or packed
+    binary (anything else, machine-native typecode items). Text holds one
+    key per line, or a delimited row with the key in column; parse gets the
+    field as bytes (int and float accept bytes, use bytes.decode for
+    strings). Quoted CSV fields are not supported. position and size are
+    in bytes and drive progress reports.
+    """
+    def __init__(self, path, chunk_size=CHUNK_SIZE, fmt=None, typecode='q', column=None,
+                 delimiter=',', header=False, parse=int):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if fmt is None:
+            suffix = os.path.splitext(path)[1].lower()
+            fmt = 'npy' if suffix == '.npy' else 'text' if suffix in TEXT_SUFFIXES else 'binary'
+        if fmt not in ('npy', 'text', 'binary'):
+            raise ValueError(f"unknown format {fmt!r}; choose from npy, text, binary")
+        if fmt == 'npy' and np is None:
+            raise ImportError("reading .npy files needs NumPy")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.fmt = fmt
+        self.typecode = typecode
+        self.column = column
+        self.delimiter = delimiter.encode() if isinstance(delimiter, str) else delimiter
+        self.header = header
+        self.parse = parse
+        self.size = os.path.getsize(path)
+        self.position = 0
+
+    def __iter__(self):
+        self.position = 0
+        if self.fmt == 'npy':
+            return self._npy_chunks()
+        if not self.size:
+            return iter(())
+        return self._text_chunks() if self.fmt == 'text' else self._binary_chunks()
+
+    def _binary_chunks(self):
+        itemsize = array(self.typecode).itemsize
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            step = self.chunk_size * itemsize
+            usable = len(mm) - len(mm) % itemsize
+            for start in range(0, usable, step):
+                chunk = array(self.typecode)
+                chunk.frombytes(mm[start:min(start + step, usable)])
+                self.position = start + len(chunk) * itemsize
+                yield chunk
+
+    def _npy_chunks(self):
+        keys = np.load(self.path, mmap_mode='r')
+        if keys.ndim != 1:
+            raise ValueError(f"{self.path} holds a {keys.ndim}-D array; keys must be 1-D")
+        for start in range(0, len(keys), self.chunk_size):
+            chunk = keys[start:start + self.chunk_size]
+            self.position = keys.offset + (start + len(chunk)) * keys.itemsize
+            yield chunk.tolist()
+
+    def _text_chunks(self):
+        parse, column, delimiter = self.parse, self.column, self.delimiter
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            if self.header:
+                start = mm.find(b'\n') + 1 or len(mm)
+            # Each window covers about chunk_size lines, sized from the lines
+            # seen so far; it always ends at a line break
+            sample = mm[start:start + 65536]
+            line_bytes = max(1, len(sample) // max(1, sample.count(b'\n')))
+            while start < len(mm):
+                end = mm.find(b'\n', min(len(mm), start + self.chunk_size * line_bytes))
+                end = len(mm) if end == -1 else end + 1
+                block = mm[start:end]
+                if column is None:
+                    chunk = [parse(field) for field in block.split()]
+                else:
+                    chunk = [parse(line.split(delimiter)[column])
+                             for line in block.splitlines() if line.strip()]
+                line_bytes = max(1, len(block) // max(1, block.count(b'\n')))
+                start = self.position = end
+                yield chunk
+
+
+def print_progress(stage, done, total):
+    """Progress callback that rewrites one stderr line per report"""
+    percent = 100 * done / total if total else 100.0
+    print(f"\r  {stage:<6} {percent:5.1f}%  ({done:,} / {total:,})", end='', file=sys.stderr,
+          flush=True)
+    if done >= total:
+        print(file=sys.stderr)
+
+
+def ingest(tree, source, progress=None):
+    """Insert every key of source into tree one chunk at a time and return the tree
+
+    Trees without insert_many take the keys one by one; persistent trees
+    return a new version from insert_many, which is what comes back then.
+    Progress is reported as ('insert', bytes read, file size).
+    """
+    insert_many = getattr(tree, 'insert_many', None)
+    for chunk in source:
+        if insert_many is None:
+            for key in chunk:
+                tree.insert(key)
+        else:
+            updated = insert_many(chunk)
+            if updated is not None:
+                tree, insert_many = updated, updated.insert_many
+        if progress:
+            progress('insert', source.position, source.size)
+    return tree
+
+
+def _write_run(directory, index, keys):
+    """Write sorted keys to a run file; return (path, typecode, count)"""
+    path = os.path.join(directory, f'run{index:06d}')
+    if isinstance(keys, array) and keys.typecode in ('q', 'd'):
+        packed = keys
+    else:
+        try:
+            packed = array('q', keys)
+        except (TypeError, OverflowError):
+            packed = array('d', keys) if all(type(key) is float for key in keys) else None
+    with open(path, 'wb') as f:
+        if packed is not None:
+            packed.tofile(f)
+            return path, packed.typecode, len(packed)
+        for start in range(0, len(keys), RUN_BLOCK):
+            pickle.dump(keys[start:start + RUN_BLOCK], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path, 'O', len(keys)
+
+
+def _read_run(path, typecode, count):
+    """Yield a run's keys lazily; packed runs are read through mmap"""
+    if not count:
+        return
+    with open(path, 'rb') as f:
+        if typecode == 'O':
+            for _ in range(0, count, RUN_BLOCK):
+                yield from pickle.load(f)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm).cast(typecode)
+            try:
+                yield from view
+            finally:
+                view.release()
+
+
+def _merged_unique(runs, total, progress, every):
+    """k-way merge of sorted runs with duplicates dropped"""
+    previous = object()
+    done = 0
+    for key in heapq.merge(*[_read_run(*run) for run in runs]):
+        done += 1
+        if progress and not done % every:
+            progress('merge', done, total)
+        if key != previous:
+            previous = key
+            yield key
+    if progress:
+        progress('merge', total, total)
+
+
+def build_sorted(tree_class, source, tmpdir=None, progress=None, **options):
+    """Build a tree_class tree from source by external sort and a balanced build
+
+    Each chunk is sorted into a run file under tmpdir (the system default if
+    None); the runs are merged lazily and the unique keys feed from_sorted,
+    or insert() for trees without it. The merge holds one key per run, so
+    memory stays near the tree plus one chunk. Progress is reported as
+    ('sort', bytes read, file size), then ('merge', keys merged, total keys).
+    """
+    with tempfile.TemporaryDirectory(dir=tmpdir) as directory:
+        runs = []
+        for chunk in source:
+            runs.append(_write_run(directory, len(runs), sorted(set(chunk))))
+            if progress:
+                progress('sort', source.position, source.size)
+        total = sum(count for _, _, count in runs)
+        keys = _merged_unique(runs, total, progress, source.chunk_size)
+        if hasattr(tree_class, 'from_sorted'):
+            return tree_class.from_sorted(keys, **options)
+        tree = tree_class(**options)
+        for key in keys:
+            tree.insert(key)
+        return tree
+
+
+def write_keys(path, keys, typecode='q'):
+    """Write keys as packed binary typecode items, or as a NumPy array for a .npy path"""
+    if path.endswith('.npy'):
+        if np is None:
+            raise ImportError("writing .npy files needs NumPy")
+        np.save(path, np.asarray(keys, dtype=typecode))
+        return
+    keys = iter(keys)
+    with open(path, 'wb') as f:
+        while True:
+            block = array(typecode, islice(keys, CHUNK_SIZE))
+            if not block:
+                break
+            block.tofile(f)
@@ -0,0 +1,316 @@
+"""
+Operation Counters for the Tree Hot Paths
+Comparisons, rotations, fix-up work and search path lengths per operation
+
+The classes in trees.py are not touched: rotations and fix-up loops are
+counted in subclasses made by instrumented(), and comparisons by storing
+keys wrapped in a type whose comparison operators count themselves. An
+ordinary tree therefore runs exactly the code it always did.
+
+Example:
+    tree = InstrumentedTree(RedBlackTree)
+    for key in keys:
+        tree.insert(key)
+    tree.stats.mean('insert', 'rotations')
+    tree.stats.histogram('search', 'comparisons')   # [(count, operations), ...]
+
+    counters = Counters()
+    CountedKey = counting_key_type(counters)   # for counting in hand-built trees
+"""
+
+from collections import Counter
+from .trees import BST, AVLTree, RedBlackTree, ArrayBST, FrozenTree
+
+
+METRICS = ('comparisons', 'path_length', 'rotations', 'recolors', 'fixup_loops')
+
+
+class Counters:
+    """Running totals for the operation in progress"""
+    __slots__ = METRICS
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        for name in METRICS:
+            setattr(self, name, 0)
+
+
+class OperationStats:
+    """Per-operation histograms of every counter a tree supports"""
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.counters = Counters()
+        self._histograms = {}
+
+    def record(self, op):
+        """File the running counters under op and start the next operation"""
+        counters = self.counters
+        histograms = self._histograms.get(op)
+        if histograms is None:
+            histograms = self._histograms[op] = {name: Counter() for name in self.metrics}
+        for name in self.metrics:
+            histograms[name][getattr(counters, name)] += 1
+        counters.reset()
+
+    def clear(self):
+        self._histograms.clear()
+        self.counters.reset()
+
+    def operations(self):
+        """Operation names that have been recorded"""
+        return list(self._histograms)
+
+    def count(self, op):
+        """Number of recorded op operations"""
+        histograms = self._histograms.get(op)
+        return sum(histograms[self.metrics[0]].values()) if histograms else 0
+
+    def histogram(self, op, metric):
+        """Sorted (counter value, number of operations) pairs for one op and metric"""
+        return sorted(self._histograms.get(op, {}).get(metric, Counter()).items())
+
+    def mean(self, op, metric):
+        """Average counter value per op operation (None if none were recorded)"""
+        histogram = self._histograms.get(op, {}).get(metric)
+        if not histogram:
+            return None
+        total = sum(value * times for value, times in histogram.items())
+        return total / sum(histogram.values())
+
+    def summary(self):
+        """{op: {metric: mean}} for every recorded operation"""
+        return {op: {metric: self.mean(op, metric) for metric in self.metrics}
+                for op in self._histograms}
+
+
+def counting_key_type(counters):
+    """Key wrapper class whose comparisons add to counters.comparisons
+
+    Store CountedKey(key) in any tree to count the comparisons it makes;
+    the raw key is kept in .key. InstrumentedTree wraps keys this way.
+    """
+    class CountedKey:
+        __slots__ = ('key',)
+
+        def __init__(self, key):
+            self.key = key
+
+        def __lt__(self, other):
+            counters.comparisons += 1
+            return self.key < other.key
+
+        def __gt__(self, other):
+            counters.comparisons += 1
+            return self.key > other.key
+
+        def __le__(self, other):
+            counters.comparisons += 1
+            return self.key <= other.key
+
+        def __ge__(self, other):
+            counters.comparisons += 1
+            return self.key >= other.key
+
+        def __eq__(self, other):
+            counters.comparisons += 1
+            return self.key == other.key
+
+        def __ne__(self, other):
+            counters.comparisons += 1
+            return self.key != other.key
+
+        def __hash__(self):
+            return hash(self.key)
+
+        def __repr__(self):
+            return repr(self.key)
+
+    return CountedKey
+
+
+def _counted(method, metric):
+    def wrapper(self, *args):
+        counters = self._counters
+        setattr(counters, metric, getattr(counters, metric) + 1)
+        return method(self, *args)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = f"{method.__qualname__}, counted in {metric}"
+    return wrapper
+
+
+def _counted_fix_insert(self, k):
+    """RedBlackTree._fix_insert with its loop passes and recolorings counted"""
+    # Keep in step with RedBlackTree._fix_insert (tests/test_instrument.py
+    # checks both build the same trees)
+    counters = self._counters
+    while k.parent and k.parent.color == 1:
+        counters.fixup_loops += 1
+        if k.parent == k.parent.parent.right:
+            u = k.parent.parent.left  # uncle
+            if u.color == 1:
+                u.color = 0
+                k.parent.color = 0
+                k.parent.parent.color = 1
+                counters.recolors += 3
+                k = k.parent.parent
+            else:
+                if k == k.parent.left:
+                    k = k.parent
+                    self._rotate_right(k)
+                k.parent.color = 0
+                k.parent.parent.color = 1
+                counters.recolors += 2
+                self._rotate_left(k.parent.parent)
+        else:
+            u = k.parent.parent.right  # uncle
+            if u.color == 1:
+                u.color = 0
+                k.parent.color = 0
+                k.parent.parent.color = 1
+                counters.recolors += 3
+                k = k.parent.parent
+            else:
+                if k == k.parent.right:
+                    k = k.parent
+                    self._rotate_left(k)
+                k.parent.color = 0
+                k.parent.parent.color = 1
+                counters.recolors += 2
+                self._rotate_right(k.parent.parent)
+        if k == self.root:
+            break
+    if self.root.color:
+        counters.recolors += 1
+    self.root.color = 0
+
+
+def tree_metrics(tree_class):
+    """The counters that are meaningful for tree_class, in METRICS order"""
+    metrics = ['comparisons']
+    if issubclass(tree_class, (BST, RedBlackTree)):
+        metrics.append('path_length')
+    if hasattr(tree_class, '_rotate_left'):
+        metrics.append('rotations')
+    if issubclass(tree_class, RedBlackTree):
+        metrics.append('recolors')
+    if issubclass(tree_class, (AVLTree, RedBlackTree)):
+        metrics.append('fixup_loops')
+    return tuple(metrics)
+
+
+_INSTRUMENTED = {}
+
+
+def can_instrument(tree_class):
+    """Array-backed trees store packed keys, which cannot be wrapped for counting"""
+    return not issubclass(tree_class, (ArrayBST, FrozenTree))
+
+
+def instrumented(tree_class):
+    """Subclass of tree_class that counts rotations and fix-up work in self._counters
+
+    AVL fix-up loops are the levels retraced after an update; Red-Black
+    ones are the passes of the insert fix-up (deletes count rotations only).
+    """
+    if not can_instrument(tree_class):
+        raise ValueError(f"{tree_class.__name__} stores packed keys and cannot be instrumented")
+    subclass = _INSTRUMENTED.get(tree_class)
+    if subclass is None:
+        namespace = {'__module__': __name__, '_counters': Counters()}
+        for name in ('_rotate_left', '_rotate_right'):
+            if hasattr(tree_class, name):
+                namespace[name] = _counted(getattr(tree_class, name), 'rotations')
+        if issubclass(tree_class, AVLTree):
+            namespace['_rebalance'] = _counted(tree_class._rebalance, 'fixup_loops')
+        if issubclass(tree_class, RedBlackTree):
+            namespace['_fix_insert'] = _counted_fix_insert
+        subclass = type(f'Instrumented{tree_class.__name__}', (tree_class,), namespace)
+        _INSTRUMENTED[tree_class] = subclass
+    return subclass
+
+
+class InstrumentedTree:
+    """A tree whose searches, inserts, deletes and range scans record their counters
+
+    Keys go in and come out unwrapped. Path length is the number of nodes
+    the operation's descent visits, measured before it runs (binary trees
+    only). A range scan is recorded when its iterator is exhausted or closed.
+    """
+    def __init__(self, tree_class, **options):
+        self.stats = OperationStats(tree_metrics(tree_class))
+        self.tree = instrumented(tree_class)(**options)
+        self.tree._counters = self.stats.counters
+        self._wrap = counting_key_type(self.stats.counters)
+        self._binary = 'path_length' in self.stats.metrics
+
+    def __len__(self):
+        return len(self.tree)
+
+    def load(self, keys):
+        """Insert keys without recording anything, e.g. to build the starting tree"""
+        wrap, insert = self._wrap, self.tree.insert
+        for key in keys:
+            insert(wrap(key))
+        self.stats.counters.reset()
+
+    def _path_length(self, key):
+        # Raw keys are compared here so the walk itself is not counted
+        tree = self.tree
+        nil = tree._nil
+        node = tree.root
+        length = 0
+        while node is not nil:
+            length += 1
+            stored = node.key.key
+            if key < stored:
+                node = node.left
+            elif key > stored:
+                node = node.right
+            else:
+                break
+        return length
+
+    def _run(self, op, method, key):
+        counters = self.stats.counters
+        counters.reset()
+        if self._binary:
+            counters.path_length = self._path_length(key)
+        result = method(self._wrap(key))
+        self.stats.record(op)
+        return result
+
+    def search(self, key):
+        """Return True if key is in the tree"""
+        found = self._run('search', self.tree.search, key)
+        return found is not None and found is not self.tree._nil if self._binary else bool(found)
+
+    def insert(self, key):
+        self._run('insert', self.tree.insert, key)
+
+    def delete(self, key):
+        self._run('delete', self.tree.delete, key)
+
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi"""
+        counters = self.stats.counters
+        counters.reset()
+        if self._binary and lo is not None:
+            counters.path_length = self._path_length(lo)
+        wrap = self._wrap
+        try:
+            for key in self.tree.iter_range(None if lo is None else wrap(lo),
+                                            None if hi is None else wrap(hi)):
+                yield key.key
+        finally:
+            self.stats.record('range')
+
+    def inorder(self):
+        return [key.key for key in self.tree.inorder()]
+
+    def get_height(self):
+        return self.tree.get_height()
+
+    def validate(self):
+        self.tree.validate()
@@ -0,0 +1,98 @@
+"""
+Plotting for Experiment and Harness Results
+matplotlib is only imported when a chart is drawn
+
+Example:
+    python -m src.plots results.json --metric ops_per_sec --out graphs
+"""
+
+import argparse
+import math
+import os
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _finish(plt, title, path, legend_size=10):
+    plt.xlabel('Number of Keys (n)', fontsize=12)
+    plt.ylabel('Tree Height', fontsize=12)
+    plt.title(title, fontsize=14)
+    plt.legend(fontsize=legend_size)
+    plt.grid(True, alpha=0.3)
+    plt.xscale('log')
+    plt.tight_layout()
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def plot_bst_height(sizes, heights, log_heights, path):
+    """Graph 1: BST height against log2(n) and n"""
+    plt = _pyplot()
+    plt.figure(figsize=(10, 6))
+    plt.plot(sizes, heights, 'bo-', label='BST Height (Experimental)', linewidth=2, markersize=8)
+    plt.plot(sizes, log_heights, 'r--', label='log₂(n) (Theoretical O(log n))', linewidth=2)
+    plt.plot(sizes, sizes, 'g:', label='n (Theoretical O(n))', linewidth=1, alpha=0.3)
+    _finish(plt, 'Experiment 4: BST Height vs Number of Keys\n(Random Keys, Thousands of Elements)',
+            path, legend_size=11)
+
+
+def plot_avl_rb_heights(sizes, avl_heights, rb_heights, avl_bounds, rb_bounds, title, path,
+                        label_suffix='Experimental'):
+    """Graphs 2 and 3: AVL and Red-Black heights against their bounds"""
+    plt = _pyplot()
+    plt.figure(figsize=(10, 6))
+    plt.plot(sizes, avl_heights, 'go-', label=f'AVL Height ({label_suffix})', linewidth=2, markersize=8)
+    plt.plot(sizes, rb_heights, 'bo-', label=f'Red-Black Height ({label_suffix})', linewidth=2, markersize=8)
+    plt.plot(sizes, avl_bounds, 'g--', label='Upper Bound: 1.44·log₂(n)', linewidth=1.5, alpha=0.7)
+    plt.plot(sizes, rb_bounds, 'b--', label='Upper Bound: 2·log₂(n)', linewidth=1.5, alpha=0.7)
+    plt.plot(sizes, [math.log2(s) for s in sizes], 'k:', label='Lower Bound: log₂(n)', linewidth=1.5, alpha=0.5)
+    _finish(plt, title, path)
+
+
+def plot_metric(summary, metric, path):
+    """One line per (tree, distribution) of a harness summary metric against n"""
+    plt = _pyplot()
+    series = {}
+    for row in summary:
+        if row.get(metric) is not None:
+            series.setdefault(f"{row['tree']} / {row['dist']}", []).append((row['size'], row[metric]))
+
+    plt.figure(figsize=(10, 6))
+    for label, points in series.items():
+        points.sort()
+        plt.plot([p[0] for p in points], [p[1] for p in points], 'o-', label=label, linewidth=2)
+    plt.xlabel('Number of Keys (n)', fontsize=12)
+    plt.ylabel(metric, fontsize=12)
+    plt.title(f'{metric} vs Number of Keys', fontsize=14)
+    plt.legend(fontsize=10)
+    plt.grid(True, alpha=0.3)
+    plt.xscale('log')
+    plt.tight_layout()
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def main(argv=None):
+    from .harness import load_json
+
+    parser = argparse.ArgumentParser(description="Plot saved harness results")
+    parser.add_argument('results', help="JSON file written by src.harness --json")
+    parser.add_argument('--metric', nargs='+', default=['ops_per_sec', 'height'])
+    parser.add_argument('--out', default='.', help="directory for the PNG files")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = load_json(args.results)['summary']
+    for metric in args.metric:
+        path = os.path.join(args.out, f"{metric}.png")
+        plot_metric(summary, metric, path)
+        print(f"✓ {path}")
+
+
+if __name__ == "__main__":
+    main()
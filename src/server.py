@@ -0,0 +1,630 @@
+"""
+Asyncio Index Server
+Serves one tree to other processes over a local socket with a compact binary protocol
+
+The tree lives in the server's event loop and is touched by no other
+thread, so it needs no locks. Clients pipeline: any number of requests may
+be in flight on one connection, and the server answers each burst of
+frames it reads with a single write. Writes from all connections are
+coalesced into one batch per event-loop pass (or per coalesce_delay) and
+applied with insert_many/delete_many; a connection's own reads always see
+its earlier writes.
+
+Example:
+    server = await IndexServer(RedBlackTree.from_sorted(keys, order_stats=True)).start(port=0)
+    async with ClientPool(port=server.port, size=4) as pool:
+        await pool.insert(42)
+        found = await asyncio.gather(*(pool.contains(key) for key in keys))
+        await pool.range(10, 50), await pool.rank(42)
+
+    python -m src.server serve --tree rb --size 1000000 --port 7878
+    python -m src.server load --port 7878 --clients 1 4 16 64
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import struct
+import sys
+import time
+from itertools import groupby, islice
+from operator import itemgetter
+from .trees import BST, AVLTree, RedBlackTree, SplayTree
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7878
+
+# Frames: a header (payload length, request id, opcode or status), then the payload.
+# Keys are signed 64-bit integers in network byte order; values are raw bytes.
+REQUEST = struct.Struct('!IIB')
+RESPONSE = struct.Struct('!IIB')
+KEY = struct.Struct('!q')
+RANGE = struct.Struct('!BqqI')  # flags (1: lo given, 2: hi given), lo, hi, limit (0: none)
+MAX_PAYLOAD = 64 << 20
+
+GET, INSERT, DELETE, RANGE_SCAN, RANK, CONTAINS_MANY, INSERT_MANY, DELETE_MANY = range(1, 9)
+WRITES = {INSERT: INSERT, INSERT_MANY: INSERT, DELETE: DELETE, DELETE_MANY: DELETE}
+OK, NOT_FOUND, ERROR = range(3)
+
+READ_SIZE = 1 << 16
+SEND_BUFFER = 1 << 20  # clients wait for the socket past this much unsent data
+
+SERVED_TREES = {'bst': BST, 'avl': AVLTree, 'rb': RedBlackTree, 'splay': SplayTree}
+
+_ABSENT = object()
+
+
+class ServerError(RuntimeError):
+    """A request the server answered with an error"""
+
+
+def _pack_key(key):
+    try:
+        return KEY.pack(key)
+    except struct.error:
+        raise ValueError("keys must be 64-bit integers") from None
+
+
+def _pack_keys(keys):
+    keys = list(keys)
+    try:
+        return struct.pack(f'!{len(keys)}q', *keys)
+    except struct.error:
+        raise ValueError("keys must be 64-bit integers") from None
+
+
+def _unpack_keys(payload):
+    if len(payload) % 8:
+        raise ValueError("key payload is not a whole number of 64-bit keys")
+    return struct.unpack(f'!{len(payload) // 8}q', payload)
+
+
+def _split_frames(buffer):
+    """Complete (request id, opcode, payload) frames at the front of buffer, and bytes used"""
+    frames = []
+    start = 0
+    header = REQUEST.size
+    while len(buffer) - start >= header:
+        length, request_id, opcode = REQUEST.unpack_from(buffer, start)
+        if length > MAX_PAYLOAD:
+            raise ValueError(f"frame of {length:,} bytes exceeds the {MAX_PAYLOAD:,} byte limit")
+        end = start + header + length
+        if end > len(buffer):
+            break
+        frames.append((request_id, opcode, bytes(buffer[start + header:end])))
+        start = end
+    return frames, start
+
+
+class IndexServer:
+    """Hosts one tree (BST, AVLTree, RedBlackTree or SplayTree) for socket clients
+
+    get, insert and delete take single keys; contains_many, insert_many and
+    delete_many take packed batches. Rank needs an order-statistics tree and
+    insert values a mapping tree. A write is acknowledged once the batch
+    holding it has been applied; batches hold at most max_batch keys.
+    """
+    def __init__(self, tree, max_batch=4096, coalesce_delay=0.0):
+        self.tree = tree
+        self.max_batch = max_batch
+        self.coalesce_delay = coalesce_delay
+        self.host = self.port = None
+        self.requests = 0
+        self.batches = 0
+        self.batched_writes = 0
+        self._mapping = getattr(tree, '_mapping', False)
+        self._server = None
+        self._connections = {}  # writer -> the task serving it
+        self._pending = []
+        self._pending_keys = 0
+        self._batch = None
+        self._flush_handle = None
+        self._reads = {
+            GET: self._get,
+            RANGE_SCAN: self._range,
+            RANK: self._rank,
+            CONTAINS_MANY: self._contains_many,
+        }
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start listening (port 0 picks a free port, left in self.port) and return self"""
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stop listening, apply queued writes and drop every open connection"""
+        self._server.close()
+        self._flush()
+        for writer in self._connections:
+            writer.close()
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return self if self._server else await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _serve_connection(self, reader, writer):
+        buffer = bytearray()
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                buffer += data
+                frames, used = _split_frames(buffer)
+                del buffer[:used]
+                if frames:
+                    await self._answer(frames, writer)
+        except (ConnectionError, ValueError):
+            pass  # the peer went away or sent an oversized frame; drop the connection
+        finally:
+            del self._connections[writer]
+            writer.close()
+
+    async def _answer(self, frames, writer):
+        """Run one burst of pipelined requests and send all their responses in one write"""
+        self.requests += len(frames)
+        responses = []
+        batch = None  # the write batch holding this connection's latest write
+        for request_id, opcode, payload in frames:
+            try:
+                if opcode in WRITES:
+                    batch = self._submit(WRITES[opcode], opcode, payload)
+                    responses.append((request_id, batch, b''))
+                    continue
+                read = self._reads.get(opcode)
+                if read is None:
+                    raise ValueError(f"unknown opcode {opcode}")
+                if batch is not None and not batch.done():
+                    self._flush()
+                status, body = read(payload)
+            except Exception as error:
+                status, body = ERROR, str(error).encode()
+            responses.append((request_id, status, body))
+        if batch is not None:
+            await asyncio.wait((batch,))
+
+        out = bytearray()
+        for request_id, status, body in responses:
+            if isinstance(status, asyncio.Future):
+                error = status.exception()
+                status, body = (ERROR, str(error).encode()) if error else (OK, b'')
+            out += RESPONSE.pack(len(body), request_id, status)
+            out += body
+        writer.write(out)
+        await writer.drain()
+
+    # Writes ------------------------------------------------------------------
+
+    def _submit(self, kind, opcode, payload):
+        """Queue a write for the next batch and return that batch's future"""
+        if opcode in (INSERT, DELETE):
+            keys = KEY.unpack_from(payload) if len(payload) >= KEY.size else _unpack_keys(payload)
+            value = payload[KEY.size:] if opcode == INSERT and len(payload) > KEY.size else None
+            if value is not None and not self._mapping:
+                raise ValueError("storing values needs a tree built with mapping=True")
+        else:
+            keys, value = _unpack_keys(payload), None
+        if not self._pending:
+            loop = asyncio.get_running_loop()
+            self._batch = loop.create_future()
+            if self.coalesce_delay:
+                self._flush_handle = loop.call_later(self.coalesce_delay, self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+        batch = self._batch
+        self._pending.append((kind, keys, value))
+        self._pending_keys += len(keys)
+        if self._pending_keys >= self.max_batch:
+            self._flush()
+        return batch
+
+    def _flush(self):
+        """Apply every queued write, in arrival order, and resolve their batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, batch = self._pending, self._batch
+        if not pending:
+            return
+        self._pending, self._pending_keys, self._batch = [], 0, None
+        self.batches += 1
+        self.batched_writes += len(pending)
+        try:
+            self._apply(pending)
+        except Exception as error:
+            batch.set_exception(error)
+        else:
+            batch.set_result(None)
+
+    def _apply(self, pending):
+        # Consecutive writes of one kind commute (a key is either in the
+        # tree or not), so each run goes in as one batch call
+        tree = self.tree
+        for kind, run in groupby(pending, key=itemgetter(0)):
+            if kind == DELETE:
+                tree.delete_many([key for _, keys, _ in run for key in keys])
+            elif self._mapping:
+                for _, keys, value in run:
+                    for key in keys:
+                        if value is None:
+                            tree.setdefault(key)
+                        else:
+                            tree[key] = value
+            else:
+                tree.insert_many([key for _, keys, _ in run for key in keys])
+
+    # Reads -------------------------------------------------------------------
+
+    def _get(self, payload):
+        value = self.tree.get(KEY.unpack(payload)[0], _ABSENT)
+        if value is _ABSENT:
+            return NOT_FOUND, b''
+        return OK, value if self._mapping and value is not None else b''
+
+    def _range(self, payload):
+        flags, lo, hi, limit = RANGE.unpack(payload)
+        keys = self.tree.iter_range(lo if flags & 1 else None, hi if flags & 2 else None)
+        return OK, _pack_keys(islice(keys, limit or None))
+
+    def _rank(self, payload):
+        return OK, KEY.pack(self.tree.rank(KEY.unpack(payload)[0]))
+
+    def _contains_many(self, payload):
+        return OK, bytes(bytearray(self.tree.contains_many(list(_unpack_keys(payload)))))
+
+
+class IndexClient:
+    """One connection to an IndexServer with any number of requests in flight
+
+    Concurrent calls pipeline on the connection; the frames written in one
+    event-loop pass leave in a single send. Error responses raise
+    ServerError, and a lost connection fails every waiting call with
+    ConnectionError.
+    """
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._waiting = {}
+        self._next_id = 0
+        self._outgoing = bytearray()
+        self._sending = False
+        self.closed = False
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return cls(*await asyncio.open_connection(host, port))
+
+    @property
+    def in_flight(self):
+        """Requests sent and not yet answered"""
+        return len(self._waiting)
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            self._send()
+            self._writer.close()
+            self._receiver.cancel()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _receive(self):
+        reader, waiting = self._reader, self._waiting
+        try:
+            while True:
+                length, request_id, status = RESPONSE.unpack(await reader.readexactly(RESPONSE.size))
+                body = await reader.readexactly(length) if length else b''
+                future = waiting.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((status, body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.closed = True
+            for future in waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection to the index server was lost"))
+            waiting.clear()
+
+    def _send(self):
+        self._sending = False
+        if self._outgoing and not self._writer.is_closing():
+            self._writer.write(self._outgoing)
+        self._outgoing = bytearray()
+
+    async def _request(self, opcode, payload=b''):
+        if self.closed:
+            raise ConnectionError("connection to the index server is closed")
+        request_id = self._next_id
+        self._next_id = (request_id + 1) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        self._outgoing += REQUEST.pack(len(payload), request_id, opcode)
+        self._outgoing += payload
+        if not self._sending:
+            self._sending = True
+            asyncio.get_running_loop().call_soon(self._send)
+        if self._writer.transport.get_write_buffer_size() > SEND_BUFFER:
+            await self._writer.drain()
+        status, body = await future
+        if status == ERROR:
+            raise ServerError(body.decode(errors='replace'))
+        return status, body
+
+    async def get(self, key, default=None):
+        """Value stored under key (b'' in a set tree), or default if key is absent"""
+        status, body = await self._request(GET, _pack_key(key))
+        return default if status == NOT_FOUND else body
+
+    async def contains(self, key):
+        status, _ = await self._request(GET, _pack_key(key))
+        return status == OK
+
+    async def insert(self, key, value=None):
+        """Insert key, storing value (bytes) if the server's tree is a mapping"""
+        await self._request(INSERT, _pack_key(key) + (value or b''))
+
+    async def delete(self, key):
+        await self._request(DELETE, _pack_key(key))
+
+    async def range(self, lo=None, hi=None, limit=0):
+        """Keys with lo <= key <= hi, at most limit of them (0: all)"""
+        flags = (lo is not None) | (hi is not None) << 1
+        _, body = await self._request(RANGE_SCAN, RANGE.pack(flags, lo or 0, hi or 0, limit))
+        return list(_unpack_keys(body))
+
+    async def rank(self, key):
+        """Number of keys strictly less than key"""
+        _, body = await self._request(RANK, _pack_key(key))
+        return KEY.unpack(body)[0]
+
+    async def contains_many(self, keys):
+        """Membership of a batch of keys, as a list of bools, in one request"""
+        _, body = await self._request(CONTAINS_MANY, _pack_keys(keys))
+        return [bool(flag) for flag in body]
+
+    async def insert_many(self, keys):
+        await self._request(INSERT_MANY, _pack_keys(keys))
+
+    async def delete_many(self, keys):
+        await self._request(DELETE_MANY, _pack_keys(keys))
+
+
+CLIENT_METHODS = ('get', 'contains', 'insert', 'delete', 'range', 'rank', 'contains_many',
+                  'insert_many', 'delete_many')
+
+
+def _pooled(name):
+    async def method(self, *args, **kwargs):
+        client = await self._client()
+        return await getattr(client, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = f"IndexClient.{name} on the least busy pooled connection"
+    return method
+
+
+class ClientPool:
+    """Up to size IndexClient connections shared by any number of coroutines
+
+    A call goes to an idle connection, or opens a new one while the pool is
+    below size, or else pipelines on the connection with the fewest
+    requests in flight. Lost connections are dropped and replaced.
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, size=4):
+        if size < 1:
+            raise ValueError("a pool needs at least one connection")
+        self.host = host
+        self.port = port
+        self.size = size
+        self._clients = []
+        self._connecting = 0
+
+    async def _client(self):
+        clients = self._clients
+        if any(client.closed for client in clients):
+            clients[:] = [client for client in clients if not client.closed]
+        best = min(clients, key=lambda client: client.in_flight, default=None)
+        if best is not None and (not best.in_flight
+                                 or len(clients) + self._connecting >= self.size):
+            return best
+        self._connecting += 1
+        try:
+            client = await IndexClient.connect(self.host, self.port)
+        finally:
+            self._connecting -= 1
+        clients.append(client)
+        return client
+
+    def __len__(self):
+        return len(self._clients)
+
+    async def close(self):
+        clients, self._clients = self._clients, []
+        for client in clients:
+            await client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+for _name in CLIENT_METHODS:
+    setattr(ClientPool, _name, _pooled(_name))
+del _name
+
+
+def serve(tree, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None, **options):
+    """Serve tree until interrupted; ready(port) is called once the socket listens"""
+    async def run():
+        server = await IndexServer(tree, **options).start(host, port)
+        if ready:
+            ready(server.port)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def build_tree(name='rb', size=100_000, mapping=False):
+    """An order-statistics tree of the even keys 0, 2, ..., 2 * (size - 1)"""
+    return SERVED_TREES[name].from_sorted(range(0, 2 * size, 2), order_stats=True,
+                                          mapping=mapping)
+
+
+def _serve_built(name, size, mapping, host, port, ports, options):
+    serve(build_tree(name, size, mapping), host, port, ready=ports.put, **options)
+
+
+def start_server_process(name='rb', size=100_000, mapping=False, host=DEFAULT_HOST, port=0,
+                         **options):
+    """Run a server for build_tree(name, size) in a child process; return (process, port)
+
+    options go to IndexServer. The caller terminates the process when done with it.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_built,
+                                      args=(name, size, mapping, host, port, ports, options),
+                                      daemon=True)
+    process.start()
+    return process, ports.get(timeout=max(60, size / 10_000))
+
+
+# Load generation -------------------------------------------------------------
+
+async def _load_worker(client, count, read_percent, key_space, rng, latencies):
+    clock = time.perf_counter
+    for _ in range(count):
+        key = rng.randrange(key_space)
+        roll = rng.randrange(100)
+        began = clock()
+        if roll < read_percent:
+            await client.contains(key)
+        elif roll % 2:
+            await client.insert(key)
+        else:
+            await client.delete(key)
+        latencies.append(clock() - began)
+
+
+async def _load_round(host, port, clients, requests, depth, read_percent, key_space, seed):
+    connections = [await IndexClient.connect(host, port) for _ in range(clients)]
+    workers = clients * depth
+    latencies = []
+    try:
+        began = time.perf_counter()
+        await asyncio.gather(*(
+            _load_worker(connections[w % clients], requests // workers + (w < requests % workers),
+                         read_percent, key_space, random.Random(f"{seed}:{clients}:{w}"),
+                         latencies)
+            for w in range(workers)))
+        elapsed = time.perf_counter() - began
+    finally:
+        for connection in connections:
+            await connection.close()
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+    return {
+        'clients': clients,
+        'depth': depth,
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'p999_ms': percentile(0.999),
+    }
+
+
+async def run_load(host=DEFAULT_HOST, port=DEFAULT_PORT, clients=(1, 2, 4, 8, 16, 32),
+                   requests=20_000, depth=1, read_percent=90, key_space=200_000, seed=42):
+    """Throughput and latency percentiles as the number of client connections grows
+
+    Each round spreads requests over clients connections with depth
+    requests in flight on each (depth > 1 pipelines). Reads are contains();
+    the rest are inserts and deletes in equal parts. Latency runs from the
+    call to its answer, so it includes queueing in the client.
+    """
+    rows = []
+    for count in clients:
+        rows.append(await _load_round(host, port, count, requests, depth, read_percent,
+                                      key_space, seed))
+    return rows
+
+
+def print_load(rows):
+    print(f"  {'clients':>7} {'depth':>5} {'requests/s':>12} {'p50 ms':>9} {'p99 ms':>9}"
+          f" {'p99.9 ms':>9}")
+    for row in rows:
+        print(f"  {row['clients']:>7} {row['depth']:>5} {row['throughput']:>12,.0f}"
+              f" {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['p999_ms']:>9.3f}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve a tree over a socket or load-test a server")
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('serve', help="serve a tree of even keys 0 .. 2 * (size - 1)")
+    server.add_argument('--tree', default='rb', choices=list(SERVED_TREES))
+    server.add_argument('--size', type=int, default=100_000)
+    server.add_argument('--mapping', action='store_true', help="store values with inserts")
+    server.add_argument('--max-batch', type=int, default=4096,
+                        help="most keys applied in one coalesced write batch")
+    server.add_argument('--coalesce-delay', type=float, default=0.0,
+                        help="seconds to hold writes for a larger batch (0: one loop pass)")
+    load = commands.add_parser('load', help="report throughput and tail latency")
+    load.add_argument('--clients', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32])
+    load.add_argument('--requests', type=int, default=20_000, help="requests per round")
+    load.add_argument('--depth', type=int, default=1, help="requests in flight per client")
+    load.add_argument('--reads', type=int, default=90, help="percent of requests that read")
+    load.add_argument('--key-space', type=int, default=200_000)
+    load.add_argument('--seed', type=int, default=42)
+    for command in (server, load):
+        command.add_argument('--host', default=DEFAULT_HOST)
+        command.add_argument('--port', type=int, default=DEFAULT_PORT)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'serve':
+        tree = build_tree(args.tree, args.size, args.mapping)
+        serve(tree, args.host, args.port,
+              ready=lambda port: print(f"serving {len(tree):,} keys on {args.host}:{port}",
+                                       file=sys.stderr),
+              max_batch=args.max_batch, coalesce_delay=args.coalesce_delay)
+        return 0
+    rows = asyncio.run(run_load(args.host, args.port, args.clients, args.requests, args.depth,
+                                args.reads, args.key_space, args.seed))
+    print(f"Load on {args.host}:{args.port}, {args.reads}% reads")
+    print_load(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Binary Snapshots of Tree Contents
+Packed sorted keys (and values) that load through the linear-time balanced
+build, or are searched in place through mmap without deserializing
+
+File layout (little-endian):
+    header   magic b'TRSN', version, key typecode, value typecode,
+             count, key section bytes, value section bytes (32 bytes)
+    keys     n packed int64 ('q') / float64 ('d'), or a pickled list ('O')
+    values   same encodings, or absent ('-') for set-mode trees
+
+Red-Black colors are not stored: from_sorted recolors a midpoint build.
+"""
+
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only used for batch lookups
+    np = None
+
+
+MAGIC = b'TRSN'
+VERSION = 1
+_HEADER = struct.Struct('<4sBccxQQQ')
+_SWAP = sys.byteorder != 'little'
+_CHUNK = 4096  # keys copied out of the mapping per step while iterating
+
+
+def _encode(items):
+    """Return (typecode, bytes) for a list of keys or values"""
+    if isinstance(items, array) and items.typecode in ('q', 'd'):
+        packed = array(items.typecode, items)
+    else:
+        try:
+            packed = array('q', items)
+        except (TypeError, OverflowError):
+            if not all(type(item) is float for item in items):
+                return b'O', pickle.dumps(list(items), protocol=pickle.HIGHEST_PROTOCOL)
+            packed = array('d', items)
+    if _SWAP:
+        packed.byteswap()
+    return packed.typecode.encode(), packed.tobytes()
+
+
+def _decode(typecode, data):
+    if typecode == 'O':
+        return pickle.loads(data)
+    packed = array(typecode)
+    packed.frombytes(data)
+    if _SWAP:
+        packed.byteswap()
+    return packed
+
+
+def write_snapshot(path, keys, values=None):
+    """Write sorted keys (and their values) to path"""
+    key_code, key_bytes = _encode(keys)
+    if values is None:
+        value_code, value_bytes = b'-', b''
+    else:
+        value_code, value_bytes = _encode(values)
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, key_code, value_code,
+                             len(keys), len(key_bytes), len(value_bytes)))
+        f.write(key_bytes)
+        f.write(value_bytes)
+
+
+def _parse_header(buffer, path):
+    if len(buffer) < _HEADER.size:
+        raise ValueError(f"{path} is not a tree snapshot")
+    magic, version, key_code, value_code, count, key_len, value_len = _HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a tree snapshot")
+    if version != VERSION:
+        raise ValueError(f"{path} has snapshot version {version}, expected {VERSION}")
+    if len(buffer) < _HEADER.size + key_len + value_len:
+        raise ValueError(f"{path} is truncated")
+    return key_code.decode(), value_code.decode(), count, key_len, value_len
+
+
+def read_snapshot(path):
+    """Return (keys, values or None) from a snapshot file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    key_code, value_code, count, key_len, value_len = _parse_header(data, path)
+    start = _HEADER.size
+    keys = _decode(key_code, data[start:start + key_len])
+    start += key_len
+    values = None if value_code == '-' else _decode(value_code, data[start:start + value_len])
+    return keys, values
+
+
+class MappedTree:
+    """Read-only sorted map searched in place over an mmapped snapshot"""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        key_code, value_code, count, key_len, value_len = _parse_header(self._mmap, path)
+        if key_code == 'O':
+            self.close()
+            raise ValueError("only int64/float64 snapshots can be searched in place")
+        if _SWAP:
+            self.close()
+            raise ValueError("mapped snapshots need a little-endian host")
+        start = _HEADER.size
+        self._key_code = key_code
+        self._view = memoryview(self._mmap)
+        self._keys = self._view[start:start + key_len].cast(key_code)
+        start += key_len
+        self._value_code = value_code
+        self._value_bytes = (start, value_len)
+        self._value_list = None
+        self._size = count
+
+    def close(self):
+        """Release the mapping; the tree is unusable afterwards"""
+        # Iterators copy keys out chunk by chunk, so these are the only
+        # views on the mapping and nothing else keeps it exported
+        for name in ('_keys', '_values_view', '_view'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return self._iter_keys(0, self._size)
+
+    def _iter_keys(self, start, stop):
+        # Copy each chunk to a list so no slice of the mapping outlives a step
+        keys = self._keys
+        for i in range(start, stop, _CHUNK):
+            with keys[i:min(i + _CHUNK, stop)] as chunk:
+                batch = chunk.tolist()
+            yield from batch
+
+    def _values(self):
+        # Packed values are read in place; pickled ones are loaded on first use
+        if self._value_code == '-':
+            raise TypeError("snapshot has no values (saved from a set-mode tree)")
+        if self._value_list is None:
+            start, length = self._value_bytes
+            if self._value_code == 'O':
+                self._value_list = pickle.loads(self._view[start:start + length])
+            else:
+                self._values_view = self._view[start:start + length].cast(self._value_code)
+                self._value_list = self._values_view
+        return self._value_list
+
+    def _index(self, key):
+        keys = self._keys
+        i = bisect_left(keys, key)
+        return i if i < len(keys) and keys[i] == key else -1
+
+    def search(self, key):
+        """Return True if key is in the snapshot"""
+        return self._index(key) != -1
+
+    def __contains__(self, key):
+        return self._index(key) != -1
+
+    def __getitem__(self, key):
+        i = self._index(key)
+        if i == -1:
+            raise KeyError(key)
+        return self._values()[i]
+
+    def get(self, key, default=None):
+        i = self._index(key)
+        return default if i == -1 else self._values()[i]
+
+    def floor(self, key):
+        """Largest key <= key, or None"""
+        i = bisect_right(self._keys, key)
+        return self._keys[i - 1] if i else None
+
+    def ceiling(self, key):
+        """Smallest key >= key, or None"""
+        i = bisect_left(self._keys, key)
+        return self._keys[i] if i < self._size else None
+
+    def rank(self, key):
+        """Number of keys < key"""
+        return bisect_left(self._keys, key)
+
+    def select(self, k):
+        """k-th smallest key (0-based)"""
+        return self._keys[k]
+
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in ascending order"""
+        keys = self._keys
+        start = 0 if lo is None else bisect_left(keys, lo)
+        stop = self._size if hi is None else bisect_right(keys, hi)
+        return self._iter_keys(start, stop)
+
+    def items(self, lo=None, hi=None):
+        """Yield (key, value) pairs with lo <= key <= hi"""
+        keys, values = self._keys, self._values()
+        start = 0 if lo is None else bisect_left(keys, lo)
+        stop = self._size if hi is None else bisect_right(keys, hi)
+        return ((keys[i], values[i]) for i in range(start, stop))
+
+    def contains_many(self, keys):
+        """Boolean membership mask for a batch of keys (vectorized with NumPy)"""
+        if np is None:
+            return [key in self for key in keys]
+        stored = np.frombuffer(self._keys, dtype=self._key_code)
+        probe = np.asarray(keys)
+        positions = np.searchsorted(stored, probe)
+        found = positions < len(stored)
+        found[found] = stored[positions[found]] == probe[found]
+        return found
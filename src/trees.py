@@ -4,387 +4,4145 @@ Complete implementation of BST, AVL, and Red-Black trees
 Laboratory Work for Data Structures and Algorithms
 """
 
-import sys
-sys.setrecursionlimit(10000)
 
+import copy
+import gc
+import math
+import os
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter, itemgetter, le, lt
 
-class Node:
-    """Node class for all tree types"""
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only used for array batches
+    np = None
+
+
+_MISSING = object()
+
+# Batches covering at least 1/_REBUILD_FACTOR of a balanced tree are merged
+# into its node list and relinked in O(n + m) instead of applied one by one.
+# Below that a sorted key-by-key loop is faster than any shared descent we
+# tried (join-based union included): node creation and fix-ups dominate, not
+# the comparisons a shared prefix saves. See benchmark_batch_crossover().
+_REBUILD_FACTOR = 2
+
+
+@contextmanager
+def _gc_paused():
+    """Suspend the cyclic GC while allocating many nodes at once"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _sorted_list(keys):
+    """Materialize keys as a list, checking they are strictly increasing"""
+    if not isinstance(keys, list):
+        keys = keys.tolist() if isinstance(keys, array) else list(keys)
+    if not all(map(lt, keys, islice(keys, 1, None))):
+        raise ValueError("keys must be sorted and free of duplicates")
+    return keys
+
+
+def _is_array(keys):
+    return np is not None and isinstance(keys, np.ndarray)
+
+
+def _sorted_batch(keys):
+    """Return (sorted keys, input positions in sorted order or None if already sorted)"""
+    keys = keys.tolist() if _is_array(keys) else list(keys)
+    if all(map(le, keys, islice(keys, 1, None))):
+        return keys, None
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return [keys[i] for i in order], order
+
+
+def _sorted_unique(keys):
+    if _is_array(keys):
+        return np.unique(keys).tolist()
+    return sorted(set(keys))
+
+
+def _lookup_sorted(root, nil, keys):
+    """Match sorted keys against a tree in one shared descent, returning nodes (or nil)"""
+    found = [nil] * len(keys)
+    stack = [(root, 0, len(keys))] if root is not nil and keys else []
+    while stack:
+        node, lo, hi = stack.pop()
+        if hi - lo == 1:
+            # Nothing left to share: finish with a plain descent
+            key = keys[lo]
+            while node is not nil:
+                if key < node.key:
+                    node = node.left
+                elif key > node.key:
+                    node = node.right
+                else:
+                    found[lo] = node
+                    break
+            continue
+        node_key = node.key
+        i = bisect_left(keys, node_key, lo, hi)
+        j = i
+        while j < hi and keys[j] == node_key:
+            found[j] = node
+            j += 1
+        if lo < i and node.left is not nil:
+            stack.append((node.left, lo, i))
+        if j < hi and node.right is not nil:
+            stack.append((node.right, j, hi))
+    return found
+
+
+def _batch_results(tree, keys, nil, as_mask):
+    """Shared implementation of search_many/contains_many"""
+    array_input = _is_array(keys)
+    batch, order = _sorted_batch(keys)
+    found = _lookup_sorted(tree.root, nil, batch)
+    if order is not None:
+        unsorted = [nil] * len(found)
+        for position, node in zip(order, found):
+            unsorted[position] = node
+        found = unsorted
+    if as_mask or array_input:
+        mask = [node is not nil for node in found]
+        return np.array(mask, dtype=bool) if array_input else mask
+    return found
+
+
+def _merge_nodes(nodes, keys, make):
+    """Merge sorted nodes with sorted, distinct keys, creating nodes for new keys"""
+    merged = []
+    i = 0
+    for key in keys:
+        while i < len(nodes) and nodes[i].key < key:
+            merged.append(nodes[i])
+            i += 1
+        if i < len(nodes) and nodes[i].key == key:
+            continue
+        merged.append(make(key))
+    merged.extend(islice(nodes, i, None))
+    return merged
+
+
+def _combine_nodes(op, nodes_a, nodes_b, mapping):
+    """Union/intersection/difference of two sorted node lists, keeping a's node for shared keys"""
+    combined = []
+    i = j = 0
+    n, m = len(nodes_a), len(nodes_b)
+    while i < n and j < m:
+        a, b = nodes_a[i], nodes_b[j]
+        if a.key < b.key:
+            if op != 'intersection':
+                combined.append(a)
+            i += 1
+        elif b.key < a.key:
+            if op == 'union':
+                combined.append(b)
+            j += 1
+        else:
+            if op != 'difference':
+                if mapping and op == 'union':
+                    a.value = b.value
+                combined.append(a)
+            i += 1
+            j += 1
+    if op != 'intersection':
+        combined.extend(islice(nodes_a, i, None))
+    if op == 'union':
+        combined.extend(islice(nodes_b, j, None))
+    return combined
+
+
+def _drop_nodes(nodes, keys):
+    """Filter sorted nodes against sorted, distinct keys to remove"""
+    kept = []
+    i = 0
+    for node in nodes:
+        while i < len(keys) and keys[i] < node.key:
+            i += 1
+        if i < len(keys) and keys[i] == node.key:
+            continue
+        kept.append(node)
+    return kept
+
+
+class BSTNode:
+    """Lean node for plain BSTs: key and child links only"""
+    __slots__ = ('key', 'left', 'right')
+    
     def __init__(self, key):
         self.key = key
         self.left = None
         self.right = None
-        self.height = 1  # For AVL trees
-        self.color = 1   # 1=red, 0=black (for Red-Black trees)
-        self.parent = None  # For Red-Black trees
 
 
-class BST:
-    """Binary Search Tree Implementation"""
-    def __init__(self):
+class AVLNode(BSTNode):
+    """AVL node, adds the cached subtree height"""
+    __slots__ = ('height',)
+    
+    def __init__(self, key):
+        self.key = key
+        self.left = None
+        self.right = None
+        self.height = 1
+
+
+class RBNode(BSTNode):
+    """Red-Black node, adds color, parent pointer and cached subtree height"""
+    __slots__ = ('color', 'parent', 'height')
+    
+    def __init__(self, key):
+        self.key = key
+        self.left = None
+        self.right = None
+        self.color = 1   # 1=red, 0=black
+        self.parent = None
+        self.height = 1
+
+
+class TreapNode(BSTNode):
+    """Treap node, adds the heap priority (set by the owning tree)"""
+    __slots__ = ('priority',)
+    
+    def __init__(self, key):
+        self.key = key
+        self.left = None
+        self.right = None
+        self.priority = 0.0
+
+
+# Optional per-node augmentations and the value each starts with; keyed
+# fields start from the node's key instead (max_hi from an interval's end)
+_NODE_FIELDS = {'size': 1, 'value': None, 'max_hi': None}
+_KEYED_FIELDS = {'max_hi': itemgetter(1)}
+_node_types = {}
+
+
+def _node_type(base, fields):
+    """Slotted subclass of base that adds the given augmentation fields"""
+    fields = tuple(field for field in _NODE_FIELDS if field in fields)
+    if not fields:
+        return base
+    node_type = _node_types.get((base, fields))
+    if node_type is None:
+        defaults = [(field, _NODE_FIELDS[field]) for field in fields if field not in _KEYED_FIELDS]
+        keyed = [(field, _KEYED_FIELDS[field]) for field in fields if field in _KEYED_FIELDS]
+        base_init = base.__init__
+        
+        def __init__(self, key):
+            base_init(self, key)
+            for field, value in defaults:
+                setattr(self, field, value)
+            for field, derive in keyed:
+                setattr(self, field, derive(key))
+        
+        name = ''.join(field.title().replace('_', '') for field in fields) + base.__name__
+        node_type = type(name, (base,), {'__slots__': fields, '__init__': __init__})
+        _node_types[(base, fields)] = node_type
+    return node_type
+
+
+def _require_order_stats(tree):
+    if not tree._order_stats:
+        raise ValueError("order statistics need a tree built with order_stats=True")
+
+
+def _rank(root, nil, key, inclusive=False):
+    """Number of keys below key (or at most key when inclusive)"""
+    rank = 0
+    node = root
+    while node is not nil:
+        if key < node.key or (not inclusive and key == node.key):
+            node = node.left
+        else:
+            rank += 1 + (node.left.size if node.left is not nil else 0)
+            node = node.right
+    return rank
+
+
+def _select(root, nil, k):
+    """Node holding the k-th smallest key (0-based)"""
+    node = root
+    while node is not nil:
+        left_size = node.left.size if node.left is not nil else 0
+        if k < left_size:
+            node = node.left
+        elif k == left_size:
+            return node
+        else:
+            k -= left_size + 1
+            node = node.right
+    raise IndexError("select index out of range")
+
+
+class OrderStatisticsMixin:
+    """rank/select queries over trees that keep subtree sizes"""
+    def rank(self, key):
+        """Number of keys strictly less than key, in O(log n)"""
+        _require_order_stats(self)
+        return _rank(self.root, self._nil, key)
+    
+    def select(self, k):
+        """k-th smallest key (0-based, negative counts from the end), in O(log n)"""
+        _require_order_stats(self)
+        if k < 0:
+            k += self._size
+        if not 0 <= k < self._size:
+            raise IndexError("select index out of range")
+        return _select(self.root, self._nil, k).key
+    
+    def count_range(self, lo, hi):
+        """Number of keys with lo <= key <= hi, in O(log n)"""
+        _require_order_stats(self)
+        if hi < lo:
+            return 0
+        return _rank(self.root, self._nil, hi, inclusive=True) - _rank(self.root, self._nil, lo)
+    
+    def percentile(self, p):
+        """Key at the p-th percentile (0-100, nearest-rank method)"""
+        _require_order_stats(self)
+        if not 0 <= p <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        if self._size == 0:
+            raise IndexError("percentile of an empty tree")
+        k = max(0, math.ceil(p / 100 * self._size) - 1)
+        return _select(self.root, self._nil, k).key
+
+
+def _require_intervals(tree):
+    if not tree._intervals:
+        raise ValueError("overlap queries need a tree built with intervals=True")
+
+
+def _subtree_max_hi(node, nil):
+    """Largest interval end among node and its children's subtrees"""
+    best = node.key[1]
+    left, right = node.left, node.right
+    if left is not nil and left.max_hi > best:
+        best = left.max_hi
+    if right is not nil and right.max_hi > best:
+        best = right.max_hi
+    return best
+
+
+def _settle_max_hi(linked, nil):
+    """Set max_hi on freshly linked nodes, given parents before children"""
+    for node in reversed(linked):
+        node.max_hi = _subtree_max_hi(node, nil)
+
+
+class IntervalMixin:
+    """Overlap and stabbing queries over trees built with intervals=True
+    
+    Keys are (lo, hi) pairs with lo <= hi, read as closed intervals and
+    ordered by lo, then hi. Every node also caches max_hi, the largest hi
+    in its subtree, so a query never enters a subtree that ends before the
+    query starts and stops at the first key that starts after it ends.
+    """
+    def iter_overlaps(self, lo, hi):
+        """Lazily yield stored intervals overlapping [lo, hi], in key order
+        
+        Only subtrees holding an answer, plus one path to the stopping
+        point, are entered: O(log n) for the first result and at most
+        O(log n) more per result, usually far less.
+        """
+        _require_intervals(self)
+        if hi < lo:
+            raise ValueError("interval end is before its start")
+        nil = self._nil
+        stack = []
+        node = self.root
+        while True:
+            while node is not nil and node.max_hi >= lo:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            start, end = node.key
+            if start > hi:
+                return
+            if end >= lo:
+                yield node.key
+            node = node.right
+    
+    def overlaps(self, lo, hi):
+        """Stored intervals overlapping [lo, hi], as a list in key order"""
+        return list(self.iter_overlaps(lo, hi))
+    
+    def stab(self, point):
+        """Stored intervals containing point, as a list in key order"""
+        return list(self.iter_overlaps(point, point))
+
+
+_key_of = attrgetter('key')
+_value_of = attrgetter('value')
+
+
+def _floor_node(root, nil, key, inclusive):
+    """Node with the largest key <= key (< key when not inclusive), or None"""
+    best = None
+    node = root
+    while node is not nil:
+        if key < node.key or (not inclusive and key == node.key):
+            node = node.left
+        elif key == node.key:
+            return node
+        else:
+            best = node
+            node = node.right
+    return best
+
+
+def _ceiling_node(root, nil, key, inclusive):
+    """Node with the smallest key >= key (> key when not inclusive), or None"""
+    best = None
+    node = root
+    while node is not nil:
+        if key > node.key or (not inclusive and key == node.key):
+            node = node.right
+        elif key == node.key:
+            return node
+        else:
+            best = node
+            node = node.left
+    return best
+
+
+def _find(root, nil, key):
+    """Node holding key, or nil, with one < per level and one test at the bottom"""
+    # Python has no three-way compare, so the usual < then > descent may
+    # compare an expensive key twice per level; this one only steers and
+    # checks equality once, against the last node it went right at
+    candidate = nil
+    node = root
+    while node is not nil:
+        if key < node.key:
+            node = node.left
+        else:
+            candidate = node
+            node = node.right
+    if candidate is not nil and not candidate.key < key:
+        return candidate
+    return nil
+
+
+def _descend(root, nil, key):
+    """_find that also returns the path walked and whether its last step went left"""
+    path = []
+    candidate = None
+    went_left = False
+    node = root
+    while node is not nil:
+        path.append(node)
+        went_left = key < node.key
+        if went_left:
+            node = node.left
+        else:
+            candidate = node
+            node = node.right
+    if candidate is not None and not candidate.key < key:
+        return path, candidate, went_left
+    return path, None, went_left
+
+
+def _decorated(items, key):
+    """Sorted distinct key(item) values and the first item that produced each"""
+    keys, elements = [], []
+    for sort_key, item in sorted(((key(item), item) for item in items), key=itemgetter(0)):
+        if not keys or keys[-1] < sort_key:
+            keys.append(sort_key)
+            elements.append(item)
+    return keys, elements
+
+
+class KeyFunctionMixin:
+    """Elements ordered by key(element), for trees built with key=
+    
+    key runs once per inserted element; the result is stored as the node's
+    key and the element as its value, so the tree is a sorted map from
+    comparison keys to elements (values() lists the elements in order).
+    insert, search, delete, their batch forms and `in` take elements; item
+    access, ranges, floor/ceiling and rank take comparison keys, as with
+    bisect's key=. Searches and inserts (splay trees and treaps excepted)
+    compare once per level, with one equality test at the bottom.
+    """
+    _key_func = None
+    
+    def _keys_of(self, items):
+        """Comparison keys of a batch (the items themselves without key=)"""
+        key = self._key_func
+        return items if key is None else [key(item) for item in items]
+    
+    def _search_key(self, key):
+        return _find(self.root, self._nil, key)
+    
+    def _insert_key(self, key):
+        return self._insert(key)
+    
+    def _insert_item(self, item):
+        size = self._size
+        node = self._insert_key(self._key_func(item))
+        if self._size != size:
+            node.value = item
+    
+    def _insert_items(self, items):
+        for item in items:
+            self._insert_item(item)
+
+
+class TraversalMixin:
+    """Lazy traversals that hold O(height) nodes and stop when the caller does"""
+    def __iter__(self):
+        return self.iter_inorder()
+    
+    def __reversed__(self):
+        return self.iter_reverse()
+    
+    def iter_inorder(self):
+        """Yield keys in ascending order"""
+        return self.iter_range()
+    
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in ascending order (None = unbounded)"""
+        return map(_key_of, self._iter_nodes(lo, hi))
+    
+    def _iter_nodes(self, lo=None, hi=None):
+        nil = self._nil
+        stack = []
+        node = self.root
+        while True:
+            while node is not nil:
+                if lo is not None and node.key < lo:
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if hi is not None and node.key > hi:
+                return
+            yield node
+            node = node.right
+    
+    def iter_reverse(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in descending order (None = unbounded)"""
+        nil = self._nil
+        stack = []
+        node = self.root
+        while True:
+            while node is not nil:
+                if hi is not None and node.key > hi:
+                    node = node.left
+                else:
+                    stack.append(node)
+                    node = node.right
+            if not stack:
+                return
+            node = stack.pop()
+            if lo is not None and node.key < lo:
+                return
+            yield node.key
+            node = node.left
+    
+    def cursor(self):
+        """Finger cursor that starts each search from the last visited node"""
+        return TreeCursor(self)
+    
+    def iter_level_order(self):
+        """Yield keys breadth-first"""
+        nil = self._nil
+        queue = deque([self.root] if self.root is not nil else [])
+        while queue:
+            node = queue.popleft()
+            yield node.key
+            if node.left is not nil:
+                queue.append(node.left)
+            if node.right is not nil:
+                queue.append(node.right)
+
+
+class TreeCursor:
+    """Finger into a tree for locality-heavy access patterns
+    
+    The cursor keeps the root-to-node path together with the key interval
+    each subtree on it covers. A search near the previous position resumes
+    from the deepest subtree whose interval still holds the target instead
+    of from the root, and next()/prev() walk the path in amortized O(1).
+    Any structural change to the tree sends the next search back to the root.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self._path = []  # (node, exclusive lower bound, exclusive upper bound)
+        self._version = tree._version
+    
+    @property
+    def key(self):
+        """Key under the cursor, or None when unpositioned"""
+        return self._path[-1][0].key if self._path and self._fresh() else None
+    
+    @property
+    def value(self):
+        """Value under the cursor (map-mode trees), or None"""
+        if not self._path or not self._fresh() or not self.tree._mapping:
+            return None
+        return self._path[-1][0].value
+    
+    def _fresh(self):
+        if self._version != self.tree._version:
+            self._path = []
+            self._version = self.tree._version
+            return False
+        return True
+    
+    def search_near(self, key):
+        """Move to key (or the next larger key) and report whether key is present"""
+        self._fresh()
+        nil = self.tree._nil
+        path = self._path
+        if path:
+            _, lo, hi = path[-1]
+            if not ((lo is None or lo < key) and (hi is None or key < hi)):
+                # Intervals shrink along the path, so bisect for the deepest
+                # one that still holds key
+                low, high = 0, len(path) - 1
+                while low < high:
+                    mid = (low + high) // 2
+                    _, lo, hi = path[mid]
+                    if (lo is None or lo < key) and (hi is None or key < hi):
+                        low = mid + 1
+                    else:
+                        high = mid
+                del path[low:]
+        if not path:
+            if self.tree.root is nil:
+                return False
+            path.append((self.tree.root, None, None))
+        
+        node, lo, hi = path[-1]
+        while True:
+            if key < node.key:
+                child = node.left
+                if child is nil:
+                    break
+                hi = node.key
+            elif key > node.key:
+                child = node.right
+                if child is nil:
+                    break
+                lo = node.key
+            else:
+                return True
+            node = child
+            path.append((node, lo, hi))
+        
+        if node.key < key:
+            self.next()
+        return False
+    
+    def seek(self, key):
+        """Move to the smallest key >= key and return it (None past the end)"""
+        self.search_near(key)
+        return self.key
+    
+    def next(self):
+        """Advance to the next larger key and return it (None past the end)"""
+        if not self._path or not self._fresh():
+            return None
+        nil = self.tree._nil
+        path = self._path
+        node, lo, hi = path[-1]
+        if node.right is not nil:
+            lo = node.key
+            node = node.right
+            path.append((node, lo, hi))
+            while node.left is not nil:
+                hi = node.key
+                node = node.left
+                path.append((node, lo, hi))
+            return node.key
+        # Climb until we leave a left subtree
+        while len(path) > 1 and path[-2][0].right is path[-1][0]:
+            path.pop()
+        path.pop()
+        return path[-1][0].key if path else None
+    
+    def prev(self):
+        """Step back to the next smaller key and return it (None before the start)"""
+        if not self._path or not self._fresh():
+            return None
+        nil = self.tree._nil
+        path = self._path
+        node, lo, hi = path[-1]
+        if node.left is not nil:
+            hi = node.key
+            node = node.left
+            path.append((node, lo, hi))
+            while node.right is not nil:
+                lo = node.key
+                node = node.right
+                path.append((node, lo, hi))
+            return node.key
+        # Climb until we leave a right subtree
+        while len(path) > 1 and path[-2][0].left is path[-1][0]:
+            path.pop()
+        path.pop()
+        return path[-1][0].key if path else None
+
+
+class SortedMapMixin(MutableMapping):
+    """Sorted-map interface; set-mode trees behave as maps whose values are None"""
+    def _require_mapping(self):
+        if not self._mapping:
+            raise TypeError("storing values needs a tree built with mapping=True")
+    
+    def __getitem__(self, key):
+        node = self._search(self.root, key)
+        if node is self._nil:
+            raise KeyError(key)
+        return node.value if self._mapping else None
+    
+    def __setitem__(self, key, value):
+        self._require_mapping()
+        self._insert(key).value = value
+    
+    def __delitem__(self, key):
+        if self._delete(key) is _MISSING:
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        if self._key_func is not None:
+            return self._search_key(self._key_func(key)) is not self._nil
+        return self._search(self.root, key) is not self._nil
+    
+    def get(self, key, default=None):
+        node = self._search(self.root, key)
+        if node is self._nil:
+            return default
+        return node.value if self._mapping else None
+    
+    def pop(self, key, default=_MISSING):
+        value = self._delete(key)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        return value
+    
+    def setdefault(self, key, default=None):
+        self._require_mapping()
+        size = self._size
+        node = self._insert(key)
+        if self._size != size:
+            node.value = default
+        return node.value
+    
+    def clear(self):
+        self.root = self._nil
+        self._size = 0
+        self._height = 0
+        self._version += 1
+    
+    def items(self, lo=None, hi=None):
+        """Yield (key, value) pairs with lo <= key <= hi in ascending order"""
+        if not self._mapping:
+            return ((key, None) for key in self.iter_range(lo, hi))
+        return ((node.key, node.value) for node in self._iter_nodes(lo, hi))
+    
+    def values(self, lo=None, hi=None):
+        """Yield values with lo <= key <= hi in key order"""
+        if not self._mapping:
+            return (None for _ in self.iter_range(lo, hi))
+        return map(_value_of, self._iter_nodes(lo, hi))
+    
+    def floor(self, key):
+        """Largest key <= key, or None"""
+        node = _floor_node(self.root, self._nil, key, inclusive=True)
+        return node.key if node is not None else None
+    
+    def ceiling(self, key):
+        """Smallest key >= key, or None"""
+        node = _ceiling_node(self.root, self._nil, key, inclusive=True)
+        return node.key if node is not None else None
+    
+    def predecessor(self, key):
+        """Largest key < key, or None"""
+        node = _floor_node(self.root, self._nil, key, inclusive=False)
+        return node.key if node is not None else None
+    
+    def successor(self, key):
+        """Smallest key > key, or None"""
+        node = _ceiling_node(self.root, self._nil, key, inclusive=False)
+        return node.key if node is not None else None
+
+
+def _invariant(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def _require_numpy(what):
+    if np is None:
+        raise ImportError(f"{what} needs NumPy")
+
+
+def _key_array(keys):
+    """Keys as a 1-D NumPy array; object dtype unless they are all numbers"""
+    try:
+        packed = np.array(keys)
+    except (TypeError, ValueError):
+        packed = None
+    if packed is None or packed.ndim != 1 or packed.dtype.kind not in 'biuf':
+        # Tuples would become a 2-D array and mixed keys a string one
+        packed = np.empty(len(keys), dtype=object)
+        for i, key in enumerate(keys):
+            packed[i] = key
+    return packed
+
+
+# Cached per-node fields copied into to_arrays() when the nodes have them
+_ARRAY_FIELDS = (('height', 'int64'), ('color', 'int8'), ('priority', 'float64'))
+
+
+def _linked_arrays(root, nil, keys):
+    """Level-order arrays of a linked binary tree, in one pass over its nodes"""
+    nodes = [root] if root is not nil else []
+    filled = []
+    add_node, add_slot = nodes.append, filled.append
+    # nodes grows as the loop runs, so it is visited in level order, and
+    # the filled child slots, in (left, right) order, list nodes[1:]
+    for node in nodes:
+        child = node.left
+        if child is nil:
+            add_slot(False)
+        else:
+            add_slot(True)
+            add_node(child)
+        child = node.right
+        if child is nil:
+            add_slot(False)
+        else:
+            add_slot(True)
+            add_node(child)
+    n = len(nodes)
+    filled = np.array(filled, dtype=bool)
+    links = np.where(filled, np.cumsum(filled), -1)
+    parent = np.full(n, -1, dtype=np.int64)
+    parent[1:] = np.flatnonzero(filled) // 2
+    arrays = {'left': links[0::2], 'right': links[1::2], 'parent': parent}
+    if keys:
+        arrays['key'] = _key_array(list(map(_key_of, nodes)))
+    for field, dtype in _ARRAY_FIELDS:
+        if nodes and hasattr(nodes[0], field):
+            arrays[field] = np.fromiter(map(attrgetter(field), nodes), dtype=dtype, count=n)
+    return arrays
+
+
+class ShapeMixin:
+    """Balance statistic, array export and the full O(n) invariant check"""
+    _intervals = False
+    
+    def height_ratio(self):
+        """Height over the minimum possible for len(tree) keys (1.0 = perfectly balanced)"""
+        n = len(self)
+        return self.get_height() / n.bit_length() if n else 1.0
+    
+    def to_arrays(self, keys=True):
+        """The tree as flat NumPy arrays in level order (index 0 is the root)
+        
+        Returns {'key', 'left', 'right', 'parent'} with -1 for a missing
+        node, plus 'height', 'color' (1 = red) or 'priority' when the nodes
+        cache them. Built in one pass; keys=False leaves out 'key', which
+        shape analytics (src/analytics.py) do not need.
+        """
+        _require_numpy("to_arrays")
+        return _linked_arrays(self.root, self._nil, keys)
+    
+    def validate(self):
+        """Check every invariant in O(n); raises AssertionError (meant for tests)"""
+        nil = self._nil
+        sized = self._order_stats
+        results = []  # (height, size, black height) of finished subtrees
+        stack = [(self.root, None, None, False)]
+        while stack:
+            node, lo, hi, children_done = stack.pop()
+            if node is nil:
+                results.append((0, 0, 1))
+                continue
+            if not children_done:
+                _invariant((lo is None or lo < node.key) and (hi is None or node.key < hi),
+                           f"key {node.key!r} is out of order")
+                stack.append((node, lo, hi, True))
+                stack.append((node.right, node.key, hi, False))
+                stack.append((node.left, lo, node.key, False))
+                continue
+            right = results.pop()
+            left = results.pop()
+            height = 1 + (left[0] if left[0] > right[0] else right[0])
+            size = 1 + left[1] + right[1]
+            if sized:
+                _invariant(node.size == size, f"node {node.key!r} has size {node.size}, not {size}")
+            if self._intervals:
+                _invariant(node.key[0] <= node.key[1], f"interval {node.key!r} ends before it starts")
+                _invariant(node.max_hi == _subtree_max_hi(node, nil),
+                           f"node {node.key!r} caches max_hi {node.max_hi!r}, "
+                           f"not {_subtree_max_hi(node, nil)!r}")
+            black = self._check_node(node, left, right, height)
+            results.append((height, size, black))
+        
+        height, size, _ = results[0]
+        _invariant(size == len(self), f"len() is {len(self)} but the tree holds {size} keys")
+        _invariant(self.get_height() == height,
+                   f"cached height is {self.get_height()} but the tree is {height} high")
+    
+    def _check_node(self, node, left, right, height):
+        """Per-node invariants of the tree type; returns the node's black height"""
+        return 0
+
+
+class SnapshotMixin:
+    """Binary save/load in the packed format of snapshot.py"""
+    def save(self, path):
+        """Write the sorted keys (and values) to path"""
+        from .snapshot import write_snapshot
+        values = list(self.values()) if getattr(self, '_mapping', False) else None
+        write_snapshot(path, self.inorder(), values)
+    
+    @classmethod
+    def load(cls, path, **options):
+        """Rebuild a saved tree with the linear-time balanced build"""
+        from .snapshot import read_snapshot
+        keys, values = read_snapshot(path)
+        return cls.from_sorted(keys, values, **options)
+
+
+# Combined inputs below this many keys never go to a process pool
+_PARALLEL_SET_MIN = 200_000
+
+# Set operations on trees within this size ratio merge their node lists in
+# O(n + m) instead of splitting and joining
+_SET_MERGE_RATIO = 8
+
+
+def _merge_sorted_runs(task):
+    """Union/intersection/difference of two sorted key runs (a process-pool task)"""
+    op, keys_a, values_a, keys_b, values_b = task
+    keys, values = [], [] if values_a is not None else None
+    i = j = 0
+    n, m = len(keys_a), len(keys_b)
+    while i < n and j < m:
+        a, b = keys_a[i], keys_b[j]
+        if a < b:
+            if op != 'intersection':
+                keys.append(a)
+                if values is not None:
+                    values.append(values_a[i])
+            i += 1
+        elif b < a:
+            if op == 'union':
+                keys.append(b)
+                if values is not None:
+                    values.append(values_b[j])
+            j += 1
+        else:
+            if op != 'difference':
+                keys.append(a)
+                if values is not None:
+                    values.append(values_b[j] if op == 'union' else values_a[i])
+            i += 1
+            j += 1
+    if op != 'intersection':
+        keys.extend(islice(keys_a, i, None))
+        if values is not None:
+            values.extend(islice(values_a, i, None))
+    if op == 'union':
+        keys.extend(islice(keys_b, j, None))
+        if values is not None:
+            values.extend(islice(values_b, j, None))
+    return _packed(keys), values
+
+
+class JoinMixin:
+    """split/join and join-based set algebra for balanced trees
+    
+    Everything is built on _join3(left, node, right), which links two trees
+    and a middle node whose key lies between them in time proportional to
+    the difference of their heights. The trees passed in are consumed: their
+    nodes are reused by the result and they are left empty.
+    """
+    def _as_root(self, root):
+        """Detach a subtree root so it can stand alone"""
+        return root
+    
+    def _adopt(self, tree):
+        """Make tree's nodes usable in joins with this tree's nodes"""
+    
+    def _lend_root(self, root):
+        """Point self.root at a detached subtree while rebalancing code runs on it"""
+        saved = (self.root, self._size, self._version)
+        self.root = root
+        return saved
+    
+    def _reclaim_root(self, saved):
+        """Undo _lend_root and return the subtree's (possibly new) root"""
+        root = self.root
+        self.root, self._size, self._version = saved
+        return root
+    
+    def _spawn(self, root, size):
+        tree = copy.copy(self)
+        tree.root = self._as_root(root)
+        tree._size = size
+        tree._version = 0
+        return tree
+    
+    def _check_compatible(self, other):
+        if type(other) is not type(self):
+            raise ValueError(f"cannot combine {type(self).__name__} with {type(other).__name__}")
+        if ((self._mapping, self._order_stats, self._intervals)
+                != (other._mapping, other._order_stats, other._intervals)):
+            raise ValueError("both trees need the same mapping, order_stats and intervals options")
+        if self._key_func != other._key_func:
+            raise ValueError("both trees need the same key function")
+    
+    def _detach_max(self, root):
+        """Remove the largest node of a subtree; return (remaining root, node)"""
+        nil = self._nil
+        top = root
+        while top.right is not nil:
+            top = top.right
+        saved = self._lend_root(self._as_root(root))
+        self._delete(top.key)
+        return self._reclaim_root(saved), top
+    
+    def _join2(self, left, right):
+        """Join two subtrees whose keys all compare left < right"""
+        nil = self._nil
+        if left is nil:
+            return right
+        if right is nil:
+            return left
+        left, top = self._detach_max(left)
+        return self._join3(left, top, right)
+    
+    def _split_root(self, root, key):
+        """Split a subtree into (keys < key, the node holding key or None, keys > key)"""
+        nil = self._nil
+        path = []
+        node = root
+        while node is not nil and node.key != key:
+            path.append(node)
+            node = node.left if key < node.key else node.right
+        if node is nil:
+            left = right = nil
+            found = None
+        else:
+            left, right, found = node.left, node.right, node
+        # Rejoining bottom-up costs O(log n) in total: each join is paid for
+        # by the height difference it removes
+        for node in reversed(path):
+            if key < node.key:
+                right = self._join3(right, node, node.right)
+            else:
+                left = self._join3(node.left, node, left)
+        return left, found, right
+    
+    def _count_smaller(self, a, b):
+        """Count the nodes of whichever subtree is smaller; return (is_a, count)"""
+        nil = self._nil
+        stacks = ([a] if a is not nil else [], [b] if b is not nil else [])
+        counts = [0, 0]
+        while True:
+            for side in (0, 1):
+                stack = stacks[side]
+                if not stack:
+                    return side == 0, counts[side]
+                node = stack.pop()
+                counts[side] += 1
+                if node.left is not nil:
+                    stack.append(node.left)
+                if node.right is not nil:
+                    stack.append(node.right)
+    
+    def split(self, key):
+        """Split into trees (keys < key, keys >= key) in O(log n); this tree is left empty
+        
+        Without order_stats the halves' lengths are found by counting the
+        smaller one, O(min(len(left), len(right))).
+        """
+        nil = self._nil
+        left, found, right = self._split_root(self.root, key)
+        if found is not None:
+            right = self._join3(nil, found, right)
+        if self._order_stats:
+            left_size = left.size if left is not nil else 0
+        else:
+            is_left, count = self._count_smaller(left, right)
+            left_size = count if is_left else self._size - count
+        result = self._spawn(left, left_size), self._spawn(right, self._size - left_size)
+        self.clear()
+        return result
+    
+    @classmethod
+    def join(cls, left, right):
+        """Concatenate two trees whose keys all compare left < right, in O(log n)
+        
+        Both trees are left empty. Trees that do not come from one split() may
+        first need O(min(n, m)) work to share internal sentinels.
+        """
+        left._check_compatible(right)
+        if len(left) and len(right) and not next(reversed(left)) < next(iter(right)):
+            raise ValueError("every key of left must be smaller than every key of right")
+        host, guest = (left, right) if len(left) >= len(right) else (right, left)
+        host._adopt(guest)
+        tree = host._spawn(host._join2(left.root, right.root), len(left) + len(right))
+        left.clear()
+        right.clear()
+        return tree
+    
+    def union(self, other, workers=1):
+        """Keys in either tree, in O(m log(n/m + 1)) for sizes m <= n
+        
+        Both trees are left empty; values from other win for shared keys.
+        workers > 1 (None: one per CPU) sends large inputs to a process pool.
+        """
+        return self._set_operation(other, 'union', workers)
+    
+    def intersection(self, other, workers=1):
+        """Keys in both trees (values from this one), in O(m log(n/m + 1)); both are left empty"""
+        return self._set_operation(other, 'intersection', workers)
+    
+    def difference(self, other, workers=1):
+        """Keys of this tree missing from other, in O(m log(n/m + 1)); both are left empty"""
+        return self._set_operation(other, 'difference', workers)
+    
+    def _set_operation(self, other, op, workers):
+        self._check_compatible(other)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1 and len(self) + len(other) >= _PARALLEL_SET_MIN:
+            return self._parallel_set_operation(other, op, workers)
+        
+        if min(len(self), len(other)) * _SET_MERGE_RATIO >= max(len(self), len(other)):
+            # Similar sizes: a linear merge of the node lists and a relink wins
+            with _gc_paused():
+                nodes = _combine_nodes(op, self._inorder_nodes(), other._inorder_nodes(),
+                                       self._mapping)
+                tree = self._spawn(self._link_balanced(nodes), len(nodes))
+            self.clear()
+            other.clear()
+            return tree
+        
+        host, guest = (self, other) if len(self) >= len(other) else (other, self)
+        host._adopt(guest)
+        shared = [0]
+        if op == 'union':
+            root = host._union(self.root, other.root, shared)
+            size = len(self) + len(other) - shared[0]
+        elif op == 'intersection':
+            root = host._intersection(self.root, other.root, shared)
+            size = shared[0]
+        else:
+            root = host._difference(self.root, other.root, shared)
+            size = len(self) - shared[0]
+        tree = host._spawn(root, size)
+        self.clear()
+        other.clear()
+        return tree
+    
+    # The recursions below follow one tree's shape, so their depth is its height
+    
+    def _union(self, a, b, shared):
+        nil = self._nil
+        if a is nil:
+            return b
+        if b is nil:
+            return a
+        left, found, right = self._split_root(b, a.key)
+        if found is not None:
+            shared[0] += 1
+            if self._mapping:
+                a.value = found.value
+        a_left, a_right = a.left, a.right
+        return self._join3(self._union(a_left, left, shared), a,
+                           self._union(a_right, right, shared))
+    
+    def _intersection(self, a, b, shared):
+        nil = self._nil
+        if a is nil or b is nil:
+            return nil
+        left, found, right = self._split_root(b, a.key)
+        a_left, a_right = a.left, a.right
+        left = self._intersection(a_left, left, shared)
+        right = self._intersection(a_right, right, shared)
+        if found is None:
+            return self._join2(left, right)
+        shared[0] += 1
+        return self._join3(left, a, right)
+    
+    def _difference(self, a, b, shared):
+        nil = self._nil
+        if a is nil:
+            return nil
+        if b is nil:
+            return a
+        left, found, right = self._split_root(a, b.key)
+        if found is not None:
+            shared[0] += 1
+        b_left, b_right = b.left, b.right
+        return self._join2(self._difference(left, b_left, shared),
+                           self._difference(right, b_right, shared))
+    
+    def _parallel_set_operation(self, other, op, workers):
+        """Merge key ranges in worker processes and rebuild in O(n + m)"""
+        # Workers get packed sorted keys (and values) of one key range each,
+        # never nodes, so pickling stays cheap
+        from concurrent.futures import ProcessPoolExecutor
+        keys_a, keys_b = self.inorder(), other.inorder()
+        values_a = list(self.values()) if self._mapping else None
+        values_b = list(other.values()) if self._mapping else None
+        pivots = keys_a if len(keys_a) >= len(keys_b) else keys_b
+        cuts = [pivots[len(pivots) * i // workers] for i in range(1, workers)]
+        bounds_a = [0] + [bisect_left(keys_a, cut) for cut in cuts] + [len(keys_a)]
+        bounds_b = [0] + [bisect_left(keys_b, cut) for cut in cuts] + [len(keys_b)]
+        tasks = []
+        for i in range(workers):
+            sa, sb = slice(bounds_a[i], bounds_a[i + 1]), slice(bounds_b[i], bounds_b[i + 1])
+            tasks.append((op, _packed(keys_a[sa]), values_a[sa] if values_a is not None else None,
+                          _packed(keys_b[sb]), values_b[sb] if values_b is not None else None))
+        keys, values = [], [] if self._mapping else None
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part_keys, part_values in pool.map(_merge_sorted_runs, tasks):
+                keys.extend(part_keys)
+                if values is not None:
+                    values.extend(part_values)
+        tree = type(self).from_sorted(keys, values, order_stats=self._order_stats,
+                                      mapping=self._mapping, intervals=self._intervals,
+                                      key=self._key_func)
+        self.clear()
+        other.clear()
+        return tree
+
+
+class BST(OrderStatisticsMixin, TraversalMixin, SortedMapMixin, ShapeMixin, SnapshotMixin,
+          KeyFunctionMixin):
+    """Binary Search Tree Implementation
+    
+    key= orders elements by key(element), computed once per element and
+    cached on its node (see KeyFunctionMixin).
+    """
+    node_class = BSTNode
+    _nil = None
+    
+    def __init__(self, order_stats=False, mapping=False, key=None):
         self.root = None
+        self._size = 0
+        self._height = 0  # None when a delete may have lowered it
+        self._version = 0
+        self._order_stats = order_stats
+        self._mapping = mapping = mapping or key is not None
+        self._key_func = key
+        fields = ('size',) * order_stats + ('value',) * mapping + ('max_hi',) * self._intervals
+        self.node_class = _node_type(self.node_class, fields)
+    
+    def __len__(self):
+        return self._size
+    
+    @classmethod
+    def from_sorted(cls, keys, values=None, **options):
+        """Build a height-balanced tree from sorted, distinct keys in O(n)"""
+        if values is not None:
+            options['mapping'] = True
+        elif options.get('key') is not None:
+            raise ValueError("a tree with key= needs its elements as values")
+        tree = cls(**options)
+        with _gc_paused():
+            keys = _sorted_list(keys)
+            nodes = [tree.node_class(key) for key in keys]
+            if values is not None:
+                for node, value in zip(nodes, values):
+                    node.value = value
+            tree.root = tree._link_balanced(nodes)
+            tree._size = len(keys)
+            tree._height = len(keys).bit_length()
+        return tree
+    
+    @classmethod
+    def from_iterable(cls, keys, **options):
+        """Build a height-balanced tree from any keys (sorted, duplicates dropped)"""
+        if options.get('key') is not None:
+            return cls.from_sorted(*_decorated(keys, options['key']), **options)
+        return cls.from_sorted(sorted(set(keys)), **options)
+    
+    def _link_balanced(self, nodes):
+        """Link sorted nodes into a height-balanced subtree and return its root"""
+        # Node for nodes[lo:hi] sits at the midpoint, children at the sub-midpoints
+        sized = self._order_stats
+        stack = [(0, len(nodes))] if nodes else []
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            if sized:
+                node.size = hi - lo
+            if lo < mid:
+                node.left = nodes[(lo + mid) // 2]
+                stack.append((lo, mid))
+            else:
+                node.left = None
+            if mid + 1 < hi:
+                node.right = nodes[(mid + 1 + hi) // 2]
+                stack.append((mid + 1, hi))
+            else:
+                node.right = None
+        return nodes[len(nodes) // 2] if nodes else None
+    
+    def _inorder_nodes(self):
+        nodes = []
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append(node)
+            node = node.right
+        return nodes
+    
+    def insert(self, key):
+        """Insert a key into BST (an element, with key=)"""
+        if self._key_func is not None:
+            self._insert_item(key)
+            return
+        self._insert(key)
+    
+    def _insert(self, key):
+        """Insert key if absent and return the node holding it"""
+        if self.root is None:
+            self.root = node = self.node_class(key)
+            self._size += 1
+            self._height = 1
+            self._version += 1
+            return node
+        if self._order_stats:
+            size = self._size
+            node = self._insert_below(self.root, key)
+            if self._size != size:
+                self._resize_path(key, 1)
+            return node
+        return self._insert_below(self.root, key)
+    
+    def _insert_key(self, key):
+        """_insert with one comparison per level, for trees built with key="""
+        path, found, went_left = _descend(self.root, None, key)
+        if found is not None:
+            return found
+        new = self._attach_leaf(path, went_left, key)
+        if self._order_stats:
+            for node in path:
+                node.size += 1
+        self._reach_depth(len(path) + 1)
+        return new
+    
+    def _attach_leaf(self, path, went_left, key):
+        """Hang a new node for key below the end of a _descend path"""
+        new = self.node_class(key)
+        if not path:
+            self.root = new
+        elif went_left:
+            path[-1].left = new
+        else:
+            path[-1].right = new
+        self._size += 1
+        self._version += 1
+        return new
+    
+    def _resize_path(self, key, delta):
+        """Add delta to the subtree sizes strictly above key's node"""
+        node = self.root
+        while node is not None:
+            if key < node.key:
+                node.size += delta
+                node = node.left
+            elif key > node.key:
+                node.size += delta
+                node = node.right
+            else:
+                return
+    
+    def _insert_below(self, node, key, depth=1):
+        # depth is node's depth; the new leaf ends up one level below the last node
+        while True:
+            depth += 1
+            if key < node.key:
+                if node.left is None:
+                    node.left = new = self.node_class(key)
+                    break
+                node = node.left
+            elif key > node.key:
+                if node.right is None:
+                    node.right = new = self.node_class(key)
+                    break
+                node = node.right
+            else:
+                return node
+        self._size += 1
+        self._version += 1
+        height = self._height
+        if height is not None and depth > height:
+            self._height = depth
+        return new
+    
+    def _reach_depth(self, depth):
+        """Note that the tree now reaches depth"""
+        if self._height is not None and depth > self._height:
+            self._height = depth
+    
+    def insert_many(self, keys):
+        """Insert a batch of keys in one shared descent"""
+        # Each run of new keys that lands on the same empty child slot is
+        # attached there as a balanced subtree
+        if self._key_func is not None:
+            self._insert_items(keys)
+            return
+        batch = _sorted_unique(keys)
+        make = self.node_class
+        if self.root is None:
+            self.root = self._link_balanced([make(key) for key in batch])
+            self._size += len(batch)
+            self._height = len(batch).bit_length()
+            self._version += 1
+            return
+        
+        sized = self._order_stats
+        touched = []
+        stack = [(self.root, 0, len(batch), 1)] if batch else []
+        while stack:
+            node, lo, hi, depth = stack.pop()
+            if hi - lo == 1 and not sized:
+                self._insert_below(node, batch[lo], depth)
+                continue
+            if sized:
+                touched.append(node)
+            i = bisect_left(batch, node.key, lo, hi)
+            j = i + 1 if i < hi and batch[i] == node.key else i
+            if lo < i:
+                if node.left is None:
+                    node.left = self._link_balanced([make(key) for key in batch[lo:i]])
+                    self._size += i - lo
+                    self._reach_depth(depth + (i - lo).bit_length())
+                    self._version += 1
+                else:
+                    stack.append((node.left, lo, i, depth + 1))
+            if j < hi:
+                if node.right is None:
+                    node.right = self._link_balanced([make(key) for key in batch[j:hi]])
+                    self._size += hi - j
+                    self._reach_depth(depth + (hi - j).bit_length())
+                    self._version += 1
+                else:
+                    stack.append((node.right, j, hi, depth + 1))
+        
+        # Parents precede children in touched, so sizes settle bottom-up
+        # (touched is only filled for order-statistics trees)
+        for node in reversed(touched):
+            node.size = (1 + (node.left.size if node.left is not None else 0)
+                         + (node.right.size if node.right is not None else 0))
+    
+    def search_many(self, keys):
+        """Search a batch of keys; a NumPy array yields a boolean mask instead"""
+        return _batch_results(self, self._keys_of(keys), None, as_mask=False)
+    
+    def contains_many(self, keys):
+        """Boolean membership mask for a batch of keys"""
+        return _batch_results(self, self._keys_of(keys), None, as_mask=True)
+    
+    def delete_many(self, keys):
+        """Delete a batch of keys"""
+        # Deletion keeps the BST shape under study, so keys go one by one
+        for key in _sorted_unique(self._keys_of(keys)):
+            self._delete(key)
+    
+    def search(self, key):
+        """Search for a key in BST (an element, with key=)"""
+        if self._key_func is not None:
+            return self._search_key(self._key_func(key))
+        return self._search(self.root, key)
+    
+    def _search(self, node, key):
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node
+        return None
+    
+    def delete(self, key):
+        """Delete a key from BST (an element, with key=)"""
+        self._delete(key if self._key_func is None else self._key_func(key))
+    
+    def _delete(self, key):
+        """Remove key and return its value (_MISSING if absent)"""
+        parent = None
+        node = self.root
+        depth = 1
+        while node is not None and node.key != key:
+            parent = node
+            node = node.left if key < node.key else node.right
+            depth += 1
+        if node is None:
+            return _MISSING
+        self._size -= 1
+        self._version += 1
+        value = node.value if self._mapping else None
+        sized = self._order_stats
+        if sized:
+            self._resize_path(key, -1)
+        
+        if node.left is not None and node.right is not None:
+            # Two children: copy the successor up and unlink it instead
+            parent = node
+            successor = node.right
+            depth += 1
+            while successor.left is not None:
+                if sized:
+                    parent.size -= 1
+                parent = successor
+                successor = successor.left
+                depth += 1
+            if sized:
+                parent.size -= 1
+            node.key = successor.key
+            if self._mapping:
+                node.value = successor.value
+            node = successor
+        
+        child = node.left if node.left is not None else node.right
+        self._replace_child(parent, node, child)
+        if child is not None or depth == self._height:
+            # The deepest level may be gone; recount on the next get_height
+            self._height = None
+        return value
+    
+    def _replace_child(self, parent, node, child):
+        if parent is None:
+            self.root = child
+        elif parent.left is node:
+            parent.left = child
+        else:
+            parent.right = child
+    
+    def _min_value_node(self, node):
+        current = node
+        while current.left is not None:
+            current = current.left
+        return current
+    
+    def find_min(self):
+        """Find minimum key in BST"""
+        return self._find_min(self.root)
+    
+    def _find_min(self, node):
+        if node is None:
+            return None
+        while node.left is not None:
+            node = node.left
+        return node.key
+    
+    def find_max(self):
+        """Find maximum key in BST"""
+        return self._find_max(self.root)
+    
+    def _find_max(self, node):
+        if node is None:
+            return None
+        while node.right is not None:
+            node = node.right
+        return node.key
+    
+    def preorder(self):
+        """Preorder traversal (Root-Left-Right)"""
+        result = []
+        self._preorder(self.root, result)
+        return result
+    
+    def _preorder(self, node, result):
+        stack = [node] if node else []
+        while stack:
+            node = stack.pop()
+            result.append(node.key)
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
+    
+    def inorder(self):
+        """Inorder traversal (Left-Root-Right) - returns sorted order"""
+        result = []
+        self._inorder(self.root, result)
+        return result
+    
+    def _inorder(self, node, result):
+        stack = []
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            result.append(node.key)
+            node = node.right
+    
+    def postorder(self):
+        """Postorder traversal (Left-Right-Root)"""
+        result = []
+        self._postorder(self.root, result)
+        return result
+    
+    def _postorder(self, node, result):
+        # Reverse of a Root-Right-Left walk
+        stack = [node] if node else []
+        start = len(result)
+        while stack:
+            node = stack.pop()
+            result.append(node.key)
+            if node.left:
+                stack.append(node.left)
+            if node.right:
+                stack.append(node.right)
+        result[start:] = result[start:][::-1]
+    
+    def level_order(self):
+        """Level-order traversal (Breadth-First Search)"""
+        return list(self.iter_level_order())
+    
+    def get_height(self):
+        """Get height of the tree (cached; recounted once after a shrinking delete)"""
+        if self._height is None:
+            self._height = self._get_height(self.root)
+        return self._height
+    
+    def _get_height(self, node):
+        # Count levels breadth-first instead of recursing per node
+        height = 0
+        level = [node] if node else []
+        while level:
+            height += 1
+            level = [child for n in level for child in (n.left, n.right) if child]
+        return height
+
+
+class AVLTree(BST, JoinMixin, IntervalMixin):
+    """AVL Tree Implementation (Self-balancing BST)
+    
+    intervals=True stores (lo, hi) keys with a subtree max endpoint for
+    overlap and stabbing queries; key= works as in BST.
+    """
+    node_class = AVLNode
+    
+    def __init__(self, order_stats=False, mapping=False, intervals=False, key=None):
+        self._intervals = intervals
+        super().__init__(order_stats, mapping, key)
+    
+    def get_height(self):
+        """Get height of the tree, read from the root in O(1)"""
+        return self._get_height(self.root)
+    
+    def _get_height(self, node):
+        if node is None:
+            return 0
+        return node.height
+    
+    def _check_node(self, node, left, right, height):
+        _invariant(node.height == height,
+                   f"node {node.key!r} caches height {node.height}, not {height}")
+        _invariant(abs(left[0] - right[0]) <= 1, f"node {node.key!r} is out of AVL balance")
+        return 0
+    
+    def _get_balance(self, node):
+        if node is None:
+            return 0
+        return self._get_height(node.left) - self._get_height(node.right)
+    
+    def _update_node(self, node):
+        """Recompute the cached height (and subtree size, max_hi) from the children"""
+        if node:
+            left = node.left.height if node.left else 0
+            right = node.right.height if node.right else 0
+            node.height = 1 + (left if left > right else right)
+            if self._order_stats:
+                node.size = (1 + (node.left.size if node.left else 0)
+                             + (node.right.size if node.right else 0))
+            if self._intervals:
+                node.max_hi = _subtree_max_hi(node, None)
+    
+    def _link_balanced(self, nodes):
+        # A midpoint-split subtree of m nodes has height m.bit_length()
+        sized = self._order_stats
+        linked = [] if self._intervals else None
+        stack = [(0, len(nodes))] if nodes else []
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            node.height = (hi - lo).bit_length()
+            if sized:
+                node.size = hi - lo
+            if linked is not None:
+                linked.append(node)
+            if lo < mid:
+                node.left = nodes[(lo + mid) // 2]
+                stack.append((lo, mid))
+            else:
+                node.left = None
+            if mid + 1 < hi:
+                node.right = nodes[(mid + 1 + hi) // 2]
+                stack.append((mid + 1, hi))
+            else:
+                node.right = None
+        if linked is not None:
+            _settle_max_hi(linked, None)
+        return nodes[len(nodes) // 2] if nodes else None
+    
+    def _rotate_right(self, y):
+        x = y.left
+        T2 = x.right
+        
+        x.right = y
+        y.left = T2
+        
+        self._update_node(y)
+        self._update_node(x)
+        
+        return x
+    
+    def _rotate_left(self, x):
+        y = x.right
+        T2 = y.left
+        
+        y.left = x
+        x.right = T2
+        
+        self._update_node(x)
+        self._update_node(y)
+        
+        return y
+    
+    def _rebalance(self, node):
+        """Restore the AVL property at node, returning the new subtree root"""
+        balance = self._get_balance(node)
+        
+        if balance > 1:
+            # LR Case reduces to LL
+            if self._get_balance(node.left) < 0:
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        
+        if balance < -1:
+            # RL Case reduces to RR
+            if self._get_balance(node.right) > 0:
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        
+        return node
+    
+    def _insert(self, key):
+        node = self.root
+        if node is None:
+            self.root = node = self.node_class(key)
+            self._size += 1
+            self._version += 1
+            return node
+        
+        path = []
+        while node is not None:
+            path.append(node)
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node  # Duplicates not allowed
+        
+        parent = path[-1]
+        new = self.node_class(key)
+        if key < parent.key:
+            parent.left = new
+        else:
+            parent.right = new
+        self._size += 1
+        self._version += 1
+        
+        self._retrace(path)
+        return new
+    
+    def _insert_key(self, key):
+        path, found, went_left = _descend(self.root, None, key)
+        if found is not None:
+            return found
+        new = self._attach_leaf(path, went_left, key)
+        self._retrace(path)
+        return new
+    
+    def insert_many(self, keys):
+        """Insert a batch of keys, merging large batches in a single pass"""
+        if self._key_func is not None:
+            self._insert_items(keys)
+            return
+        batch = _sorted_unique(keys)
+        if len(batch) * _REBUILD_FACTOR >= self._size:
+            with _gc_paused():
+                nodes = _merge_nodes(self._inorder_nodes(), batch, self.node_class)
+                self.root = self._link_balanced(nodes)
+                self._size = len(nodes)
+                self._version += 1
+        else:
+            for key in batch:
+                self.insert(key)
+    
+    def delete(self, key):
+        """Delete a key, rebalancing on the way back up"""
+        self._delete(key if self._key_func is None else self._key_func(key))
+    
+    def _delete(self, key):
+        path = []
+        node = self.root
+        while node is not None:
+            if key < node.key:
+                path.append(node)
+                node = node.left
+            elif key > node.key:
+                path.append(node)
+                node = node.right
+            else:
+                break
+        if node is None:
+            return _MISSING
+        self._size -= 1
+        self._version += 1
+        value = node.value if self._mapping else None
+        rekeyed = None
+        
+        if node.left is not None and node.right is not None:
+            # Two children: copy the successor up and unlink it instead
+            rekeyed = len(path)
+            path.append(node)
+            successor = node.right
+            while successor.left is not None:
+                path.append(successor)
+                successor = successor.left
+            node.key = successor.key
+            if self._mapping:
+                node.value = successor.value
+            node = successor
+        
+        child = node.left if node.left is not None else node.right
+        self._replace_child(path[-1] if path else None, node, child)
+        self._retrace(path, rekeyed)
+        return value
+    
+    def delete_many(self, keys):
+        """Delete a batch of keys, filtering large batches in a single pass"""
+        batch = _sorted_unique(self._keys_of(keys))
+        if len(batch) * _REBUILD_FACTOR >= self._size:
+            nodes = _drop_nodes(self._inorder_nodes(), batch)
+            self.root = self._link_balanced(nodes)
+            self._size = len(nodes)
+            self._version += 1
+        else:
+            for key in batch:
+                self._delete(key)
+    
+    def _join3(self, left, node, right):
+        """Join left < node < right into one AVL subtree and return its root"""
+        left_height = left.height if left else 0
+        right_height = right.height if right else 0
+        if abs(left_height - right_height) <= 1:
+            node.left, node.right = left, right
+            self._update_node(node)
+            return node
+        
+        # Hang node off the taller tree's inner spine where the heights meet,
+        # then rebalance upward as after an insert
+        path = []
+        if left_height > right_height:
+            spine = left
+            while spine is not None and spine.height > right_height + 1:
+                path.append(spine)
+                spine = spine.right
+            node.left, node.right = spine, right
+            path[-1].right = node
+        else:
+            spine = right
+            while spine is not None and spine.height > left_height + 1:
+                path.append(spine)
+                spine = spine.left
+            node.left, node.right = left, spine
+            path[-1].left = node
+        self._update_node(node)
+        saved = self._lend_root(path[0])
+        self._retrace(path)
+        return self._reclaim_root(saved)
+    
+    def _retrace(self, path, rekeyed=None):
+        """Update heights and rebalance bottom-up along a root-to-node path
+        
+        rekeyed is the index in path of a node whose key a delete replaced;
+        in interval mode its max_hi is recomputed even if nothing below changed.
+        """
+        intervals = self._intervals
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            old_height = node.height
+            if intervals:
+                old_max_hi = node.max_hi
+            self._update_node(node)
+            subtree = self._rebalance(node)
+            if subtree is not node:
+                if i == 0:
+                    self.root = subtree
+                elif path[i - 1].left is node:
+                    path[i - 1].left = subtree
+                else:
+                    path[i - 1].right = subtree
+            if (subtree.height == old_height and not self._order_stats
+                    and (not intervals or subtree.max_hi == old_max_hi
+                         and (rekeyed is None or i <= rekeyed))):
+                # Nothing above this point can change
+                return
+
+
+class RedBlackTree(OrderStatisticsMixin, TraversalMixin, SortedMapMixin, ShapeMixin,
+                   SnapshotMixin, JoinMixin, IntervalMixin, KeyFunctionMixin):
+    """Red-Black Tree Implementation
+    
+    intervals=True stores (lo, hi) keys with a subtree max endpoint for
+    overlap and stabbing queries. key= orders elements by key(element),
+    computed once per element and cached on its node (see KeyFunctionMixin).
+    """
+    node_class = RBNode
+    
+    def __init__(self, order_stats=False, mapping=False, intervals=False, key=None):
+        self._order_stats = order_stats
+        self._mapping = mapping = mapping or key is not None
+        self._key_func = key
+        self._intervals = intervals
+        fields = ('size',) * order_stats + ('value',) * mapping + ('max_hi',) * intervals
+        self.node_class = _node_type(self.node_class, fields)
+        self.NIL = self._nil = self._new_nil()
+        self.root = self.NIL
+        self._size = 0
+        self._version = 0
+    
+    def _new_nil(self):
+        nil = self.node_class((0, 0) if self._intervals else 0)
+        nil.color = 0  # black
+        nil.height = 0
+        if self._order_stats:
+            nil.size = 0
+        return nil
+    
+    def __len__(self):
+        return self._size
+    
+    @classmethod
+    def from_sorted(cls, keys, values=None, **options):
+        """Build a valid Red-Black tree from sorted, distinct keys in O(n)"""
+        if values is not None:
+            options['mapping'] = True
+        elif options.get('key') is not None:
+            raise ValueError("a tree with key= needs its elements as values")
+        tree = cls(**options)
+        with _gc_paused():
+            keys = _sorted_list(keys)
+            nodes = [tree.node_class(key) for key in keys]
+            if values is not None:
+                for node, value in zip(nodes, values):
+                    node.value = value
+            tree.root = tree._link_balanced(nodes)
+            tree._size = len(keys)
+        return tree
+    
+    @classmethod
+    def from_iterable(cls, keys, **options):
+        """Build a Red-Black tree from any keys (sorted, duplicates dropped)"""
+        if options.get('key') is not None:
+            return cls.from_sorted(*_decorated(keys, options['key']), **options)
+        return cls.from_sorted(sorted(set(keys)), **options)
+    
+    def _link_balanced(self, nodes):
+        """Link sorted nodes into a balanced, validly colored tree and return its root"""
+        # Every level of a midpoint-split tree is full except possibly the
+        # deepest one; those nodes are red, everything above is black.
+        NIL = self.NIL
+        sized = self._order_stats
+        linked = [] if self._intervals else None
+        n = len(nodes)
+        full_levels = (n + 1).bit_length() - 1
+        stack = [(0, n, None, 0)] if nodes else []
+        while stack:
+            lo, hi, parent, depth = stack.pop()
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            node.parent = parent
+            node.color = 1 if depth >= full_levels else 0
+            node.height = (hi - lo).bit_length()
+            if sized:
+                node.size = hi - lo
+            if linked is not None:
+                linked.append(node)
+            if lo < mid:
+                node.left = nodes[(lo + mid) // 2]
+                stack.append((lo, mid, node, depth + 1))
+            else:
+                node.left = NIL
+            if mid + 1 < hi:
+                node.right = nodes[(mid + 1 + hi) // 2]
+                stack.append((mid + 1, hi, node, depth + 1))
+            else:
+                node.right = NIL
+        if linked is not None:
+            _settle_max_hi(linked, NIL)
+        return nodes[n // 2] if nodes else NIL
+    
+    def _inorder_nodes(self):
+        NIL = self.NIL
+        nodes = []
+        stack = []
+        node = self.root
+        while stack or node is not NIL:
+            while node is not NIL:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append(node)
+            node = node.right
+        return nodes
+    
+    def insert(self, key):
+        if self._key_func is not None:
+            self._insert_item(key)
+            return
+        self._insert(key)
+    
+    def _insert(self, key):
+        """Insert key if absent and return the node holding it"""
+        y = None
+        x = self.root
+        
+        while x is not self.NIL:
+            y = x
+            if key < x.key:
+                x = x.left
+            elif key > x.key:
+                x = x.right
+            else:
+                return x  # Duplicates not allowed
+        return self._insert_leaf(y, key, y is not None and key < y.key)
+    
+    def _insert_key(self, key):
+        """_insert with one comparison per level, for trees built with key="""
+        path, found, went_left = _descend(self.root, self.NIL, key)
+        if found is not None:
+            return found
+        return self._insert_leaf(path[-1] if path else None, key, went_left)
+    
+    def _insert_leaf(self, y, key, went_left):
+        """Hang a new red node for key below y (the root if None) and rebalance"""
+        node = self.node_class(key)  # new node is red
+        node.left = self.NIL
+        node.right = self.NIL
+        self._size += 1
+        self._version += 1
+        node.parent = y
+        if self._order_stats:
+            ancestor = y
+            while ancestor is not None:
+                ancestor.size += 1
+                ancestor = ancestor.parent
+        if self._intervals:
+            self._raise_max_hi(y, node.max_hi)
+        if y is None:
+            self.root = node
+        elif went_left:
+            y.left = node
+        else:
+            y.right = node
+        # The new leaf can only lengthen the paths above it
+        ancestor = y
+        height = 2
+        while ancestor is not None and ancestor.height < height:
+            ancestor.height = height
+            ancestor = ancestor.parent
+            height += 1
+        
+        if node.parent is None:
+            node.color = 0
+            return node
+        
+        if node.parent.parent is None:
+            return node
+        
+        self._fix_insert(node)
+        return node
+    
+    def _fix_insert(self, k):
+        while k.parent and k.parent.color == 1:
+            if k.parent == k.parent.parent.right:
+                u = k.parent.parent.left  # uncle
+                if u.color == 1:
+                    u.color = 0
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    k = k.parent.parent
+                else:
+                    if k == k.parent.left:
+                        k = k.parent
+                        self._rotate_right(k)
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    self._rotate_left(k.parent.parent)
+            else:
+                u = k.parent.parent.right  # uncle
+                if u.color == 1:
+                    u.color = 0
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    k = k.parent.parent
+                else:
+                    if k == k.parent.right:
+                        k = k.parent
+                        self._rotate_left(k)
+                    k.parent.color = 0
+                    k.parent.parent.color = 1
+                    self._rotate_right(k.parent.parent)
+            if k == self.root:
+                break
+        self.root.color = 0
+    
+    def _rotate_left(self, x):
+        y = x.right
+        x.right = y.left
+        if y.left != self.NIL:
+            y.left.parent = x
+        
+        y.parent = x.parent
+        if x.parent is None:
+            self.root = y
+        elif x == x.parent.left:
+            x.parent.left = y
+        else:
+            x.parent.right = y
+        
+        y.left = x
+        x.parent = y
+        
+        if self._order_stats:
+            y.size = x.size
+            x.size = x.left.size + x.right.size + 1
+        if self._intervals:
+            y.max_hi = x.max_hi
+            x.max_hi = _subtree_max_hi(x, self.NIL)
+        left = x.left.height
+        right = x.right.height
+        x.height = height = 1 + (left if left > right else right)
+        other = y.right.height
+        y.height = 1 + (height if height > other else other)
+        self._raise_heights(y.parent)
+    
+    def _rotate_right(self, x):
+        y = x.left
+        x.left = y.right
+        if y.right != self.NIL:
+            y.right.parent = x
+        
+        y.parent = x.parent
+        if x.parent is None:
+            self.root = y
+        elif x == x.parent.right:
+            x.parent.right = y
+        else:
+            x.parent.left = y
+        
+        y.right = x
+        x.parent = y
+        
+        if self._order_stats:
+            y.size = x.size
+            x.size = x.left.size + x.right.size + 1
+        if self._intervals:
+            y.max_hi = x.max_hi
+            x.max_hi = _subtree_max_hi(x, self.NIL)
+        left = x.left.height
+        right = x.right.height
+        x.height = height = 1 + (left if left > right else right)
+        other = y.left.height
+        y.height = 1 + (height if height > other else other)
+        self._raise_heights(y.parent)
+    
+    def _raise_max_hi(self, node, hi):
+        """Raise max_hi from node upward to cover an interval ending at hi"""
+        while node is not None and node.max_hi < hi:
+            node.max_hi = hi
+            node = node.parent
+    
+    def _refresh_max_hi(self, node, moved=None):
+        """Recompute max_hi from node upward after a removal
+        
+        Stops at the first unchanged value, but not below moved, a node that
+        took over the removed node's place (and its old max_hi).
+        """
+        NIL = self.NIL
+        while node is not None:
+            hi = _subtree_max_hi(node, NIL)
+            if node is moved:
+                moved = None
+            if hi == node.max_hi and moved is None:
+                return
+            node.max_hi = hi
+            node = node.parent
+    
+    def _raise_heights(self, node):
+        """Recompute cached heights from node upward until one is unchanged"""
+        while node is not None:
+            left = node.left.height
+            right = node.right.height
+            height = 1 + (left if left > right else right)
+            if height == node.height:
+                return
+            node.height = height
+            node = node.parent
+    
+    def insert_many(self, keys):
+        """Insert a batch of keys, merging large batches in a single pass"""
+        if self._key_func is not None:
+            self._insert_items(keys)
+            return
+        batch = _sorted_unique(keys)
+        if len(batch) * _REBUILD_FACTOR >= self._size:
+            with _gc_paused():
+                nodes = _merge_nodes(self._inorder_nodes(), batch, self.node_class)
+                self.root = self._link_balanced(nodes)
+                self._size = len(nodes)
+                self._version += 1
+        else:
+            for key in batch:
+                self.insert(key)
+    
+    def delete(self, key):
+        """Delete a key and restore the Red-Black properties"""
+        self._delete(key if self._key_func is None else self._key_func(key))
+    
+    def _delete(self, key):
+        """Remove key and return its value (_MISSING if absent)"""
+        NIL = self.NIL
+        z = self._search(self.root, key)
+        if z is NIL:
+            return _MISSING
+        self._size -= 1
+        self._version += 1
+        value = z.value if self._mapping else None
+        
+        if self._order_stats:
+            # Every ancestor of the node that physically leaves loses one key
+            removed = z
+            if z.left is not NIL and z.right is not NIL:
+                removed = z.right
+                while removed.left is not NIL:
+                    removed = removed.left
+            ancestor = removed.parent
+            while ancestor is not None:
+                ancestor.size -= 1
+                ancestor = ancestor.parent
+        
+        y = z
+        y_color = y.color
+        moved = None
+        if z.left is NIL:
+            x = z.right
+            self._transplant(z, z.right)
+        elif z.right is NIL:
+            x = z.left
+            self._transplant(z, z.left)
+        else:
+            # Two children: the successor takes z's place and color
+            y = z.right
+            while y.left is not NIL:
+                y = y.left
+            y_color = y.color
+            x = y.right
+            if y.parent is z:
+                x.parent = y
+            else:
+                self._transplant(y, y.right)
+                y.right = z.right
+                y.right.parent = y
+            self._transplant(z, y)
+            y.left = z.left
+            y.left.parent = y
+            y.color = z.color
+            y.height = z.height
+            if self._order_stats:
+                y.size = z.size
+            if self._intervals:
+                y.max_hi = z.max_hi
+                moved = y
+        # Heights below x's parent are unchanged; x itself may be NIL
+        self._raise_heights(x.parent)
+        if self._intervals:
+            self._refresh_max_hi(x.parent, moved)
+        
+        if y_color == 0:
+            self._fix_delete(x)
+        return value
+    
+    def _transplant(self, u, v):
+        if u.parent is None:
+            self.root = v
+        elif u is u.parent.left:
+            u.parent.left = v
+        else:
+            u.parent.right = v
+        v.parent = u.parent
+    
+    def _fix_delete(self, x):
+        # x carries an extra black; push it up or resolve it with rotations
+        while x is not self.root and x.color == 0:
+            if x is x.parent.left:
+                w = x.parent.right  # sibling
+                if w.color == 1:
+                    w.color = 0
+                    x.parent.color = 1
+                    self._rotate_left(x.parent)
+                    w = x.parent.right
+                if w.left.color == 0 and w.right.color == 0:
+                    w.color = 1
+                    x = x.parent
+                else:
+                    if w.right.color == 0:
+                        w.left.color = 0
+                        w.color = 1
+                        self._rotate_right(w)
+                        w = x.parent.right
+                    w.color = x.parent.color
+                    x.parent.color = 0
+                    w.right.color = 0
+                    self._rotate_left(x.parent)
+                    x = self.root
+            else:
+                w = x.parent.left  # sibling
+                if w.color == 1:
+                    w.color = 0
+                    x.parent.color = 1
+                    self._rotate_right(x.parent)
+                    w = x.parent.left
+                if w.left.color == 0 and w.right.color == 0:
+                    w.color = 1
+                    x = x.parent
+                else:
+                    if w.left.color == 0:
+                        w.right.color = 0
+                        w.color = 1
+                        self._rotate_left(w)
+                        w = x.parent.left
+                    w.color = x.parent.color
+                    x.parent.color = 0
+                    w.left.color = 0
+                    self._rotate_right(x.parent)
+                    x = self.root
+        x.color = 0
+    
+    def delete_many(self, keys):
+        """Delete a batch of keys, filtering large batches in a single pass"""
+        batch = _sorted_unique(self._keys_of(keys))
+        if len(batch) * _REBUILD_FACTOR >= self._size:
+            nodes = _drop_nodes(self._inorder_nodes(), batch)
+            self.root = self._link_balanced(nodes)
+            self._size = len(nodes)
+            self._version += 1
+        else:
+            for key in batch:
+                self._delete(key)
+    
+    def _as_root(self, root):
+        if root is not self.NIL:
+            root.parent = None
+            root.color = 0
+        return root
+    
+    def _adopt(self, tree):
+        """Re-point tree's leaves at this tree's NIL sentinel, in O(len(tree))"""
+        tree._replace_nil(self.NIL)
+    
+    def own_sentinel(self):
+        """Give this tree a NIL sentinel of its own, in O(n)
+        
+        Trees split from one tree share its sentinel, which deletes write to,
+        so they cannot be written concurrently until each has its own.
+        """
+        self._replace_nil(self._new_nil())
+    
+    def _replace_nil(self, NIL):
+        old = self.NIL
+        if old is NIL:
+            return
+        stack = [self.root] if self.root is not old else []
+        while stack:
+            node = stack.pop()
+            if node.left is old:
+                node.left = NIL
+            else:
+                stack.append(node.left)
+            if node.right is old:
+                node.right = NIL
+            else:
+                stack.append(node.right)
+        if self.root is old:
+            self.root = NIL
+        self.NIL = self._nil = NIL
+    
+    def _black_height(self, node):
+        height = 0
+        while node is not self.NIL:
+            height += node.color == 0
+            node = node.left
+        return height
+    
+    def _join3(self, left, node, right):
+        """Join left < node < right into one Red-Black subtree and return its root"""
+        NIL = self.NIL
+        sized = self._order_stats
+        left = self._as_root(left)
+        right = self._as_root(right)
+        left_black, right_black = self._black_height(left), self._black_height(right)
+        if left_black == right_black:
+            node.left, node.right, node.parent, node.color = left, right, None, 0
+            for child in (left, right):
+                if child is not NIL:
+                    child.parent = node
+            node.height = 1 + max(left.height, right.height)
+            if sized:
+                node.size = left.size + right.size + 1
+            if self._intervals:
+                node.max_hi = _subtree_max_hi(node, NIL)
+            return node
+        
+        # Walk the taller tree's inner spine down to the black node with the
+        # other tree's black height, put node there in red and fix upward
+        if left_black > right_black:
+            spine = left
+            black = left_black
+            while spine.color == 1 or black > right_black:
+                black -= spine.color == 0
+                parent, spine = spine, spine.right
+            parent.right = node
+            node.left, node.right = spine, right
+            other = right
+        else:
+            spine = right
+            black = right_black
+            while spine.color == 1 or black > left_black:
+                black -= spine.color == 0
+                parent, spine = spine, spine.left
+            parent.left = node
+            node.left, node.right = left, spine
+            other = left
+        node.parent = parent
+        node.color = 1
+        for child in (spine, other):
+            if child is not NIL:
+                child.parent = node
+        node.height = 1 + max(node.left.height, node.right.height)
+        if sized:
+            node.size = node.left.size + node.right.size + 1
+            ancestor = parent
+            while ancestor is not None:
+                ancestor.size += other.size + 1
+                ancestor = ancestor.parent
+        if self._intervals:
+            node.max_hi = _subtree_max_hi(node, NIL)
+            self._raise_max_hi(parent, node.max_hi)
+        self._raise_heights(parent)
+        saved = self._lend_root(left if left_black > right_black else right)
+        self._fix_insert(node)
+        return self._reclaim_root(saved)
+    
+    def search(self, key):
+        if self._key_func is not None:
+            return self._search_key(self._key_func(key))
+        return self._search(self.root, key)
+    
+    def search_many(self, keys):
+        """Search a batch of keys; a NumPy array yields a boolean mask instead"""
+        return _batch_results(self, self._keys_of(keys), self.NIL, as_mask=False)
+    
+    def contains_many(self, keys):
+        """Boolean membership mask for a batch of keys"""
+        return _batch_results(self, self._keys_of(keys), self.NIL, as_mask=True)
+    
+    def _search(self, node, key):
+        NIL = self.NIL
+        while node is not NIL:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node
+        return NIL
+    
+    def get_height(self):
+        """Get height of Red-Black tree, read from the root in O(1)"""
+        return self.root.height
+    
+    def _get_height(self, node):
+        return node.height
+    
+    def validate(self):
+        super().validate()
+        _invariant(self.root.color == 0, "root is red")
+        _invariant(self.root is self.NIL or self.root.parent is None, "root has a parent")
+    
+    def _check_node(self, node, left, right, height):
+        NIL = self.NIL
+        _invariant(node.height == height,
+                   f"node {node.key!r} caches height {node.height}, not {height}")
+        _invariant(left[2] == right[2], f"node {node.key!r} has unequal black heights")
+        for child in (node.left, node.right):
+            if child is not NIL:
+                _invariant(child.parent is node, f"node {child.key!r} has a stale parent pointer")
+                _invariant(node.color == 0 or child.color == 0,
+                           f"red node {node.key!r} has a red child")
+        return left[2] + (node.color == 0)
+    
+    def inorder(self):
+        """Inorder traversal of Red-Black tree"""
+        result = []
+        self._inorder(self.root, result)
+        return result
+    
+    def _inorder(self, node, result):
+        NIL = self.NIL
+        stack = []
+        while stack or node is not NIL:
+            while node is not NIL:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            result.append(node.key)
+            node = node.right
+
+
+class SplayTree(BST):
+    """Splay tree: every access rotates the touched node up to the root
+    
+    Operations cost O(log n) amortized and recently used keys stay near the
+    root, which suits skewed or bursty lookups. Searches restructure the
+    tree, so the height is recounted lazily and cursors restart at the root.
+    """
+    
+    def __init__(self, order_stats=False, mapping=False, key=None):
+        super().__init__(order_stats, mapping, key)
+        self._header = BSTNode(None)
+    
+    # Keyed lookups and inserts splay too, so they keep the splaying descent
+    def _search_key(self, key):
+        return self._search(self.root, key)
+    
+    def _insert_key(self, key):
+        return self._insert(key)
+    
+    def _splay(self, key):
+        """Top-down splay: bring key, or the last node on its search path, to the root"""
+        t = self.root
+        if t is None:
+            return None
+        # Nodes smaller than key collect on the right spine of header.right,
+        # larger ones on the left spine of header.left
+        header = self._header
+        header.left = header.right = None
+        left = right = header
+        sized = self._order_stats
+        lefts, rights = [], []
+        while True:
+            if key < t.key:
+                y = t.left
+                if y is None:
+                    break
+                if key < y.key:
+                    # Zig-zig: rotate right first
+                    t.left = y.right
+                    y.right = t
+                    if sized:
+                        t.size = (1 + (t.left.size if t.left else 0)
+                                  + (t.right.size if t.right else 0))
+                    t = y
+                    if t.left is None:
+                        break
+                right.left = right = t
+                if sized:
+                    rights.append(t)
+                t = t.left
+            elif key > t.key:
+                y = t.right
+                if y is None:
+                    break
+                if key > y.key:
+                    t.right = y.left
+                    y.left = t
+                    if sized:
+                        t.size = (1 + (t.left.size if t.left else 0)
+                                  + (t.right.size if t.right else 0))
+                    t = y
+                    if t.right is None:
+                        break
+                left.right = left = t
+                if sized:
+                    lefts.append(t)
+                t = t.right
+            else:
+                break
+        left.right = t.left
+        right.left = t.right
+        t.left = header.right
+        t.right = header.left
+        if sized:
+            # Spine nodes were linked top-down, so sizes settle in reverse
+            for node in reversed(lefts):
+                node.size = (1 + (node.left.size if node.left else 0)
+                             + (node.right.size if node.right else 0))
+            for node in reversed(rights):
+                node.size = (1 + (node.left.size if node.left else 0)
+                             + (node.right.size if node.right else 0))
+            t.size = (1 + (t.left.size if t.left else 0)
+                      + (t.right.size if t.right else 0))
+        if t is not self.root:
+            self.root = t
+            self._height = None
+            self._version += 1
+        return t
+    
+    def _search(self, node, key):
+        node = self._splay(key)
+        return node if node is not None and node.key == key else None
+    
+    def _insert(self, key):
+        root = self._splay(key)
+        if root is not None and root.key == key:
+            return root
+        # The splayed root is key's neighbour, so key splits it from one subtree
+        new = self.node_class(key)
+        if root is None:
+            self._height = 1
+        else:
+            if key < root.key:
+                new.left = root.left
+                new.right = root
+                root.left = None
+            else:
+                new.right = root.right
+                new.left = root
+                root.right = None
+            if self._order_stats:
+                root.size = (1 + (root.left.size if root.left else 0)
+                             + (root.right.size if root.right else 0))
+                new.size = (1 + (new.left.size if new.left else 0)
+                            + (new.right.size if new.right else 0))
+            self._height = None
+        self.root = new
+        self._size += 1
+        self._version += 1
+        return new
+    
+    def _delete(self, key):
+        root = self._splay(key)
+        if root is None or root.key != key:
+            return _MISSING
+        self._size -= 1
+        self._version += 1
+        self._height = None
+        value = root.value if self._mapping else None
+        right = root.right
+        if root.left is None:
+            self.root = right
+            return value
+        # key is larger than everything on the left, so splaying it there
+        # brings up the left maximum, which has no right child
+        self.root = root.left
+        top = self._splay(key)
+        top.right = right
+        if self._order_stats:
+            top.size += right.size if right else 0
+        return value
+
+
+class Treap(BST):
+    """Treap: a BST on the keys that is also a max-heap on random priorities
+    
+    The expected height is O(log n) for any insertion order. Updates are
+    built on split and merge, which are public too: split() carves a treap
+    at a key and join() concatenates two, both in expected O(log n). Subtree
+    sizes are always kept (split needs them for len), so rank/select work;
+    order_stats is accepted like on the other trees, but False changes nothing.
+    """
+    node_class = TreapNode
+    
+    def __init__(self, order_stats=True, mapping=False, seed=None, key=None):
+        super().__init__(order_stats=True, mapping=mapping, key=key)
+        self._random = random.Random(seed).random
+    
+    @classmethod
+    def from_sorted(cls, keys, values=None, **options):
+        """Build a treap from sorted, distinct keys in O(n)"""
+        tree = super().from_sorted(keys, values, **options)
+        tree._height = None
+        return tree
+    
+    def _spawn(self):
+        # Child treaps draw their seeds from this one, so seeded runs repeat
+        return type(self)(mapping=self._mapping, seed=self._random(), key=self._key_func)
+    
+    def _link_balanced(self, nodes):
+        """Link sorted nodes into a treap under fresh priorities in O(n)"""
+        # Cartesian-tree build: the stack is the right spine of the tree so far
+        draw = self._random
+        spine = []
+        for node in nodes:
+            node.priority = draw()
+            last = None
+            while spine and spine[-1].priority < node.priority:
+                last = spine.pop()
+            node.left = last
+            node.right = None
+            if spine:
+                spine[-1].right = node
+            spine.append(node)
+        
+        root = spine[0] if spine else None
+        order = [root] if root else []
+        for node in order:  # breadth-first, so children follow their parents
+            if node.left:
+                order.append(node.left)
+            if node.right:
+                order.append(node.right)
+        for node in reversed(order):
+            node.size = (1 + (node.left.size if node.left else 0)
+                         + (node.right.size if node.right else 0))
+        return root
+    
+    def _split(self, node, key):
+        """Split a subtree into roots holding keys < key and keys >= key"""
+        left = right = None
+        left_tail = right_tail = None  # rightmost / leftmost spine nodes so far
+        path = []
+        while node is not None:
+            path.append(node)
+            if node.key < key:
+                if left_tail is None:
+                    left = node
+                else:
+                    left_tail.right = node
+                left_tail = node
+                node = node.right
+            else:
+                if right_tail is None:
+                    right = node
+                else:
+                    right_tail.left = node
+                right_tail = node
+                node = node.left
+        if left_tail is not None:
+            left_tail.right = None
+        if right_tail is not None:
+            right_tail.left = None
+        for node in reversed(path):
+            node.size = (1 + (node.left.size if node.left else 0)
+                         + (node.right.size if node.right else 0))
+        return left, right
+    
+    def _join(self, left, right):
+        """Merge two subtrees whose keys all compare left < right"""
+        root = hook = None
+        path = []
+        while left is not None and right is not None:
+            if left.priority > right.priority:
+                node, left = left, left.right
+            else:
+                node, right = right, right.left
+            if hook is None:
+                root = node
+            elif node.key < hook.key:
+                hook.left = node
+            else:
+                hook.right = node
+            path.append(node)
+            hook = node
+        rest = left if left is not None else right
+        if hook is None:
+            return rest
+        if rest is not None:
+            if rest.key < hook.key:
+                hook.left = rest
+            else:
+                hook.right = rest
+        for node in reversed(path):
+            node.size = (1 + (node.left.size if node.left else 0)
+                         + (node.right.size if node.right else 0))
+        return root
+    
+    def split(self, key):
+        """Split into treaps (keys < key, keys >= key); this treap is left empty"""
+        left, right = self._spawn(), self._spawn()
+        left.root, right.root = self._split(self.root, key)
+        left._size = left.root.size if left.root else 0
+        right._size = self._size - left._size
+        left._height = right._height = None
+        self.clear()
+        return left, right
+    
+    @classmethod
+    def join(cls, left, right):
+        """Concatenate two treaps whose keys all compare left < right; both are left empty"""
+        if left._mapping != right._mapping:
+            raise ValueError("cannot join a mapping treap with a set treap")
+        if left._key_func != right._key_func:
+            raise ValueError("cannot join treaps with different key functions")
+        if left.root and right.root and not left.find_max() < right.find_min():
+            raise ValueError("every key of left must be smaller than every key of right")
+        tree = left._spawn()
+        tree.root = left._join(left.root, right.root)
+        tree._size = left._size + right._size
+        tree._height = None
+        left.clear()
+        right.clear()
+        return tree
+    
+    merge = join
+    
+    def _insert(self, key):
+        path = []
+        node = self.root
+        while node is not None:
+            path.append(node)
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node
+        
+        new = self.node_class(key)
+        new.priority = priority = self._random()
+        # The new node takes the place of the first node on the path with a
+        # lower priority, and that node's subtree is split around the key
+        i = 0
+        while i < len(path) and path[i].priority > priority:
+            path[i].size += 1
+            i += 1
+        if i < len(path):
+            new.left, new.right = self._split(path[i], key)
+            new.size = (1 + (new.left.size if new.left else 0)
+                        + (new.right.size if new.right else 0))
+        parent = path[i - 1] if i else None
+        if parent is None:
+            self.root = new
+        elif key < parent.key:
+            parent.left = new
+        else:
+            parent.right = new
+        self._size += 1
+        self._version += 1
+        self._height = None
+        return new
+    
+    def _insert_key(self, key):
+        # The priority walk and split reuse the plain descent's path
+        return self._insert(key)
+    
+    def insert_many(self, keys):
+        """Insert a batch of keys, merging large batches in a single pass"""
+        if self._key_func is not None:
+            self._insert_items(keys)
+            return
+        batch = _sorted_unique(keys)
+        if len(batch) * _REBUILD_FACTOR >= self._size:
+            with _gc_paused():
+                nodes = _merge_nodes(self._inorder_nodes(), batch, self.node_class)
+                self.root = self._link_balanced(nodes)
+                self._size = len(nodes)
+                self._version += 1
+                self._height = None
+        else:
+            for key in batch:
+                self.insert(key)
+    
+    def _delete(self, key):
+        path = []
+        node = self.root
+        while node is not None and node.key != key:
+            path.append(node)
+            node = node.left if key < node.key else node.right
+        if node is None:
+            return _MISSING
+        for ancestor in path:
+            ancestor.size -= 1
+        self._replace_child(path[-1] if path else None, node, self._join(node.left, node.right))
+        self._size -= 1
+        self._version += 1
+        self._height = None
+        return node.value if self._mapping else None
+    
+    def _check_node(self, node, left, right, height):
+        for child in (node.left, node.right):
+            _invariant(child is None or child.priority <= node.priority,
+                       f"node {node.key!r} breaks the heap order")
+        return 0
+
+
+class PersistentNode:
+    """Immutable AVL node shared between tree versions"""
+    __slots__ = ('key', 'value', 'left', 'right', 'height')
+    
+    def __init__(self, key, value, left, right):
+        self.key = key
+        self.value = value
+        self.left = left
+        self.right = right
+        lh = left.height if left else 0
+        rh = right.height if right else 0
+        self.height = 1 + (lh if lh > rh else rh)
+
+
+def _persistent_balance(key, value, left, right):
+    """New node over left and right, with one AVL rotation if they differ by 2"""
+    lh = left.height if left else 0
+    rh = right.height if right else 0
+    if lh > rh + 1:
+        inner = left.right
+        if (left.left.height if left.left else 0) >= (inner.height if inner else 0):
+            return PersistentNode(left.key, left.value, left.left,
+                                  PersistentNode(key, value, inner, right))
+        return PersistentNode(inner.key, inner.value,
+                              PersistentNode(left.key, left.value, left.left, inner.left),
+                              PersistentNode(key, value, inner.right, right))
+    if rh > lh + 1:
+        inner = right.left
+        if (right.right.height if right.right else 0) >= (inner.height if inner else 0):
+            return PersistentNode(right.key, right.value,
+                                  PersistentNode(key, value, left, inner), right.right)
+        return PersistentNode(inner.key, inner.value,
+                              PersistentNode(key, value, left, inner.left),
+                              PersistentNode(right.key, right.value, inner.right, right.right))
+    return PersistentNode(key, value, left, right)
+
+
+def _rebuild_path(path, child):
+    """Copy a root-to-node path bottom-up around a replaced child, rebalancing"""
+    for node, went_left in reversed(path):
+        if went_left:
+            child = _persistent_balance(node.key, node.value, child, node.right)
+        else:
+            child = _persistent_balance(node.key, node.value, node.left, child)
+    return child
+
+
+class PersistentTree:
+    """Immutable AVL tree: updates return a new version, old versions stay valid
+    
+    insert/delete copy only the O(log n) nodes on the search path and share
+    everything else with the version they came from, so keeping a version
+    (a snapshot) costs O(1) and readers never need a lock.
+    """
+    __slots__ = ('root', '_size')
+    
+    def __init__(self, root=None, size=0):
+        self.root = root
+        self._size = size
+    
+    @classmethod
+    def from_sorted(cls, keys, values=None):
+        """Build a version from sorted, distinct keys in O(n)"""
+        keys = _sorted_list(keys)
+        values = list(values) if values is not None else [None] * len(keys)
+        built = {}
+        # Midpoint split, children finished before their parent
+        stack = [(0, len(keys), False)] if keys else []
+        while stack:
+            lo, hi, children_done = stack.pop()
+            mid = (lo + hi) // 2
+            if not children_done:
+                stack.append((lo, hi, True))
+                if mid + 1 < hi:
+                    stack.append((mid + 1, hi, False))
+                if lo < mid:
+                    stack.append((lo, mid, False))
+                continue
+            built[lo, hi] = PersistentNode(keys[mid], values[mid], built.pop((lo, mid), None),
+                                           built.pop((mid + 1, hi), None))
+        return cls(built.pop((0, len(keys)), None), len(keys))
+    
+    @classmethod
+    def from_iterable(cls, keys):
+        return cls.from_sorted(sorted(set(keys)))
+    
+    def __len__(self):
+        return self._size
+    
+    def __iter__(self):
+        return self.iter_range()
+    
+    def __contains__(self, key):
+        return self._find(key) is not None
+    
+    def _find(self, key):
+        node = self.root
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node
+        return None
+    
+    def search(self, key):
+        """Return True if key is in this version"""
+        return self._find(key) is not None
+    
+    def get(self, key, default=None):
+        node = self._find(key)
+        return default if node is None else node.value
+    
+    def __getitem__(self, key):
+        node = self._find(key)
+        if node is None:
+            raise KeyError(key)
+        return node.value
+    
+    def insert(self, key, value=None):
+        """New version with key set to value; this version is unchanged"""
+        path = []
+        node = self.root
+        while node is not None:
+            if key < node.key:
+                path.append((node, True))
+                node = node.left
+            elif key > node.key:
+                path.append((node, False))
+                node = node.right
+            else:
+                if node.value is value:
+                    return self
+                # Same key: copy the path without rebalancing anything
+                return PersistentTree(_rebuild_path(path, PersistentNode(key, value, node.left,
+                                                                         node.right)),
+                                      self._size)
+        return PersistentTree(_rebuild_path(path, PersistentNode(key, value, None, None)),
+                              self._size + 1)
+    
+    def delete(self, key):
+        """New version without key (this version if key is absent)"""
+        path = []
+        node = self.root
+        while node is not None and node.key != key:
+            went_left = key < node.key
+            path.append((node, went_left))
+            node = node.left if went_left else node.right
+        if node is None:
+            return self
+        if node.left is None or node.right is None:
+            child = node.left if node.left is not None else node.right
+        else:
+            # Two children: the successor moves up and leaves the right subtree
+            inner = []
+            successor = node.right
+            while successor.left is not None:
+                inner.append((successor, True))
+                successor = successor.left
+            right = _rebuild_path(inner, successor.right)
+            child = _persistent_balance(successor.key, successor.value, node.left, right)
+        return PersistentTree(_rebuild_path(path, child), self._size - 1)
+    
+    def insert_many(self, keys):
+        """New version with every key added"""
+        version = self
+        for key in keys:
+            version = version.insert(key)
+        return version
+    
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in ascending order (None = unbounded)"""
+        stack = []
+        node = self.root
+        while True:
+            while node is not None:
+                if lo is not None and node.key < lo:
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if hi is not None and node.key > hi:
+                return
+            yield node.key
+            node = node.right
+    
+    def items(self):
+        """Yield (key, value) pairs in key order"""
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.key, node.value
+            node = node.right
+    
+    def inorder(self):
+        return list(self.iter_range())
+    
+    def get_height(self):
+        return self.root.height if self.root else 0
+    
+    def to_arrays(self, keys=True):
+        """Level-order NumPy arrays of this version (see ShapeMixin.to_arrays)"""
+        _require_numpy("to_arrays")
+        return _linked_arrays(self.root, None, keys)
+    
+    def validate(self):
+        """Check order, cached heights, AVL balance and len(); raises AssertionError"""
+        count = 0
+        stack = [(self.root, None, None)] if self.root else []
+        while stack:
+            node, lo, hi = stack.pop()
+            count += 1
+            _invariant((lo is None or lo < node.key) and (hi is None or node.key < hi),
+                       f"key {node.key!r} is out of order")
+            lh = node.left.height if node.left else 0
+            rh = node.right.height if node.right else 0
+            _invariant(node.height == 1 + max(lh, rh),
+                       f"node {node.key!r} caches height {node.height}")
+            _invariant(abs(lh - rh) <= 1, f"node {node.key!r} is out of AVL balance")
+            if node.left:
+                stack.append((node.left, lo, node.key))
+            if node.right:
+                stack.append((node.right, node.key, hi))
+        _invariant(count == self._size, f"len() is {self._size} but the tree holds {count} keys")
+
+
+class VersionedTree:
+    """Current version of a PersistentTree plus an O(1) snapshot/rollback log
+    
+    Writers replace `current` with a single attribute store, so a reader
+    that took `current` (or a snapshot) keeps a consistent view without
+    locking. Concurrent writers still need to take turns.
+    """
+    def __init__(self, tree=None):
+        self.current = tree if tree is not None else PersistentTree()
+        self._history = []
+    
+    def __len__(self):
+        return len(self.current)
+    
+    def __contains__(self, key):
+        return key in self.current
+    
+    def search(self, key):
+        return self.current.search(key)
+    
+    def insert(self, key, value=None):
+        self.current = self.current.insert(key, value)
+    
+    def delete(self, key):
+        self.current = self.current.delete(key)
+    
+    def snapshot(self):
+        """Record and return the current version in O(1)"""
+        self._history.append(self.current)
+        return self.current
+    
+    def rollback(self, version=None):
+        """Make version (default: the latest snapshot) current again"""
+        if version is None:
+            if not self._history:
+                raise ValueError("no snapshot to roll back to")
+            version = self._history.pop()
+        self.current = version
+        return version
+    
+    def versions(self):
+        """Snapshots taken so far, oldest first"""
+        return list(self._history)
+
+
+class BTreeNode:
+    """B-tree node: sorted keys and, unless a leaf, len(keys) + 1 children"""
+    __slots__ = ('keys', 'children')
+    
+    def __init__(self, keys=None, children=None):
+        self.keys = keys if keys is not None else []
+        self.children = children if children is not None else []
+
+
+class BPlusNode(BTreeNode):
+    """B+-tree node: internal nodes only route, leaves hold the keys and a next-leaf link"""
+    __slots__ = ('next',)
+    
+    def __init__(self, keys=None, children=None):
+        self.keys = keys if keys is not None else []
+        self.children = children if children is not None else []
+        self.next = None
+
+
+class BTree:
+    """B-tree of the given order (maximum children per node)
+    
+    Each node is searched with bisect, so a lookup costs one C-level binary
+    search per level and only log_order(n) Python-level node hops.
+    """
+    node_class = BTreeNode
+    
+    def __init__(self, order=64):
+        if order < 3:
+            raise ValueError("order must be at least 3")
+        self.order = order
+        self._max_keys = order - 1
+        self._min_keys = (order + 1) // 2 - 1
+        self.root = self.node_class()
+        self._size = 0
+        self._levels = 1
+    
+    def __len__(self):
+        return self._size
+    
+    def __iter__(self):
+        return self.iter_range()
+    
+    def __contains__(self, key):
+        return self.search(key)
+    
+    def search(self, key):
+        """Return True if key is in the tree"""
+        node = self.root
+        while True:
+            keys = node.keys
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                return True
+            if not node.children:
+                return False
+            node = node.children[i]
+    
+    def insert(self, key):
+        """Insert a key, splitting full nodes on the way back up"""
+        node = self.root
+        path = []
+        while True:
+            keys = node.keys
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                return
+            if not node.children:
+                break
+            path.append((node, i))
+            node = node.children[i]
+        keys.insert(i, key)
+        self._size += 1
+        
+        while len(node.keys) > self._max_keys:
+            mid = len(node.keys) // 2
+            median = node.keys[mid]
+            right = self.node_class(node.keys[mid + 1:], node.children[mid + 1:])
+            del node.keys[mid:]
+            del node.children[mid + 1:]
+            if not path:
+                self.root = self.node_class([median], [node, right])
+                self._levels += 1
+                return
+            node, i = path.pop()
+            node.keys.insert(i, median)
+            node.children.insert(i + 1, right)
+    
+    def delete(self, key):
+        """Delete a key, borrowing from or merging with siblings on underflow"""
+        node = self.root
+        path = []
+        while True:
+            keys = node.keys
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                break
+            if not node.children:
+                return
+            path.append((node, i))
+            node = node.children[i]
+        self._size -= 1
+        
+        if node.children:
+            # Internal key: replace it with its predecessor and remove that from its leaf
+            path.append((node, i))
+            leaf = node.children[i]
+            while leaf.children:
+                path.append((leaf, len(leaf.children) - 1))
+                leaf = leaf.children[-1]
+            node.keys[i] = leaf.keys.pop()
+            node = leaf
+        else:
+            del keys[i]
+        self._fix_underflow(node, path)
+    
+    def _fix_underflow(self, node, path):
+        min_keys = self._min_keys
+        while path and len(node.keys) < min_keys:
+            parent, i = path.pop()
+            siblings = parent.children
+            if i > 0 and len(siblings[i - 1].keys) > min_keys:
+                # Rotate a key in from the left sibling through the parent
+                left = siblings[i - 1]
+                node.keys.insert(0, parent.keys[i - 1])
+                parent.keys[i - 1] = left.keys.pop()
+                if left.children:
+                    node.children.insert(0, left.children.pop())
+                return
+            if i + 1 < len(siblings) and len(siblings[i + 1].keys) > min_keys:
+                right = siblings[i + 1]
+                node.keys.append(parent.keys[i])
+                parent.keys[i] = right.keys.pop(0)
+                if right.children:
+                    node.children.append(right.children.pop(0))
+                return
+            # Both siblings are minimal: merge with one, pulling the separator down
+            sep = i - 1 if i > 0 else i
+            left, right = siblings[sep], siblings[sep + 1]
+            left.keys.append(parent.keys.pop(sep))
+            left.keys.extend(right.keys)
+            left.children.extend(right.children)
+            del siblings[sep + 1]
+            node = parent
+        if not self.root.keys and self.root.children:
+            self.root = self.root.children[0]
+            self._levels -= 1
+    
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in ascending order"""
+        # Stack entries (node, i): keys[i] is next once children[i] is done
+        stack = []
+        node = self.root
+        while True:
+            i = 0 if lo is None else bisect_left(node.keys, lo)
+            stack.append((node, i))
+            if not node.children:
+                break
+            node = node.children[i]
+        while stack:
+            node, i = stack.pop()
+            keys = node.keys
+            if not node.children:
+                for key in islice(keys, i, None):
+                    if hi is not None and key > hi:
+                        return
+                    yield key
+                continue
+            if i < len(keys):
+                key = keys[i]
+                if hi is not None and key > hi:
+                    return
+                yield key
+                stack.append((node, i + 1))
+                child = node.children[i + 1]
+                while True:
+                    stack.append((child, 0))
+                    if not child.children:
+                        break
+                    child = child.children[0]
+    
+    def inorder(self):
+        """Inorder traversal - returns sorted order"""
+        return list(self.iter_range())
+    
+    def find_min(self):
+        """Find minimum key"""
+        node = self.root
+        while node.children:
+            node = node.children[0]
+        return node.keys[0] if node.keys else None
+    
+    def find_max(self):
+        """Find maximum key"""
+        node = self.root
+        while node.children:
+            node = node.children[-1]
+        return node.keys[-1] if node.keys else None
+    
+    def get_height(self):
+        """Number of node levels (0 for an empty tree), kept in O(1)"""
+        return self._levels if self._size else 0
+    
+    def validate(self):
+        """Check order, node fill, uniform leaf depth and len() in O(n)"""
+        keys = self.inorder()
+        _invariant(all(map(lt, keys, islice(keys, 1, None))), "keys are out of order")
+        _invariant(len(keys) == self._size, f"len() is {self._size} but the tree holds {len(keys)} keys")
+        level = [self.root]
+        for depth in range(1, self._levels + 1):
+            for node in level:
+                _invariant(len(node.keys) <= self._max_keys, "node overflows")
+                _invariant(node is self.root or len(node.keys) >= self._min_keys, "node underflows")
+                leaf = depth == self._levels
+                _invariant(leaf == (not node.children), "leaves are not all at the same depth")
+                _invariant(leaf or len(node.children) == len(node.keys) + 1,
+                           "children do not match keys")
+            level = [child for node in level for child in node.children]
+
+
+class BPlusTree(BTree):
+    """B+-tree: keys live in linked leaves, internal nodes hold routing copies"""
+    node_class = BPlusNode
+    
+    def _leaf_for(self, key, path=None):
+        node = self.root
+        while node.children:
+            i = bisect_right(node.keys, key)
+            if path is not None:
+                path.append((node, i))
+            node = node.children[i]
+        return node
+    
+    def search(self, key):
+        """Return True if key is in the tree"""
+        keys = self._leaf_for(key).keys
+        i = bisect_left(keys, key)
+        return i < len(keys) and keys[i] == key
+    
+    def insert(self, key):
+        """Insert a key, splitting full leaves and routing nodes on the way up"""
+        path = []
+        node = self._leaf_for(key, path)
+        keys = node.keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return
+        keys.insert(i, key)
+        self._size += 1
+        if len(keys) <= self._max_keys:
+            return
+        
+        # A leaf split copies the right half's first key up as the separator
+        mid = len(keys) // 2
+        right = self.node_class(keys[mid:])
+        del keys[mid:]
+        right.next = node.next
+        node.next = right
+        separator = right.keys[0]
+        while True:
+            if not path:
+                self.root = self.node_class([separator], [node, right])
+                self._levels += 1
+                return
+            node, i = path.pop()
+            node.keys.insert(i, separator)
+            node.children.insert(i + 1, right)
+            if len(node.keys) <= self._max_keys:
+                return
+            # A routing split moves its middle separator up
+            mid = len(node.keys) // 2
+            separator = node.keys[mid]
+            right = self.node_class(node.keys[mid + 1:], node.children[mid + 1:])
+            del node.keys[mid:]
+            del node.children[mid + 1:]
+    
+    def delete(self, key):
+        """Delete a key from its leaf, rebalancing leaves and routing nodes"""
+        path = []
+        node = self._leaf_for(key, path)
+        keys = node.keys
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return
+        del keys[i]
+        self._size -= 1
+        
+        # Separators may outlive the keys they were copied from; they still route correctly
+        min_keys = self._min_keys
+        while path and len(node.keys) < min_keys:
+            parent, i = path.pop()
+            siblings = parent.children
+            leaf = not node.children
+            if i > 0 and len(siblings[i - 1].keys) > min_keys:
+                left = siblings[i - 1]
+                if leaf:
+                    node.keys.insert(0, left.keys.pop())
+                    parent.keys[i - 1] = node.keys[0]
+                else:
+                    node.keys.insert(0, parent.keys[i - 1])
+                    parent.keys[i - 1] = left.keys.pop()
+                    node.children.insert(0, left.children.pop())
+                return
+            if i + 1 < len(siblings) and len(siblings[i + 1].keys) > min_keys:
+                right = siblings[i + 1]
+                if leaf:
+                    node.keys.append(right.keys.pop(0))
+                    parent.keys[i] = right.keys[0]
+                else:
+                    node.keys.append(parent.keys[i])
+                    parent.keys[i] = right.keys.pop(0)
+                    node.children.append(right.children.pop(0))
+                return
+            sep = i - 1 if i > 0 else i
+            left, right = siblings[sep], siblings[sep + 1]
+            separator = parent.keys.pop(sep)
+            if leaf:
+                left.next = right.next
+            else:
+                left.keys.append(separator)
+                left.children.extend(right.children)
+            left.keys.extend(right.keys)
+            del siblings[sep + 1]
+            node = parent
+        if not self.root.keys and self.root.children:
+            self.root = self.root.children[0]
+            self._levels -= 1
+    
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi by walking the leaf chain"""
+        if lo is None:
+            leaf = self.root
+            while leaf.children:
+                leaf = leaf.children[0]
+            i = 0
+        else:
+            leaf = self._leaf_for(lo)
+            i = bisect_left(leaf.keys, lo)
+        while leaf is not None:
+            keys = leaf.keys
+            if hi is not None and keys and keys[-1] > hi:
+                yield from islice(keys, i, bisect_right(keys, hi))
+                return
+            yield from islice(keys, i, None)
+            leaf = leaf.next
+            i = 0
+    
+    def validate(self):
+        """Also check separators route to the right leaves and the leaf chain is complete"""
+        super().validate()
+        chained = list(self.iter_range())
+        leaves = []
+        stack = [(self.root, None, None)]
+        while stack:
+            node, lo, hi = stack.pop()
+            for key in node.keys:
+                _invariant((lo is None or lo <= key) and (hi is None or key < hi),
+                           f"key {key!r} is outside its separator bounds")
+            if not node.children:
+                leaves.append(node)
+                continue
+            bounds = [lo] + node.keys + [hi]
+            for j in range(len(node.children) - 1, -1, -1):
+                stack.append((node.children[j], bounds[j], bounds[j + 1]))
+        _invariant(all(a.next is b for a, b in zip(leaves, leaves[1:])) and leaves[-1].next is None,
+                   "leaf chain is broken")
+        _invariant(chained == [key for leaf in leaves for key in leaf.keys], "leaf chain skips keys")
+
+
+class SkipListNode:
+    """Skip list node: key and one forward link per level"""
+    __slots__ = ('key', 'next')
+    
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+
+
+class SkipList:
+    """Skip list with the tree API (Pugh's randomized levels)
+    
+    A key reaches level i + 1 with probability p ** i, so a search skips
+    ahead on the sparse upper levels and finishes on the full bottom list
+    in expected O(log n) steps. get_height() reports the number of levels.
+    """
+    MAX_LEVEL = 32
+    
+    def __init__(self, p=0.25, seed=None):
+        if not 0 < p < 1:
+            raise ValueError("p must be between 0 and 1")
+        self.head = SkipListNode(None, self.MAX_LEVEL)
+        self._p = p
+        self._random = random.Random(seed).random
+        self._levels = 0
+        self._size = 0
+    
+    def __len__(self):
+        return self._size
+    
+    def __iter__(self):
+        return self.iter_range()
+    
+    def __contains__(self, key):
+        return self.search(key)
+    
+    def _random_level(self):
+        level = 1
+        draw, p = self._random, self._p
+        while level < self.MAX_LEVEL and draw() < p:
+            level += 1
+        return level
+    
+    def _predecessors(self, key):
+        """Last node before key on every level, top level first"""
+        update = [None] * self._levels
+        node = self.head
+        for level in range(self._levels - 1, -1, -1):
+            following = node.next[level]
+            while following is not None and following.key < key:
+                node = following
+                following = node.next[level]
+            update[level] = node
+        return update
+    
+    def search(self, key):
+        """Return True if key is in the list"""
+        node = self.head
+        for level in range(self._levels - 1, -1, -1):
+            following = node.next[level]
+            while following is not None and following.key < key:
+                node = following
+                following = node.next[level]
+        node = node.next[0]
+        return node is not None and node.key == key
+    
+    def insert(self, key):
+        """Insert a key (duplicates are ignored)"""
+        update = self._predecessors(key)
+        following = update[0].next[0] if update else None
+        if following is not None and following.key == key:
+            return
+        level = self._random_level()
+        if level > self._levels:
+            update.extend([self.head] * (level - self._levels))
+            self._levels = level
+        node = SkipListNode(key, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+        self._size += 1
+    
+    def delete(self, key):
+        """Delete a key if present"""
+        update = self._predecessors(key)
+        node = update[0].next[0] if update else None
+        if node is None or node.key != key:
+            return
+        for i in range(len(node.next)):
+            update[i].next[i] = node.next[i]
+        head = self.head.next
+        while self._levels and head[self._levels - 1] is None:
+            self._levels -= 1
+        self._size -= 1
+    
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in ascending order (None = unbounded)"""
+        if lo is None or not self._levels:
+            node = self.head.next[0]
+        else:
+            node = self._predecessors(lo)[0].next[0]
+        while node is not None and (hi is None or node.key <= hi):
+            yield node.key
+            node = node.next[0]
+    
+    def inorder(self):
+        """All keys in ascending order"""
+        return list(self.iter_range())
+    
+    def find_min(self):
+        node = self.head.next[0]
+        return node.key if node is not None else None
+    
+    def find_max(self):
+        node = self.head
+        for level in range(self._levels - 1, -1, -1):
+            while node.next[level] is not None:
+                node = node.next[level]
+        return node.key
+    
+    def get_height(self):
+        """Number of levels in use"""
+        return self._levels
+    
+    def validate(self):
+        """Check every invariant in O(n); raises AssertionError (meant for tests)"""
+        bottom = []
+        node = self.head.next[0]
+        while node is not None:
+            bottom.append(node)
+            node = node.next[0]
+        _invariant(len(bottom) == self._size, f"len() is {self._size} but the list holds {len(bottom)} keys")
+        _invariant(all(a.key < b.key for a, b in zip(bottom, bottom[1:])), "keys are out of order")
+        _invariant(max((len(node.next) for node in bottom), default=0) == self._levels,
+                   f"level count {self._levels} does not match the tallest node")
+        for level in range(1, self._levels):
+            # Each level must link exactly the nodes that are that tall, in order
+            linked = []
+            node = self.head.next[level]
+            while node is not None:
+                linked.append(node)
+                node = node.next[level]
+            _invariant(linked == [node for node in bottom if len(node.next) > level],
+                       f"level {level} skips or repeats nodes")
+
+
+class NodePool:
+    """Struct-of-arrays node storage: children are indices into array('i') columns"""
+    def __init__(self, typecode=None):
+        # Keys live in a typed array when a typecode is given (e.g. 'q')
+        self.keys = array(typecode) if typecode else []
+        self.left = array('i')
+        self.right = array('i')
+        self._free = array('i')
+    
+    def new(self, key):
+        """Allocate a node, reusing a freed slot when possible"""
+        if self._free:
+            index = self._free.pop()
+            self.keys[index] = key
+            self.left[index] = -1
+            self.right[index] = -1
+            return index
+        self.keys.append(key)
+        self.left.append(-1)
+        self.right.append(-1)
+        return len(self.left) - 1
+    
+    def free(self, index):
+        self._free.append(index)
+    
+    def __len__(self):
+        return len(self.left) - len(self._free)
+
+
+class ArrayBST(ShapeMixin, SnapshotMixin):
+    """Binary Search Tree backed by a NodePool (-1 marks a missing child)"""
+    def __init__(self, typecode=None):
+        self.pool = NodePool(typecode)
+        self.root = -1
+        self._height = 0  # None when a delete may have lowered it
     
-    def insert(self, key):
-        """Insert a key into BST"""
-        self.root = self._insert(self.root, key)
+    def __len__(self):
+        return len(self.pool)
     
-    def _insert(self, node, key):
-        if node is None:
-            return Node(key)
-        if key < node.key:
-            node.left = self._insert(node.left, key)
-        elif key > node.key:
-            node.right = self._insert(node.right, key)
-        return node
+    @classmethod
+    def from_sorted(cls, keys, values=None, typecode=None):
+        """Build a height-balanced tree from sorted, distinct keys in O(n)"""
+        if values is not None:
+            raise ValueError("ArrayBST stores keys only")
+        keys = _sorted_list(keys)
+        n = len(keys)
+        tree = cls(typecode)
+        pool = tree.pool
+        pool.keys.extend(keys)
+        # Node i holds keys[i], so children are the sub-midpoints
+        left = pool.left = array('i', [-1]) * n
+        right = pool.right = array('i', [-1]) * n
+        stack = [(0, n)] if n else []
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            if lo < mid:
+                left[mid] = (lo + mid) // 2
+                stack.append((lo, mid))
+            if mid + 1 < hi:
+                right[mid] = (mid + 1 + hi) // 2
+                stack.append((mid + 1, hi))
+        tree.root = n // 2 if n else -1
+        tree._height = n.bit_length()
+        return tree
+    
+    def insert(self, key):
+        """Insert a key into the tree"""
+        pool = self.pool
+        keys, left, right = pool.keys, pool.left, pool.right
+        node = self.root
+        if node == -1:
+            self.root = pool.new(key)
+            self._height = 1
+            return
+        depth = 1
+        while True:
+            depth += 1
+            node_key = keys[node]
+            if key < node_key:
+                if left[node] == -1:
+                    left[node] = pool.new(key)
+                    break
+                node = left[node]
+            elif key > node_key:
+                if right[node] == -1:
+                    right[node] = pool.new(key)
+                    break
+                node = right[node]
+            else:
+                return
+        height = self._height
+        if height is not None and depth > height:
+            self._height = depth
     
     def search(self, key):
-        """Search for a key in BST"""
-        return self._search(self.root, key)
+        """Return True if key is in the tree"""
+        return self._find(key)[1] != -1
     
-    def _search(self, node, key):
-        if node is None or node.key == key:
-            return node
-        if key < node.key:
-            return self._search(node.left, key)
-        return self._search(node.right, key)
+    def _find(self, key):
+        pool = self.pool
+        keys, left, right = pool.keys, pool.left, pool.right
+        parent = -1
+        node = self.root
+        while node != -1:
+            node_key = keys[node]
+            if key < node_key:
+                parent, node = node, left[node]
+            elif key > node_key:
+                parent, node = node, right[node]
+            else:
+                break
+        return parent, node
     
     def delete(self, key):
-        """Delete a key from BST"""
-        self.root = self._delete(self.root, key)
-    
-    def _delete(self, node, key):
-        if node is None:
-            return node
+        """Delete a key from the tree"""
+        pool = self.pool
+        keys, left, right = pool.keys, pool.left, pool.right
+        parent, node = self._find(key)
+        if node == -1:
+            return
         
-        if key < node.key:
-            node.left = self._delete(node.left, key)
-        elif key > node.key:
-            node.right = self._delete(node.right, key)
-        else:
-            if node.left is None:
-                return node.right
-            elif node.right is None:
-                return node.left
-            
-            temp = self._min_value_node(node.right)
-            node.key = temp.key
-            node.right = self._delete(node.right, temp.key)
+        if left[node] != -1 and right[node] != -1:
+            parent = node
+            successor = right[node]
+            while left[successor] != -1:
+                parent = successor
+                successor = left[successor]
+            keys[node] = keys[successor]
+            node = successor
         
-        return node
-    
-    def _min_value_node(self, node):
-        current = node
-        while current.left is not None:
-            current = current.left
-        return current
+        child = left[node] if left[node] != -1 else right[node]
+        if parent == -1:
+            self.root = child
+        elif left[parent] == node:
+            left[parent] = child
+        else:
+            right[parent] = child
+        pool.free(node)
+        # _find does not track depth, so any delete forces a recount
+        self._height = None
     
     def find_min(self):
-        """Find minimum key in BST"""
-        return self._find_min(self.root)
-    
-    def _find_min(self, node):
-        if node is None:
+        """Find minimum key"""
+        node = self.root
+        if node == -1:
             return None
-        while node.left is not None:
-            node = node.left
-        return node.key
+        left = self.pool.left
+        while left[node] != -1:
+            node = left[node]
+        return self.pool.keys[node]
     
     def find_max(self):
-        """Find maximum key in BST"""
-        return self._find_max(self.root)
-    
-    def _find_max(self, node):
-        if node is None:
+        """Find maximum key"""
+        node = self.root
+        if node == -1:
             return None
-        while node.right is not None:
-            node = node.right
-        return node.key
-    
-    def preorder(self):
-        """Preorder traversal (Root-Left-Right)"""
-        result = []
-        self._preorder(self.root, result)
-        return result
-    
-    def _preorder(self, node, result):
-        if node:
-            result.append(node.key)
-            self._preorder(node.left, result)
-            self._preorder(node.right, result)
+        right = self.pool.right
+        while right[node] != -1:
+            node = right[node]
+        return self.pool.keys[node]
     
     def inorder(self):
-        """Inorder traversal (Left-Root-Right) - returns sorted order"""
-        result = []
-        self._inorder(self.root, result)
-        return result
-    
-    def _inorder(self, node, result):
-        if node:
-            self._inorder(node.left, result)
-            result.append(node.key)
-            self._inorder(node.right, result)
-    
-    def postorder(self):
-        """Postorder traversal (Left-Right-Root)"""
+        """Inorder traversal - returns sorted order"""
+        keys, left, right = self.pool.keys, self.pool.left, self.pool.right
         result = []
-        self._postorder(self.root, result)
+        stack = []
+        node = self.root
+        while stack or node != -1:
+            while node != -1:
+                stack.append(node)
+                node = left[node]
+            node = stack.pop()
+            result.append(keys[node])
+            node = right[node]
         return result
     
-    def _postorder(self, node, result):
-        if node:
-            self._postorder(node.left, result)
-            self._postorder(node.right, result)
-            result.append(node.key)
+    def get_height(self):
+        """Get height of the tree (cached; recounted once after a delete)"""
+        if self._height is None:
+            self._height = self._count_levels()
+        return self._height
     
-    def level_order(self):
-        """Level-order traversal (Breadth-First Search)"""
-        result = []
-        if self.root is None:
-            return result
-        
-        queue = [self.root]
-        while queue:
-            node = queue.pop(0)
-            result.append(node.key)
-            if node.left:
-                queue.append(node.left)
-            if node.right:
-                queue.append(node.right)
-        return result
+    def to_arrays(self, keys=True):
+        """Level-order NumPy arrays (see ShapeMixin.to_arrays), gathered level by level"""
+        _require_numpy("to_arrays")
+        pool = self.pool
+        left = np.array(pool.left, dtype=np.int64)
+        right = np.array(pool.right, dtype=np.int64)
+        levels = []
+        level = np.array([self.root] if self.root != -1 else [], dtype=np.int64)
+        while len(level):
+            levels.append(level)
+            # Interleaved (left, right) pairs keep the queue order of a BFS
+            children = np.stack((left[level], right[level]), axis=1).ravel()
+            level = children[children >= 0]
+        order = np.concatenate(levels) if levels else level
+        n = len(order)
+        # Slot -> level-order index; the extra last entry maps -1 to -1
+        index = np.full(len(left) + 1, -1, dtype=np.int64)
+        index[order] = np.arange(n)
+        arrays = {
+            'left': index[left[order]],
+            'right': index[right[order]],
+            'parent': np.full(n, -1, dtype=np.int64),
+        }
+        for links in (arrays['left'], arrays['right']):
+            has_child = links >= 0
+            arrays['parent'][links[has_child]] = np.flatnonzero(has_child)
+        if keys:
+            arrays['key'] = _key_array(pool.keys)[order]
+        return arrays
     
-    def get_height(self):
-        """Get height of the tree"""
-        return self._get_height(self.root)
+    def _count_levels(self):
+        left, right = self.pool.left, self.pool.right
+        height = 0
+        level = [self.root] if self.root != -1 else []
+        while level:
+            height += 1
+            level = [child for n in level for child in (left[n], right[n])
+                     if child != -1]
+        return height
     
-    def _get_height(self, node):
-        if node is None:
-            return 0
-        return 1 + max(self._get_height(node.left), self._get_height(node.right))
+    def validate(self):
+        """Check key order, len() and the cached height in O(n)"""
+        keys = self.inorder()
+        _invariant(all(a < b for a, b in zip(keys, keys[1:])), "keys are out of order")
+        _invariant(len(keys) == len(self), f"len() is {len(self)} but the tree holds {len(keys)} keys")
+        _invariant(self._height is None or self._height == self._count_levels(),
+                   f"cached height is {self._height} but the tree is {self._count_levels()} high")
 
 
-class AVLTree(BST):
-    """AVL Tree Implementation (Self-balancing BST)"""
-    def _get_height(self, node):
-        if node is None:
-            return 0
-        return node.height
+def _packed(keys):
+    """Keys as a typed int64/float64 array when they fit, else a list"""
+    try:
+        return array('q', keys)
+    except (TypeError, OverflowError):
+        if all(type(key) is float for key in keys):
+            return array('d', keys)
+        return list(keys)
+
+
+def _eytzinger_order(n):
+    """1-based BFS slots of an n-node implicit tree, listed in key order"""
+    # In the perfect tree of height h, in-order position p with t trailing
+    # zero bits sits at BFS index (p >> (t + 1)) + 2**(h - 1 - t); slots
+    # past n form whole subtrees, so dropping them keeps the order
+    half = 1 << (n.bit_length() - 1) if n else 0
+    if np is not None:
+        p = np.arange(1, 2 * half, dtype=np.int64)
+        low = p & -p
+        slots = p // (2 * low) + half // low
+        return slots[slots <= n]
+    slots = []
+    for p in range(1, 2 * half):
+        low = p & -p
+        slot = p // (2 * low) + half // low
+        if slot <= n:
+            slots.append(slot)
+    return slots
+
+
+class FrozenTree(ShapeMixin):
+    """Immutable key set stored in one contiguous array in Eytzinger (BFS) order
     
-    def _get_balance(self, node):
-        if node is None:
-            return 0
-        return self._get_height(node.left) - self._get_height(node.right)
+    Slot i has children 2i and 2i + 1 (slot 0 is unused), so a search walks
+    a flat int64/float64 array instead of chasing node objects, and a NumPy
+    batch descends all keys level by level in lockstep.
+    """
+    _nil = 0
+    _order_stats = False
     
-    def _update_height(self, node):
-        if node:
-            node.height = 1 + max(self._get_height(node.left), 
-                                self._get_height(node.right))
+    def __init__(self):
+        self._keys = array('q', [0])
+        self._size = 0
+        self._array = None
     
-    def _rotate_right(self, y):
-        x = y.left
-        T2 = x.right
-        
-        x.right = y
-        y.left = T2
-        
-        self._update_height(y)
-        self._update_height(x)
-        
-        return x
+    @classmethod
+    def from_sorted(cls, keys, values=None):
+        """Build from sorted, distinct keys in O(n)"""
+        if values is not None:
+            raise ValueError("FrozenTree stores keys only")
+        keys = _sorted_list(keys)
+        tree = cls()
+        n = len(keys)
+        packed = _packed(keys)
+        if not n:
+            return tree
+        order = _eytzinger_order(n)
+        if np is not None and isinstance(packed, array):
+            layout = np.empty(n + 1, dtype=packed.typecode)
+            layout[0] = keys[0]
+            layout[order] = np.frombuffer(packed, dtype=packed.typecode)
+            tree._keys = array(packed.typecode, layout.tobytes())
+        else:
+            layout = [keys[0]] * (n + 1)
+            for slot, key in zip(order, keys):
+                layout[slot] = key
+            tree._keys = array(packed.typecode, layout) if isinstance(packed, array) else layout
+        tree._size = n
+        return tree
     
-    def _rotate_left(self, x):
-        y = x.right
-        T2 = y.left
-        
-        y.left = x
-        x.right = T2
-        
-        self._update_height(x)
-        self._update_height(y)
-        
-        return y
+    @classmethod
+    def from_iterable(cls, keys):
+        """Build from any keys (sorted, duplicates dropped)"""
+        return cls.from_sorted(sorted(set(keys)))
     
-    def insert(self, key):
-        self.root = self._insert(self.root, key)
+    @classmethod
+    def from_tree(cls, tree):
+        """Freeze the keys of any tree in this module"""
+        return cls.from_sorted(tree.inorder())
     
-    def _insert(self, node, key):
-        if node is None:
-            return Node(key)
-        
-        if key < node.key:
-            node.left = self._insert(node.left, key)
-        elif key > node.key:
-            node.right = self._insert(node.right, key)
-        else:
-            return node  # Duplicates not allowed
-        
-        self._update_height(node)
-        
-        balance = self._get_balance(node)
-        
-        # LL Case
-        if balance > 1 and key < node.left.key:
-            return self._rotate_right(node)
-        
-        # RR Case
-        if balance < -1 and key > node.right.key:
-            return self._rotate_left(node)
-        
-        # LR Case
-        if balance > 1 and key > node.left.key:
-            node.left = self._rotate_left(node.left)
-            return self._rotate_right(node)
-        
-        # RL Case
-        if balance < -1 and key < node.right.key:
-            node.right = self._rotate_right(node.right)
-            return self._rotate_left(node)
-        
-        return node
-
-
-class RedBlackTree:
-    """Red-Black Tree Implementation"""
-    def __init__(self):
-        self.NIL = Node(0)
-        self.NIL.color = 0  # black
-        self.NIL.left = None
-        self.NIL.right = None
-        self.root = self.NIL
+    def __len__(self):
+        return self._size
     
-    def insert(self, key):
-        node = Node(key)
-        node.parent = None
-        node.key = key
-        node.left = self.NIL
-        node.right = self.NIL
-        node.color = 1  # new node is red
-        
-        y = None
-        x = self.root
-        
-        while x != self.NIL:
-            y = x
-            if node.key < x.key:
-                x = x.left
-            else:
-                x = x.right
-        
-        node.parent = y
-        if y is None:
-            self.root = node
-        elif node.key < y.key:
-            y.left = node
-        else:
-            y.right = node
-        
-        if node.parent is None:
-            node.color = 0
-            return
-        
-        if node.parent.parent is None:
-            return
-        
-        self._fix_insert(node)
+    def __iter__(self):
+        return self.iter_range()
     
-    def _fix_insert(self, k):
-        while k.parent and k.parent.color == 1:
-            if k.parent == k.parent.parent.right:
-                u = k.parent.parent.left  # uncle
-                if u.color == 1:
-                    u.color = 0
-                    k.parent.color = 0
-                    k.parent.parent.color = 1
-                    k = k.parent.parent
-                else:
-                    if k == k.parent.left:
-                        k = k.parent
-                        self._rotate_right(k)
-                    k.parent.color = 0
-                    k.parent.parent.color = 1
-                    self._rotate_left(k.parent.parent)
+    def __contains__(self, key):
+        return self.search(key)
+    
+    def search(self, key):
+        """Return True if key is in the tree"""
+        keys, n = self._keys, self._size
+        i = 1
+        while i <= n:
+            node_key = keys[i]
+            if key < node_key:
+                i += i
+            elif key > node_key:
+                i += i + 1
             else:
-                u = k.parent.parent.right  # uncle
-                if u.color == 1:
-                    u.color = 0
-                    k.parent.color = 0
-                    k.parent.parent.color = 1
-                    k = k.parent.parent
-                else:
-                    if k == k.parent.right:
-                        k = k.parent
-                        self._rotate_left(k)
-                    k.parent.color = 0
-                    k.parent.parent.color = 1
-                    self._rotate_right(k.parent.parent)
-            if k == self.root:
-                break
-        self.root.color = 0
+                return True
+        return False
     
-    def _rotate_left(self, x):
-        y = x.right
-        x.right = y.left
-        if y.left != self.NIL:
-            y.left.parent = x
-        
-        y.parent = x.parent
-        if x.parent is None:
-            self.root = y
-        elif x == x.parent.left:
-            x.parent.left = y
-        else:
-            x.parent.right = y
-        
-        y.left = x
-        x.parent = y
+    def _lower_bound_slot(self, key):
+        keys, n = self._keys, self._size
+        i = 1
+        while i <= n:
+            i = 2 * i + (keys[i] < key)
+        # Undo the trailing right turns and the final left turn
+        return i >> ((i + 1) & -(i + 1)).bit_length()
     
-    def _rotate_right(self, x):
-        y = x.left
-        x.left = y.right
-        if y.right != self.NIL:
-            y.right.parent = x
-        
-        y.parent = x.parent
-        if x.parent is None:
-            self.root = y
-        elif x == x.parent.right:
-            x.parent.right = y
+    def lower_bound(self, key):
+        """Smallest key >= key, or None"""
+        i = self._lower_bound_slot(key)
+        return self._keys[i] if i else None
+    
+    def _next_slot(self, i):
+        n = self._size
+        if 2 * i + 1 <= n:
+            i = 2 * i + 1
+            while 2 * i <= n:
+                i *= 2
+            return i
+        while i & 1:
+            i >>= 1
+        return i >> 1
+    
+    def iter_range(self, lo=None, hi=None):
+        """Yield keys with lo <= key <= hi in ascending order"""
+        keys = self._keys
+        if lo is not None:
+            i = self._lower_bound_slot(lo)
+        elif self._size:
+            i = 1
+            while 2 * i <= self._size:
+                i *= 2
         else:
-            x.parent.left = y
-        
-        y.right = x
-        x.parent = y
+            i = 0
+        while i:
+            key = keys[i]
+            if hi is not None and key > hi:
+                return
+            yield key
+            i = self._next_slot(i)
     
-    def search(self, key):
-        return self._search(self.root, key)
+    range = iter_range
     
-    def _search(self, node, key):
-        if node == self.NIL or node.key == key:
-            return node
-        if key < node.key:
-            return self._search(node.left, key)
-        return self._search(node.right, key)
+    def inorder(self):
+        """Keys in ascending order"""
+        return list(self.iter_range())
     
-    def get_height(self):
-        """Get height of Red-Black tree"""
-        return self._get_height(self.root)
+    def _lower_bound_slots(self, probe):
+        """Vectorized lower-bound slots (0 = past the end) for a NumPy batch"""
+        if self._array is None:
+            self._array = np.frombuffer(self._keys, dtype=self._keys.typecode)
+        layout, n = self._array, self._size
+        i = np.ones(len(probe), dtype=np.int64)
+        for _ in range(n.bit_length() - 1):
+            i = 2 * i + (layout[i] < probe)
+        # Only the deepest level can point past n; treat missing slots as
+        # right turns so they drop out with the trailing ones below
+        i = 2 * i + ((layout[np.minimum(i, n)] < probe) | (i > n))
+        low = (i + 1) & -(i + 1)
+        return i // (2 * low)
     
-    def _get_height(self, node):
-        if node == self.NIL:
-            return 0
-        return 1 + max(self._get_height(node.left), self._get_height(node.right))
+    def contains_many(self, keys):
+        """Boolean membership mask for a batch of keys (lockstep NumPy descent)"""
+        if np is None or not isinstance(self._keys, array) or not self._size:
+            return [self.search(key) for key in keys]
+        probe = np.asarray(keys)
+        slots = self._lower_bound_slots(probe)
+        return (slots > 0) & (self._array[slots] == probe)
     
-    def inorder(self):
-        """Inorder traversal of Red-Black tree"""
-        result = []
-        self._inorder(self.root, result)
-        return result
+    search_many = contains_many
     
-    def _inorder(self, node, result):
-        if node != self.NIL:
-            self._inorder(node.left, result)
-            result.append(node.key)
-            self._inorder(node.right, result)
+    def get_height(self):
+        """Height of the implicit tree"""
+        return self._size.bit_length()
+    
+    def to_arrays(self, keys=True):
+        """Level-order NumPy arrays (see ShapeMixin.to_arrays); the layout already is one"""
+        _require_numpy("to_arrays")
+        n = self._size
+        slots = np.arange(1, n + 1, dtype=np.int64)
+        left, right = 2 * slots - 1, 2 * slots
+        arrays = {
+            'left': np.where(left < n, left, -1),
+            'right': np.where(right < n, right, -1),
+            'parent': slots // 2 - 1,
+        }
+        if keys:
+            arrays['key'] = _key_array(self._keys[1:n + 1])
+        return arrays
+    
+    def validate(self):
+        """Check that an in-order walk of the layout is strictly increasing"""
+        keys = self.inorder()
+        _invariant(len(keys) == self._size, f"layout holds {len(keys)} keys, not {self._size}")
+        _invariant(all(map(lt, keys, islice(keys, 1, None))), "keys are out of order")
 
 
 # Export classes for use in other files
-__all__ = ['BST', 'AVLTree', 'RedBlackTree']
+__all__ = ['BST', 'AVLTree', 'RedBlackTree', 'SplayTree', 'Treap', 'BTree', 'BPlusTree',
+           'SkipList', 'PersistentTree', 'VersionedTree', 'ArrayBST', 'FrozenTree', 'NodePool',
+           'BSTNode', 'AVLNode', 'RBNode', 'TreapNode', 'PersistentNode', 'BTreeNode',
+           'BPlusNode', 'SkipListNode']
@@ -0,0 +1,85 @@
+"""Multithreaded stress tests for the locked and sharded tree wrappers"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.concurrency import ConcurrentTree, ShardedTree, run_stress
+from src.trees import AVLTree, RedBlackTree
+
+
+ROOT = Path(__file__).resolve().parent.parent
+SIZE = 2_000
+
+# run_stress on a RedBlackTree with no lock around it, in a child process
+# because a corrupted tree can send a thread round a cycle for ever
+UNLOCKED_STRESS = '''
+import sys
+from src.concurrency import run_stress
+from src.trees import RedBlackTree
+
+
+class Unlocked:
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.tree)
+
+    def search(self, key):
+        return self.tree.search(key)
+
+    def apply(self, updates):
+        for op, key in updates:
+            getattr(self.tree, op)(key)
+
+    def inorder(self):
+        return self.tree.inorder()
+
+    def validate(self):
+        self.tree.validate()
+
+
+run_stress(Unlocked(RedBlackTree.from_sorted(range(0, 20_000, 2))), threads=4,
+           ops_per_thread=20_000, read_percent=50, seed=int(sys.argv[1]))
+'''
+
+
+@pytest.mark.parametrize('tree_class', [AVLTree, RedBlackTree])
+@pytest.mark.parametrize('sharded', [False, True], ids=['locked', 'sharded'])
+@pytest.mark.parametrize('batch', [1, 16])
+def test_stress_keeps_tree_valid(tree_class, sharded, batch):
+    tree = tree_class.from_sorted(range(0, SIZE * 2, 2))
+    index = ShardedTree.from_tree(tree, 4) if sharded else ConcurrentTree(tree)
+    # run_stress validates the tree and its exact contents itself
+    _, count = run_stress(index, threads=4, ops_per_thread=5_000, read_percent=50,
+                          key_space=SIZE * 2, batch=batch)
+    assert len(index) == count
+
+
+def test_stress_catches_the_race_in_an_unlocked_tree():
+    """The stress that locked trees pass breaks a bare RedBlackTree"""
+    for seed in range(5):
+        try:
+            result = subprocess.run([sys.executable, '-c', UNLOCKED_STRESS, str(seed)], cwd=ROOT,
+                                    capture_output=True, timeout=60)
+        except subprocess.TimeoutExpired:
+            return  # a thread is looping in a corrupted tree
+        if result.returncode:
+            return  # a crash, a failed validate() or wrong contents
+    pytest.fail("five unlocked stress runs all passed; the race was not reproduced")
+
+
+def test_keyed_tree_routes_elements_by_their_key():
+    tree = RedBlackTree(key=lambda k: -k)
+    tree.insert_many(range(100))
+    index = ShardedTree.from_tree(tree, 4)
+    index.insert(151)
+    index.apply([('insert', 250), ('delete', 10)])
+    assert 151 in index and 250 in index and 10 not in index
+    assert index.get(-151) == 151
+    index.validate()
+    assert index.inorder() == sorted({-k for k in range(100)} - {-10} | {-151, -250})
+    assert index.range(-60, -50) == list(range(-60, -49))
@@ -0,0 +1,46 @@
+"""The instrumented trees must run, and shape trees, exactly as the plain ones do"""
+
+import random
+
+import pytest
+
+from src.instrument import InstrumentedTree
+from src.trees import AVLTree, RedBlackTree
+
+
+def _shape(tree, unwrap=lambda key: key):
+    """(key, height, color) of every node in preorder, which fixes the shape"""
+    nil = tree._nil
+    shape = []
+    stack = [tree.root]
+    while stack:
+        node = stack.pop()
+        if node is None or node is nil:
+            continue
+        shape.append((unwrap(node.key), node.height, getattr(node, 'color', None)))
+        stack += (node.right, node.left)
+    return shape
+
+
+@pytest.mark.parametrize('tree_class', [AVLTree, RedBlackTree])
+def test_instrumented_tree_matches_plain_tree(tree_class):
+    rng = random.Random(7)
+    keys = rng.sample(range(50_000), 5_000)
+    plain = tree_class()
+    counted = InstrumentedTree(tree_class)
+    for tree in (plain, counted):
+        for key in keys:
+            tree.insert(key)
+        for key in keys[::3]:
+            tree.delete(key)
+        for key in range(1_000):
+            tree.insert(key)
+    counted.validate()
+
+    assert _shape(counted.tree, unwrap=lambda key: key.key) == _shape(plain)
+
+    insert = counted.stats.summary()['insert']
+    assert insert['rotations'] > 0 and insert['fixup_loops'] > 0
+    if tree_class is RedBlackTree:
+        # Every fix-up pass recolors two or three nodes
+        assert 2 <= insert['recolors'] / insert['fixup_loops'] <= 3.5
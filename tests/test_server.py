@@ -0,0 +1,122 @@
+"""The index server on localhost: framing, pipelined replies and write coalescing"""
+
+import asyncio
+import random
+
+import pytest
+
+from src.server import (GET, INSERT, KEY, NOT_FOUND, OK, RANK, REQUEST, RESPONSE,
+                        IndexClient, IndexServer, ServerError, _split_frames, build_tree)
+from src.trees import AVLTree, RedBlackTree
+
+
+SIZE = 1_000  # the server starts with the even keys below 2 * SIZE
+
+
+def _serve(test, tree=None, **options):
+    """Run test(server) against a server on an ephemeral localhost port"""
+    async def run():
+        async with IndexServer(tree or build_tree('rb', SIZE), **options) as server:
+            return await test(server)
+    return asyncio.run(run())
+
+
+def test_split_frames_waits_for_whole_frames():
+    frames = [(request_id, GET, KEY.pack(request_id * 3)) for request_id in range(20)]
+    stream = b''.join(REQUEST.pack(len(payload), request_id, opcode) + payload
+                      for request_id, opcode, payload in frames)
+    for cut in range(len(stream) + 1):
+        first, used = _split_frames(bytearray(stream[:cut]))
+        rest, _ = _split_frames(bytearray(stream[used:]))
+        assert first + rest == frames
+
+
+@pytest.mark.parametrize('tree_class', [AVLTree, RedBlackTree])
+def test_pipelined_reads_and_writes(tree_class):
+    rng = random.Random(3)
+    expected = set(range(0, 2 * SIZE, 2))
+    operations = []
+    for _ in range(2_000):
+        key = rng.randrange(2 * SIZE)
+        operations.append((rng.choice(('contains', 'insert', 'delete', 'rank')), key))
+
+    async def test(server):
+        async with await IndexClient.connect(server.host, server.port) as client:
+            calls = [getattr(client, name)(key) for name, key in operations]
+            results = await asyncio.gather(*calls)
+            await client.insert_many(range(5_000, 5_100))
+            keys = await client.range(4_990, 5_010)
+        return results, keys
+
+    tree = tree_class.from_sorted(sorted(expected), order_stats=True)
+    results, keys = _serve(test, tree)
+    # Every reply must answer its own request, seeing all earlier writes
+    for (name, key), result in zip(operations, results):
+        if name == 'contains':
+            assert result == (key in expected)
+        elif name == 'rank':
+            assert result == sum(other < key for other in expected)
+        elif name == 'insert':
+            expected.add(key)
+        else:
+            expected.discard(key)
+    expected.update(range(5_000, 5_100))
+    assert keys == list(range(5_000, 5_011))
+    tree.validate()
+    assert tree.inorder() == sorted(expected)
+
+
+def test_replies_come_back_in_request_order():
+    async def test(server):
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        burst = bytearray()
+        for request_id in range(200):
+            # Insert a new key, get it back, then get a key that was never stored
+            opcode = INSERT if request_id % 3 == 0 else GET
+            key = 2 * SIZE + request_id - (request_id % 3 == 1)
+            burst += REQUEST.pack(KEY.size, request_id, opcode) + KEY.pack(key)
+        writer.write(burst)
+        replies = []
+        for _ in range(200):
+            length, request_id, status = RESPONSE.unpack(await reader.readexactly(RESPONSE.size))
+            await reader.readexactly(length)
+            replies.append((request_id, status))
+        writer.close()
+        await writer.wait_closed()
+        return replies
+
+    replies = _serve(test)
+    assert [request_id for request_id, _ in replies] == list(range(200))
+    # A get sees the insert just before it in the same burst
+    for request_id, status in replies:
+        assert status == (NOT_FOUND if request_id % 3 == 2 else OK)
+
+
+@pytest.mark.parametrize('max_batch', [8, 4096])
+def test_writes_coalesce_up_to_max_batch(max_batch):
+    async def test(server):
+        async with await IndexClient.connect(server.host, server.port) as client:
+            await asyncio.gather(*(client.insert(key) for key in range(2 * SIZE, 2 * SIZE + 100)))
+        return server.batches, server.batched_writes, len(server.tree)
+
+    batches, writes, size = _serve(test, max_batch=max_batch)
+    assert writes == 100
+    assert size == SIZE + 100
+    if max_batch == 8:
+        assert batches >= 100 // 8
+    else:
+        assert batches < 100 // 8
+
+
+def test_errors_reach_the_caller():
+    async def test(server):
+        async with await IndexClient.connect(server.host, server.port) as client:
+            with pytest.raises(ServerError):
+                await client.rank(10)
+            with pytest.raises(ServerError):
+                await client.insert(1, b'value')
+            with pytest.raises(ServerError):
+                await client._request(RANK + 100)
+            return await client.contains(10)
+
+    assert _serve(test, RedBlackTree.from_sorted(range(0, 2 * SIZE, 2))) is True
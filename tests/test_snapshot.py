@@ -0,0 +1,46 @@
+"""Mapped snapshots must close cleanly whatever is still iterating over them"""
+
+import pytest
+
+from src.snapshot import MappedTree, write_snapshot
+from src.trees import AVLTree, BST, RedBlackTree, SplayTree, Treap
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = tmp_path / 'tree.snap'
+    keys = list(range(0, 30_000, 3))
+    write_snapshot(path, keys, [key * 2 for key in keys])
+    return path, keys
+
+
+def test_iterators_read_the_mapped_keys(snapshot):
+    path, keys = snapshot
+    with MappedTree(path) as tree:
+        assert list(tree) == keys
+        assert list(tree.iter_range(10, 9_000)) == [key for key in keys if 10 <= key <= 9_000]
+        assert list(tree.items(0, 9)) == [(0, 0), (3, 6), (6, 12), (9, 18)]
+
+
+def test_close_with_open_iterators(snapshot):
+    path, keys = snapshot
+    tree = MappedTree(path)
+    tree[3]
+    iterators = [iter(tree), tree.iter_range(100, 20_000), tree.items()]
+    for iterator in iterators:
+        next(iterator)
+    tree.close()
+    assert tree._mmap.closed
+    for iterator in iterators:
+        with pytest.raises(ValueError):
+            list(iterator)
+
+
+@pytest.mark.parametrize('tree_class', [BST, AVLTree, RedBlackTree, SplayTree, Treap])
+def test_every_tree_loads_with_order_stats(snapshot, tree_class):
+    path, keys = snapshot
+    tree = tree_class.load(path, order_stats=True)
+    tree.validate()
+    assert tree.inorder() == keys
+    assert tree.select(10) == keys[10]
+    assert tree.rank(keys[-1]) == len(keys) - 1